@@ -1,7 +1,11 @@
 from __future__ import annotations, print_function
 
+import json
 import os
+import numpy as np
+import pandas as pd
 from flee.SimulationSettings import SimulationSettings
+from flee.agentattributes import AttributeRecord
 
 if os.getenv("FLEE_TYPE_CHECK") is not None and os.environ["FLEE_TYPE_CHECK"].lower() == "true":
     from beartype import beartype as check_args_type
@@ -10,6 +14,97 @@ else:
         return func
 
 
+class DiagnosticsWriter:
+    """
+    The DiagnosticsWriter class.
+    Keeps an output file open during the simulation, collects the rows
+    written in a time step, and writes them to the file in one go.
+    """
+
+    @check_args_type
+    def __init__(self, filename: str, buffer_size: int = 1048576):
+        """
+        Summary:
+            Initializes a writer. The file is opened when the first rows are written.
+
+        Args:
+            filename (str): name of the output file
+            buffer_size (int, optional): size of the file buffer in bytes
+
+        Returns:
+            None.
+        """
+        self.filename = filename
+        self.buffer_size = buffer_size
+        self.file = None
+        self.rows = []
+
+
+    @check_args_type
+    def open(self, time: int, header: str) -> None:
+        """
+        Summary:
+            Opens the output file. On the first time step a new file is
+            created and the header is written, otherwise rows are appended.
+
+        Args:
+            time (int): current time step
+            header (str): header line of the file
+
+        Returns:
+            None.
+        """
+        if time == 0:
+            self.file = open(self.filename, "w", encoding="utf-8", buffering=self.buffer_size)
+            self.rows.append(header)
+        else:
+            self.file = open(self.filename, "a", encoding="utf-8", buffering=self.buffer_size)
+
+
+    def write(self, row: str) -> None:
+        self.rows.append(row)
+
+
+    @check_args_type
+    def flush(self) -> None:
+        """
+        Summary:
+            Writes the collected rows to the file.
+
+        Args:
+            None.
+
+        Returns:
+            None.
+        """
+        if self.file is None:
+            return
+        if len(self.rows) > 0:
+            self.file.write("\n".join(self.rows))
+            self.file.write("\n")
+            self.rows = []
+        self.file.flush()
+
+
+    @check_args_type
+    def close(self) -> None:
+        """
+        Summary:
+            Writes the remaining rows and closes the file.
+
+        Args:
+            None.
+
+        Returns:
+            None.
+        """
+        if self.file is None:
+            return
+        self.flush()
+        self.file.close()
+        self.file = None
+
+
 def print_attribute_keys(a):
     """
     Summary:
@@ -21,11 +116,7 @@ def print_attribute_keys(a):
     Returns:
         str: A string containing the attribute keys.
     """
-    out = ""
-    for k in a.attributes.keys():
-        out += str(k)
-        out += ","
-    return out
+    return "".join([str(k) + "," for k in a.attributes.keys()])
 
 
 def print_attribute_values(a):
@@ -39,16 +130,31 @@ def print_attribute_values(a):
     Returns:
         str: A string containing the attribute values.
     """
-    out = ""
-    for k in a.attributes.values():
-        out += str(k)
-        out += ","
-    return out
+    if isinstance(a.attributes, AttributeRecord):
+        return a.attributes.csv_values
+    return "".join([str(v) + "," for v in a.attributes.values()])
+
+
+def get_region(location) -> str:
+    """
+    Summary:
+        Returns the region of a location. Agents on a link are
+        assigned the region of the endpoint of the link.
+
+    Args:
+        location (Union[Location, Link]): location or link of an agent
+
+    Returns:
+        str: name of the region
+    """
+    if hasattr(location, "endpoint"):
+        return location.endpoint.region
+    return location.region
 
 
 @check_args_type
 def write_agents_par(
-    rank: int, agents, time: int, max_written: int = -1, timestep_interval: int = 1
+    rank: int, agents, time: int, max_written: int = -1, timestep_interval: int = 1, writer=None
 ) -> None:
     """
     Summary:   
@@ -62,32 +168,30 @@ def write_agents_par(
         time (int): current time step
         max_written (int, optional): maximum number of agents to write
         timestep_interval (int, optional): interval between writing files
+        writer (DiagnosticsWriter, optional): writer that keeps the file open between time steps.
+            If not given, the file is opened and closed in this call.
 
     Returns:
         None.
     """
-    my_file = None
-    if time == 0:
-        my_file = open("agents.out.%s" % rank, "w", encoding="utf-8")
-
-        if agents:
-            print(
-                "#time,rank-agentid,original_location,current_location,gps_x,gps_y,is_travelling,distance_travelled,"
-                "places_travelled,distance_moved_this_timestep,{}".format(print_attribute_keys(agents[0])),
-                file=my_file,
-            )
-        else:  # Handle the case where agents list is empty
-            print(
-                "#time,rank-agentid,original_location,current_location,gps_x,gps_y,is_travelling,distance_travelled,"
-                "places_travelled,distance_moved_this_timestep",
-                file=my_file,
-            )
-    else:
-        my_file = open("agents.out.%s" % rank, "a", encoding="utf-8")
+    close_after = writer is None
+    if writer is None:
+        writer = DiagnosticsWriter("agents.out.%s" % rank)
+
+    if writer.file is None:
+        header = (
+            "#time,rank-agentid,original_location,current_location,gps_x,gps_y,is_travelling,distance_travelled,"
+            "places_travelled,distance_moved_this_timestep"
+        )
+        if agents:  # Attribute keys are taken from the first agent, if there is one.
+            header += ",{}".format(print_attribute_keys(agents[0]))
+        writer.open(time, header)
 
     if max_written < 0:
         max_written = len(agents)
 
+    region_granularity = SimulationSettings.log_levels["granularity"] == "region"
+
     if time % timestep_interval == 0:
         for k in range(0, max_written):
             a = agents[k]
@@ -99,91 +203,48 @@ def write_agents_par(
             x = a.location.x
             y = a.location.y
 
-            if SimulationSettings.log_levels["granularity"] == "region":
-                loc_name = location.region
+            if region_granularity:
+                loc_name = get_region(a.location)
                 x = 0.0
                 y = 0.0
 
-            print(
-                    "{},{}-{},{},{},{},{},{},{},{},{},{}".format(
-                    time,
-                    rank,
-                    k,
-                    a.home_location.name,
-                    loc_name,
-                    x,
-                    y,
-                    a.travelling,
-                    a.distance_travelled,
-                    a.places_travelled,
-                    a.distance_moved_this_timestep,
-                    print_attribute_values(a),
-                    ),
-                file=my_file,
+            # Fields that are the same on every line of this agent.
+            agent_fields = "{},{},{},{},{}".format(
+                a.travelling,
+                a.distance_travelled,
+                a.places_travelled,
+                a.distance_moved_this_timestep,
+                print_attribute_values(a),
             )
+            home_name = a.home_location.name
+
+            writer.write("{},{}-{},{},{},{},{},{}".format(time, rank, k, home_name, loc_name, x, y, agent_fields))
 
             if SimulationSettings.log_levels["agent"] > 1:
-                if SimulationSettings.log_levels["agent"] > 2:
-                    hop_number = 1 # hop counter starts at 1 to indicate second hop in time step.
-                    for l in a.locations_visited:
-                        loc_name = l.name
-                        x = l.x
-                        y = l.y
-                        if SimulationSettings.log_levels["granularity"] == "region":
-                            loc_name = l.region
-                            x = 0.0
-                            y = 0.0
-
-                        print(
-                            "{}-{},{}-{},{},{},{},{},{},{},{},{},{}".format(
-                                time,
-                                hop_number,
-                                rank,
-                                k,
-                                a.home_location.name,
-                                loc_name,
-                                x,
-                                y,
-                                a.travelling,
-                                a.distance_travelled,
-                                a.places_travelled,
-                                a.distance_moved_this_timestep,
-                                print_attribute_values(a),
-                            ),
-                            file=my_file,
-                        )
+                hop_number = 1 # hop counter starts at 1 to indicate second hop in time step.
+                for l in a.locations_visited:
+                    loc_name = l.name
+                    x = l.x
+                    y = l.y
+                    if region_granularity:
+                        loc_name = l.region
+                        x = 0.0
+                        y = 0.0
+
+                    if SimulationSettings.log_levels["agent"] > 2:
+                        writer.write("{}-{},{}-{},{},{},{},{},{}".format(time, hop_number, rank, k, home_name, loc_name, x, y, agent_fields))
                         hop_number += 1
-                else:
-                    for l in a.locations_visited:
-                        loc_name = l.name
-                        x = l.x
-                        y = l.y
-                        if SimulationSettings.log_levels["granularity"] == "region":
-                            loc_name = l.region
-                            x = 0.0
-                            y = 0.0
-
-                        print(
-                            "{},{}-{},{},{},{},{},{},{},{},{},{}".format(
-                                time,
-                                rank,
-                                k,
-                                a.home_location.name,
-                                loc_name,
-                                x,
-                                y,
-                                a.travelling,
-                                a.distance_travelled,
-                                a.places_travelled,
-                                a.distance_moved_this_timestep,
-                                print_attribute_values(a),
-                            ),
-                            file=my_file,
-                        )
+                    else:
+                        writer.write("{},{}-{},{},{},{},{},{}".format(time, rank, k, home_name, loc_name, x, y, agent_fields))
+
+    if close_after:
+        writer.close()
+    else:
+        writer.flush()
 
 
 @check_args_type
-def write_agents(agents, time: int, max_written: int = -1, timestep_interval: int = 1) -> None:
+def write_agents(agents, time: int, max_written: int = -1, timestep_interval: int = 1, writer=None) -> None:
     """
     Summary:
         Write agent data to file. 
@@ -195,16 +256,292 @@ def write_agents(agents, time: int, max_written: int = -1, timestep_interval: in
         time (int): current time step
         max_written (int, optional): maximum number of agents to write
         timestep_interval (int, optional): interval between writing files
+        writer (DiagnosticsWriter, optional): writer that keeps the file open between time steps.
 
     Returns:
         None.
     """
-    write_agents_par(rank=0, agents=agents, time=time, max_written=-1, timestep_interval=1)
+    write_agents_par(rank=0, agents=agents, time=time, max_written=-1, timestep_interval=1, writer=writer)
+
+
+class AgentColumnWriter:
+    """
+    The AgentColumnWriter class.
+    Writes the state of the agents at every time step as typed binary columns,
+    one raw NumPy file per column, in a directory with a JSON schema. The schema
+    holds the dtypes, the dictionaries of location names and attribute values
+    that the integer columns refer to, and the number of rows of each time step.
+    """
+
+    # column name and dtype of the columns that are always written.
+    columns = [
+        ("time", "int32"),
+        ("agent", "int64"),  # index of the agent on its rank.
+        ("original_location", "int32"),  # index in location_names.
+        ("current_location", "int32"),  # index in location_names.
+        ("gps_x", "float64"),
+        ("gps_y", "float64"),
+        ("is_travelling", "bool"),
+        ("distance_travelled", "float64"),
+        ("places_travelled", "int32"),
+        ("distance_moved_this_timestep", "float64"),
+    ]
+
+    @check_args_type
+    def __init__(self, directory: str, rank: int = 0, buffer_size: int = 1048576):
+        """
+        Summary:
+            Initializes a writer. The files are opened when the first time step is written.
+
+        Args:
+            directory (str): name of the output directory
+            rank (int, optional): rank of the MPI process
+            buffer_size (int, optional): size of the file buffers in bytes
+
+        Returns:
+            None.
+        """
+        self.directory = directory
+        self.rank = rank
+        self.buffer_size = buffer_size
+        self.files = {}
+        self.location_names = []
+        self.location_codes = {}
+        self.attributes = {}  # attribute name -> list of values (as strings).
+        self.attribute_codes = {}  # attribute name -> {value: index}.
+        self.timesteps = []  # [time, number of rows] for every time step written.
+
+
+    def _open_file(self, name: str, mode: str):
+        return open(os.path.join(self.directory, name + ".bin"), mode, buffering=self.buffer_size)
+
+
+    @check_args_type
+    def open(self, time: int) -> None:
+        """
+        Summary:
+            Opens the column files. On the first time step new files are created,
+            otherwise rows are appended and the dictionaries are read from the schema.
+
+        Args:
+            time (int): current time step
+
+        Returns:
+            None.
+        """
+        os.makedirs(self.directory, exist_ok=True)
+        mode = "wb"
+        schema_name = os.path.join(self.directory, "schema.json")
+        if time != 0 and os.path.exists(schema_name):
+            mode = "ab"
+            with open(schema_name, encoding="utf-8") as f:
+                schema = json.load(f)
+            self.location_names = schema["location_names"]
+            self.location_codes = {name: i for i, name in enumerate(self.location_names)}
+            self.attributes = schema["attributes"]
+            self.attribute_codes = {a: {v: i for i, v in enumerate(values)} for a, values in self.attributes.items()}
+            self.timesteps = schema["timesteps"]
+
+        for name, dtype in self.columns:
+            self.files[name] = self._open_file(name, mode)
+        for a in self.attributes:
+            self.files["attribute_" + a] = self._open_file("attribute_" + a, mode)
+
+
+    def _location_code(self, name: str) -> int:
+        code = self.location_codes.get(name, None)
+        if code is None:
+            code = len(self.location_names)
+            self.location_codes[name] = code
+            self.location_names.append(name)
+        return code
+
+
+    def _attribute_code(self, attribute: str, value) -> int:
+        if attribute not in self.attributes:
+            # Rows written before the attribute first appeared get code -1.
+            self.attributes[attribute] = []
+            self.attribute_codes[attribute] = {}
+            self.files["attribute_" + attribute] = self._open_file("attribute_" + attribute, "wb")
+            np.full(sum([rows for _, rows in self.timesteps]), -1, dtype=np.int32).tofile(self.files["attribute_" + attribute])
+
+        value = str(value)
+        code = self.attribute_codes[attribute].get(value, None)
+        if code is None:
+            code = len(self.attributes[attribute])
+            self.attribute_codes[attribute][value] = code
+            self.attributes[attribute].append(value)
+        return code
+
+
+    @check_args_type
+    def write_step(self, agents, time: int) -> None:
+        """
+        Summary:
+            Writes the state of all agents that are in the simulation at this time step.
+
+        Args:
+            agents (List[Person]): agents to write
+            time (int): current time step
+
+        Returns:
+            None.
+        """
+        if len(self.files) == 0:
+            self.open(time)
+
+        region_granularity = SimulationSettings.log_levels["granularity"] == "region"
+
+        rows = {name: [] for name, dtype in self.columns}
+        attribute_rows = {}
+        num_rows = 0
+
+        for k, a in enumerate(agents):
+            if a.location is None: #Do not write agent logs for agents that are removed from the simulation.
+                continue
+
+            loc_name = a.location.name
+            home_name = a.home_location.name
+            x = a.location.x
+            y = a.location.y
+            if region_granularity:
+                loc_name = get_region(a.location)
+                x = 0.0
+                y = 0.0
+
+            rows["agent"].append(k)
+            rows["original_location"].append(self._location_code(home_name))
+            rows["current_location"].append(self._location_code(loc_name))
+            rows["gps_x"].append(x)
+            rows["gps_y"].append(y)
+            rows["is_travelling"].append(a.travelling)
+            rows["distance_travelled"].append(a.distance_travelled)
+            rows["places_travelled"].append(a.places_travelled)
+            rows["distance_moved_this_timestep"].append(a.distance_moved_this_timestep)
+
+            for attribute, value in a.attributes.items():
+                code = self._attribute_code(attribute, value)
+                attribute_rows.setdefault(attribute, np.full(len(agents), -1, dtype=np.int32))[num_rows] = code
+            num_rows += 1
+
+        rows["time"] = np.full(num_rows, time)
+        for name, dtype in self.columns:
+            np.asarray(rows[name], dtype=dtype).tofile(self.files[name])
+        for attribute in self.attributes:
+            codes = attribute_rows.get(attribute, np.full(num_rows, -1, dtype=np.int32))
+            codes[:num_rows].tofile(self.files["attribute_" + attribute])
+
+        self.timesteps.append([time, num_rows])
+        self.flush()
+
+
+    @check_args_type
+    def flush(self) -> None:
+        """
+        Summary:
+            Flushes the column files and rewrites the schema.
+
+        Args:
+            None.
+
+        Returns:
+            None.
+        """
+        for f in self.files.values():
+            f.flush()
+
+        schema = {
+            "format_version": 1,
+            "rank": self.rank,
+            "columns": dict(self.columns),
+            "location_names": self.location_names,
+            "attributes": self.attributes,
+            "timesteps": self.timesteps,
+        }
+        with open(os.path.join(self.directory, "schema.json"), "w", encoding="utf-8") as f:
+            json.dump(schema, f)
+
+
+    @check_args_type
+    def close(self) -> None:
+        """
+        Summary:
+            Closes the column files.
+
+        Args:
+            None.
+
+        Returns:
+            None.
+        """
+        if len(self.files) == 0:
+            return
+        self.flush()
+        for f in self.files.values():
+            f.close()
+        self.files = {}
+
+
+def read_agent_columns(directory: str):
+    """
+    Summary:
+        Reads the columnar agent output of one rank, without copying the data.
+
+    Args:
+        directory (str): output directory written by AgentColumnWriter
+
+    Returns:
+        Tuple[dict, dict]: the schema, and a dictionary of column name to memory-mapped array.
+            Attribute columns are named "attribute_<name>".
+    """
+    with open(os.path.join(directory, "schema.json"), encoding="utf-8") as f:
+        schema = json.load(f)
+
+    dtypes = dict(schema["columns"])
+    for a in schema["attributes"]:
+        dtypes["attribute_" + a] = "int32"
+
+    num_rows = sum([rows for _, rows in schema["timesteps"]])
+    data = {}
+    for name, dtype in dtypes.items():
+        if num_rows == 0:
+            data[name] = np.zeros(0, dtype=dtype)
+        else:
+            data[name] = np.memmap(os.path.join(directory, name + ".bin"), dtype=dtype, mode="r", shape=(num_rows,))
+    return schema, data
+
+
+def read_agents_columnar(directory: str):
+    """
+    Summary:
+        Reads the columnar agent output of one rank into a DataFrame
+        with the same columns as agents.out.<rank>.
+
+    Args:
+        directory (str): output directory written by AgentColumnWriter
+
+    Returns:
+        pandas.DataFrame: one row per agent per time step.
+    """
+    schema, data = read_agent_columns(directory)
+    location_names = np.array(schema["location_names"], dtype=object)
+
+    df = pd.DataFrame({
+        "#time": np.asarray(data["time"]),
+        "rank-agentid": str(schema["rank"]) + "-" + pd.Series(np.asarray(data["agent"])).astype(str),
+        "original_location": location_names[np.asarray(data["original_location"])],
+        "current_location": location_names[np.asarray(data["current_location"])],
+    })
+    for name in ["gps_x", "gps_y", "is_travelling", "distance_travelled", "places_travelled", "distance_moved_this_timestep"]:
+        df[name] = np.asarray(data[name])
+    for a, values in schema["attributes"].items():
+        df[a] = pd.Categorical.from_codes(np.asarray(data["attribute_" + a]), categories=values)
+    return df
 
 
 @check_args_type
 def write_links_par(
-    rank: int, locations, time: int, timestep_interval: int = 1
+    rank: int, locations, time: int, timestep_interval: int = 1, writer=None
 ) -> None:
     """
     Summary:
@@ -212,101 +549,70 @@ def write_links_par(
 
     Args:
         rank (int): rank of the MPI process
-        agents (List[Person]): agents to write
+        locations (List[Location]): locations whose links are written
         time (int): current time step
-        max_written (int, optional): maximum number of agents to write
         timestep_interval (int, optional): interval between writing files
+        writer (DiagnosticsWriter, optional): writer that keeps the file open between time steps.
+            If not given, the file is opened and closed in this call.
 
     Returns:
         None.
     """
+    close_after = writer is None
+    if writer is None:
+        writer = DiagnosticsWriter("links.out.%s" % rank)
 
-    my_file = None
-    if time == 0:
-        my_file = open("links.out.%s" % rank, "w", encoding="utf-8")
-        print(
-            "#time,start_location,end_location,cum_num_agents,attribute",
-            file=my_file,
-        )
-    else:
-        my_file = open("links.out.%s" % rank, "a", encoding="utf-8")
-
-
-
-    if SimulationSettings.log_levels["granularity"] == "region":
-        if time % timestep_interval == 0:
-            for i in range(0, len(locations)):
-                for l in locations[i].links:
-                    print(
-                        "{},{},{},{},total".format(
-                        time,
-                        l.startpoint.region,
-                        l.endpoint.region,
-                        l.cumNumAgents,
-                        ),
-                    file=my_file,
-                    )
-
-                    if SimulationSettings.log_levels["link"] > 1:
-                        for a in l.cumNumAgentsByAttribute:
-                            for v in l.cumNumAgentsByAttribute[a]:
-                                print(
-                                    "{},{},{},{},{}:{}".format(
-                                    time,
-                                    l.startpoint.region,
-                                    l.endpoint.region,
-                                    l.cumNumAgentsByAttribute[a][v],
-                                    a,
-                                    v,
-                                    ),
-                                file=my_file,
-                                )
+    if writer.file is None:
+        writer.open(time, "#time,start_location,end_location,cum_num_agents,attribute")
 
+    region_granularity = SimulationSettings.log_levels["granularity"] == "region"
 
-    else:
-        if time % timestep_interval == 0:
-            for i in range(0, len(locations)):
-                for l in locations[i].links:
-                    print(
-                        "{},{},{},{},total".format(
-                        time,
-                        l.startpoint.name,
-                        l.endpoint.name,
-                        l.cumNumAgents,
-                        ),
-                    file=my_file,
-                    )
-
-                    if SimulationSettings.log_levels["link"] > 1:
-                        for a in l.cumNumAgentsByAttribute:
-                            for v in l.cumNumAgentsByAttribute[a]:
-                                print(
-                                    "{},{},{},{},{}:{}".format(
-                                    time,
-                                    l.startpoint.name,
-                                    l.endpoint.name,
-                                    l.cumNumAgentsByAttribute[a][v],
-                                    a,
-                                    v,
-                                    ),
-                                file=my_file,
+    if time % timestep_interval == 0:
+        for i in range(0, len(locations)):
+            for l in locations[i].links:
+                if region_granularity:
+                    start_name = l.startpoint.region
+                    end_name = l.endpoint.region
+                else:
+                    start_name = l.startpoint.name
+                    end_name = l.endpoint.name
+
+                writer.write("{},{},{},{},total".format(time, start_name, end_name, l.cumNumAgents))
+
+                if SimulationSettings.log_levels["link"] > 1:
+                    cumNumAgentsByAttribute = l.getCumNumAgentsByAttribute()
+                    for a in cumNumAgentsByAttribute:
+                        for v in cumNumAgentsByAttribute[a]:
+                            writer.write(
+                                "{},{},{},{},{}:{}".format(
+                                time,
+                                start_name,
+                                end_name,
+                                cumNumAgentsByAttribute[a][v],
+                                a,
+                                v,
                                 )
+                            )
+
+    if close_after:
+        writer.close()
+    else:
+        writer.flush()
 
 
 @check_args_type
-def write_links(locations, time: int, timestep_interval: int = 1) -> None:
+def write_links(locations, time: int, timestep_interval: int = 1, writer=None) -> None:
     """
     Summary:
         Write link data to file.
 
     Args:
-        agents (List[Person]): agents to write
+        locations (List[Location]): locations whose links are written
         time (int): current time step
-        max_written (int, optional): maximum number of agents to write
         timestep_interval (int, optional): interval between writing files
+        writer (DiagnosticsWriter, optional): writer that keeps the file open between time steps.
 
     Returns:
         None.
     """
-    write_links_par(rank=0, locations=locations, time=time, timestep_interval=1)
-
+    write_links_par(rank=0, locations=locations, time=time, timestep_interval=1, writer=writer)
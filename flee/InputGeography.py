@@ -1,8 +1,12 @@
 import csv
+import hashlib
 import os
 import sys
-from typing import List
+from typing import List, Optional
 
+import numpy as np
+
+from flee import moving, spawning
 from flee.SimulationSettings import SimulationSettings
 
 if os.getenv("FLEE_TYPE_CHECK") is not None and os.environ["FLEE_TYPE_CHECK"].lower() == "true":
@@ -17,6 +21,88 @@ else:
         return func
 
 
+# Version of the geography cache files, to be increased whenever their contents change.
+GEOGRAPHY_CACHE_VERSION = 1
+
+
+def _pack_rows(rows: list) -> dict:
+    """
+    Summary:
+        Converts rows of strings into arrays for the geography cache:
+        a table of the distinct strings, and the index in that table of every cell.
+
+    Args:
+        rows (list): rows of strings, which may differ in length
+
+    Returns:
+        dict: arrays "strings", "lengths" and "cells".
+    """
+    table = {}
+    cells = [table.setdefault(value, len(table)) for row in rows for value in row]
+    return {
+        "strings": np.array(list(table.keys()), dtype=str),
+        "lengths": np.array([len(row) for row in rows], dtype=np.int64),
+        "cells": np.array(cells, dtype=np.int64),
+    }
+
+
+def _unpack_rows(data: dict, prefix: str = "") -> list:
+    """
+    Summary:
+        Converts the arrays written by _pack_rows back into rows of strings.
+
+    Args:
+        data (dict): arrays read from the geography cache
+        prefix (str, optional): prefix of the array names
+
+    Returns:
+        list: rows of strings
+    """
+    strings = data[prefix + "strings"].tolist()
+    values = [strings[i] for i in data[prefix + "cells"].tolist()]
+    ends = np.cumsum(data[prefix + "lengths"]).tolist()
+    return [values[end - length : end] for end, length in zip(ends, data[prefix + "lengths"].tolist())]
+
+
+def _pack_series(series: dict) -> dict:
+    """
+    Summary:
+        Converts time series per location (e.g. conflict intensities or flood levels)
+        into arrays for the geography cache.
+
+    Args:
+        series (dict): location name -> list of values
+
+    Returns:
+        dict: arrays "names", "lengths" and "values".
+    """
+    values = [v for name in series for v in series[name]]
+    return {
+        "names": np.array(list(series.keys()), dtype=str),
+        "lengths": np.array([len(series[name]) for name in series], dtype=np.int64),
+        "values": np.array(values),
+    }
+
+
+def _unpack_series(data: dict) -> dict:
+    """
+    Summary:
+        Converts the arrays written by _pack_series back into time series per location.
+
+    Args:
+        data (dict): arrays read from the geography cache
+
+    Returns:
+        dict: location name -> list of values
+    """
+    values = data["values"].tolist()
+    ends = np.cumsum(data["lengths"]).tolist()
+    return {
+        name: values[end - length : end]
+        for name, end, length in zip(data["names"].tolist(), ends, data["lengths"].tolist())
+    }
+
+
 class InputGeography:
     """
     Class which reads in Geographic information.
@@ -28,6 +114,82 @@ class InputGeography:
         self.major_routes = []
         self.conflicts = {}
         self.attributes = {}
+        self.forecast_flood_sums = {}
+        # Location changes and conflict transitions by day (EventSchedules optimisation only).
+        self.location_change_schedule = None
+        self.location_change_schedule_source = (None, 0)
+        self.conflict_schedule = None
+        self.conflict_schedule_source = None
+        self.conflict_schedule_days = 0
+        # Attribute values of all locations for all days (IncrementalAttributes optimisation only).
+        self.attribute_tables = {}
+
+
+    @check_args_type
+    def _GetCacheName(self, csv_name: str, kind: str) -> Optional[str]:
+        """
+        Summary:
+            Returns the name of the geography cache file of an input file,
+            which depends on the contents of the input file.
+
+        Args:
+            csv_name (str): csv file name
+            kind (str): how the file is parsed
+
+        Returns:
+            Optional[str]: name of the cache file, or None if there is no cache or no input file.
+        """
+        cache_dir = SimulationSettings.optimisations["GeographyCache"]
+        if cache_dir is None or len(cache_dir) == 0 or not os.path.isfile(csv_name):
+            return None
+
+        digest = hashlib.sha1("{}:{}:".format(GEOGRAPHY_CACHE_VERSION, kind).encode("utf-8"))
+        with open(csv_name, "rb") as f:
+            digest.update(f.read())
+        return os.path.join(cache_dir, "{}_{}.npz".format(kind, digest.hexdigest()))
+
+
+    @check_args_type
+    def _ReadCache(self, cache_name: Optional[str]) -> Optional[dict]:
+        """
+        Summary:
+            Reads the arrays of a geography cache file.
+
+        Args:
+            cache_name (Optional[str]): name of the cache file
+
+        Returns:
+            Optional[dict]: arrays in the cache file, or None if the file does not exist.
+        """
+        if cache_name is None or not os.path.isfile(cache_name):
+            return None
+
+        with np.load(cache_name, allow_pickle=False) as data:
+            return {name: data[name] for name in data.files}
+
+
+    @check_args_type
+    def _WriteCache(self, cache_name: Optional[str], arrays: dict) -> None:
+        """
+        Summary:
+            Writes arrays to a geography cache file. The file is renamed into place,
+            so that simulations which run at the same time never read a partial file.
+
+        Args:
+            cache_name (Optional[str]): name of the cache file
+            arrays (dict): arrays to write
+
+        Returns:
+            None.
+        """
+        if cache_name is None:
+            return
+
+        os.makedirs(os.path.dirname(cache_name), exist_ok=True)
+        tmp_name = "{}.{}.tmp".format(cache_name, os.getpid())
+        with open(tmp_name, "wb") as f:
+            np.savez(f, **arrays)
+        os.replace(tmp_name, cache_name)
 
 
     @check_args_type
@@ -41,6 +203,12 @@ class InputGeography:
         Returns:
             None.
         """
+        cache_name = self._GetCacheName(csv_name, "series_float")
+        cached = self._ReadCache(cache_name)
+        if cached is not None:
+            self.conflicts = _unpack_series(cached)
+            return
+
         self.conflicts = {}
 
         row_count = 0
@@ -63,6 +231,8 @@ class InputGeography:
                         self.conflicts[headers[i]].append(float(row[i].strip()))
                 row_count += 1
 
+        self._WriteCache(cache_name, _pack_series(self.conflicts))
+
         # print(self.conflicts)
         # TODO: make test verifying this in test_csv.py
 
@@ -81,6 +251,14 @@ class InputGeography:
         Returns:
             None.
         """
+        cache_name = self._GetCacheName(csv_name, "series_" + attribute_type)
+        cached = self._ReadCache(cache_name)
+        if cached is not None:
+            self.attributes[attribute_name] = _unpack_series(cached)
+            if attribute_name == "forecast_flood_levels" and SimulationSettings.optimisations["FloodForecastTable"] is True:
+                self.ReadForecastFloodSums()
+            return
+
         self.attributes[attribute_name] = {}
 
         row_count = 0
@@ -106,8 +284,45 @@ class InputGeography:
                             self.attributes[attribute_name][headers[i]].append(float(row[i].strip()))
                 row_count += 1
 
+        self._WriteCache(cache_name, _pack_series(self.attributes[attribute_name]))
+
         #print(self.attributes, file=sys.stderr)
 
+        if attribute_name == "forecast_flood_levels" and SimulationSettings.optimisations["FloodForecastTable"] is True:
+            self.ReadForecastFloodSums()
+
+
+    @check_args_type
+    def ReadForecastFloodSums(self) -> None:
+        """
+        Summary:
+            Precomputes the weighted flood forecast of each flood zone for every day,
+            so that agents look it up instead of summing over the forecast timescale.
+
+        Args:
+            None.
+
+        Returns:
+            None.
+        """
+        attrlist = self.attributes["forecast_flood_levels"]
+        self.forecast_flood_sums = {}
+
+        if len(attrlist) == 0:
+            return
+
+        names = list(attrlist.keys())
+        forecast_flood_sums = moving.buildForecastFloodTable(np.array([attrlist[name] for name in names]))
+        if forecast_flood_sums is None:
+            print(
+                "Warning: flood forecast settings do not match flood_level.csv, the forecast will not be precomputed.",
+                file=sys.stderr,
+            )
+            return
+
+        for i in range(0, len(names)):
+            self.forecast_flood_sums[names[i]] = forecast_flood_sums[i]
+
 
     @check_args_type
     def getConflictLocationNames(self) -> List[str]:
@@ -132,6 +347,71 @@ class InputGeography:
         return list(self.conflicts.keys())
 
 
+    @check_args_type
+    def getLocationChangesDue(self, time: int) -> list:
+        """
+        Summary:
+            Returns the location changes that take place at a given time, in the order of
+            location_changes.csv. Without the EventSchedules optimisation, all location changes are returned.
+
+        Args:
+            time (int): time step
+
+        Returns:
+            list: location changes in the format [location_name, new_location_type, date]
+        """
+        if SimulationSettings.optimisations["EventSchedules"] is not True:
+            return self.location_changes
+
+        source = self.location_change_schedule_source
+        if source[0] is not self.location_changes or source[1] != len(self.location_changes):
+            self.location_change_schedule = {}
+            for change in self.location_changes:
+                self.location_change_schedule.setdefault(int(change[2]), []).append(change)
+            self.location_change_schedule_source = (self.location_changes, len(self.location_changes))
+
+        return self.location_change_schedule.get(time, [])
+
+
+    @check_args_type
+    def getConflictChangesDue(self, conflict_names: List[str], time: int) -> List[str]:
+        """
+        Summary:
+            Returns the conflict locations of which the conflict intensity rises above
+            or falls below zero at a given time, in the order of conflict_names.
+            Without the EventSchedules optimisation, or for times after the end of the
+            conflicts.csv data, all conflict locations are returned.
+
+        Args:
+            conflict_names (List[str]): names of all conflict locations
+            time (int): time step
+
+        Returns:
+            List[str]: names of the conflict locations that change at this time
+        """
+        if SimulationSettings.optimisations["EventSchedules"] is not True:
+            return conflict_names
+
+        if self.conflict_schedule_source is not self.conflicts:
+            self.conflict_schedule = {}
+            self.conflict_schedule_days = min([len(v) for v in self.conflicts.values()], default=0)
+            for name in conflict_names:
+                series = self.conflicts[name]
+                for t in range(0, len(series)):
+                    # Same conditions as in AddNewConflictZones.
+                    if series[t] > 0.000001:
+                        if t == 0 or series[t - 1] < 0.000001:
+                            self.conflict_schedule.setdefault(t, []).append(name)
+                    elif series[t] < 0.000001 and t > 0 and series[t - 1] >= 0.000001:
+                        self.conflict_schedule.setdefault(t, []).append(name)
+            self.conflict_schedule_source = self.conflicts
+
+        if time < 0 or time >= self.conflict_schedule_days:
+            return conflict_names
+
+        return self.conflict_schedule.get(time, [])
+
+
     @check_args_type
     def ReadLocationsFromCSV(self, csv_name: str) -> None:
         """
@@ -156,6 +436,14 @@ class InputGeography:
                 if len(SimulationSettings.ConflictInputFile) > 0:
                     self.ReadConflictInputCSV(SimulationSettings.ConflictInputFile)
 
+        cache_name = self._GetCacheName(csv_name, "locations")
+        cached = self._ReadCache(cache_name)
+        if cached is not None:
+            self.locations = _unpack_rows(cached)
+            if "columns" in cached:
+                self.columns = cached["columns"].tolist()
+            return
+
         self.locations = []
 
         c = {}  # column map
@@ -188,6 +476,11 @@ class InputGeography:
                     # print(row)
                     self.locations.append(row)
 
+        arrays = _pack_rows(self.locations)
+        if len(columns) > 8:
+            arrays["columns"] = np.array(columns, dtype=str)
+        self._WriteCache(cache_name, arrays)
+
 
     @check_args_type
     def MakeLocationList(self) -> dict:
@@ -265,6 +558,12 @@ class InputGeography:
         if not os.path.isfile(csv_name):
             return
 
+        cache_name = self._GetCacheName(csv_name, "major_routes")
+        cached = self._ReadCache(cache_name)
+        if cached is not None:
+            self.major_routes = _unpack_rows(cached)
+            return
+
         with open(csv_name, newline="", encoding="utf-8") as csvfile:
             values = csv.reader(csvfile)
             for row in values:
@@ -272,6 +571,8 @@ class InputGeography:
                     pass
                 self.major_routes.append(row)
 
+        self._WriteCache(cache_name, _pack_rows(self.major_routes))
+
 
     @check_args_type
     def ReadLinksFromCSV(self, csv_name: str) -> None:
@@ -285,7 +586,17 @@ class InputGeography:
         Returns:
             None.
         """
+        cache_name = self._GetCacheName(csv_name, "links")
+        cached = self._ReadCache(cache_name)
+        if cached is not None:
+            self.links = _unpack_rows(cached)
+            if "link_columns" in cached:
+                self.link_columns = cached["link_columns"].tolist()
+            self._ReadMajorLinksFromCSV(self._convert_to_major(csv_name))
+            return
+
         self.links = []
+        arrays = {}
 
         with open(csv_name, newline="", encoding="utf-8") as csvfile:
             values = csv.reader(csvfile)
@@ -299,10 +610,14 @@ class InputGeography:
                             print("appending", file=sys.stderr)
                             link_columns.append(row[i])
                     self.link_columns = link_columns
+                    arrays["link_columns"] = np.array(link_columns, dtype=str)
                     print("link header", link_columns, row, len(row), file=sys.stderr)
                 else:
                     # print(row)
                     self.links.append(row)
+
+        arrays.update(_pack_rows(self.links))
+        self._WriteCache(cache_name, arrays)
         self._ReadMajorLinksFromCSV(self._convert_to_major(csv_name))
 
     @check_args_type
@@ -318,6 +633,12 @@ class InputGeography:
         Returns:
             None.
         """
+        cache_name = self._GetCacheName(csv_name, "closures")
+        cached = self._ReadCache(cache_name)
+        if cached is not None:
+            self.closures = _unpack_rows(cached)
+            return
+
         self.closures = []
 
         with open(csv_name, newline="", encoding="utf-8") as csvfile:
@@ -330,6 +651,8 @@ class InputGeography:
                     # print(row)
                     self.closures.append(row)
 
+        self._WriteCache(cache_name, _pack_rows(self.closures))
+
 
     @check_args_type
     def ReadLocationChangesFromCSV(self, csv_name: str) -> None:
@@ -349,6 +672,12 @@ class InputGeography:
         if not os.path.isfile(csv_name):
             return 
 
+        cache_name = self._GetCacheName(csv_name, "location_changes")
+        cached = self._ReadCache(cache_name)
+        if cached is not None:
+            self.location_changes = _unpack_rows(cached)
+            return
+
         with open(csv_name, newline="", encoding="utf-8") as csvfile:
             values = csv.reader(csvfile)
 
@@ -359,6 +688,7 @@ class InputGeography:
                     #print(f"Location changes read {row}", file=sys.stderr)
                     self.location_changes.append(row)
 
+        self._WriteCache(cache_name, _pack_rows(self.location_changes))
         return
 
 
@@ -394,13 +724,10 @@ class InputGeography:
                     for i in range (1, len(row)):
                         attr[headers[i-1]] = row[i]
 
-                    loc_found = False
-                    for i in range(0, len(e.locationNames)):
-                        if e.locationNames[i] == row[0]:
-                            e.addAgent(e.locations[i], attributes=attr)
-                            loc_found= True
-
-                    if not loc_found:
+                    i = e.locationIndex.get(row[0], -1)
+                    if i >= 0:
+                        e.addAgent(e.locations[i], attributes=attr)
+                    else:
                         print("could not map location to CSV-loaded agent on line. (not count commented lines or empty lines)", sys.stderr)
                 i += 1
 
@@ -430,6 +757,15 @@ class InputGeography:
         if len(home_country) < 1:
             home_country = "unknown"
 
+        # Major routes that start or end at each location, in the order of the major routes file.
+        major_routes_by_name = {}
+        for mr in self.major_routes:
+            if len(mr) == 0:
+                continue
+            major_routes_by_name.setdefault(mr[0], []).append([x for x in mr[1:] if x])
+            # operator below reverses the list, then skips the first value.
+            major_routes_by_name.setdefault(mr[-1], []).append([x for x in mr[-2::-1] if x])
+
         for loc in self.locations:
 
             name = loc[0]
@@ -503,16 +839,7 @@ class InputGeography:
                 )
 
             # Add major link information
-            for mr in self.major_routes:
-                if mr[0] == name:
-                    major_route = [x for x in mr[1:] if x]
-                    #lm[name].major_routes.append(mr[1:])
-                    lm[name].major_routes.append(major_route)
-                if mr[-1] == name:
-                    major_route = [x for x in mr[-2::-1] if x]
-                    # operator below reverses the list, then skips the first value.
-                    #lm[name].major_routes.append(mr[-2::-1])
-                    lm[name].major_routes.append(major_route)
+            lm[name].major_routes += major_routes_by_name.get(name, [])
 
 
         for link in self.links:
@@ -569,6 +896,10 @@ class InputGeography:
                 file=sys.stderr,
             )
 
+        # Spawn weights are not refreshed for each added location with VectorizedSpawnWeights.
+        if SimulationSettings.optimisations["VectorizedSpawnWeights"] is True:
+            spawning.refresh_spawn_weights(e)
+
         # Add location type changes
         self.ReadLocationChangesFromCSV("location_changes.csv")
 
@@ -593,6 +924,10 @@ class InputGeography:
         #e.g {'F1': [0, 0, 1, 1, 2, 1, 1, 1, 1, 1, 1], 'F2': [1, 1, 1, 3, 1, 1, 0, 0, 0, 0, 1], 'F3': [0, 0, 0, 1, 1, 2, 3, 2, 1, 1, 0]}
         attrlist = self.attributes[attribute_name]
 
+        if SimulationSettings.optimisations["IncrementalAttributes"] is True:
+            if self._UpdateLocationAttributesFromTable(e, attribute_name, time):
+                return
+
         # Get the length of the first array in attrlist 
         for key, value in attrlist.items():
             attrlength = int(len(value))
@@ -607,6 +942,8 @@ class InputGeography:
                 if attribute_name == "forecast_flood_levels":
                     #Set forecast_flood_levels attribute for flood_zones
                     e.locations[i].attributes[attribute_name] = attrlist[loc_name]
+                    if loc_name in self.forecast_flood_sums:
+                        e.locations[i].attributes["forecast_flood_sums"] = self.forecast_flood_sums[loc_name]
                 else:
                     #Set flood_levels attribute for flood zones
                     e.locations[i].attributes[attribute_name] =int(attrlist[loc_name][time])
@@ -615,6 +952,8 @@ class InputGeography:
                 if attribute_name == "forecast_flood_levels":
                     #Set default forecast_flood_levels attribute to array of zeros for towns/camps
                     e.locations[i].attributes[attribute_name] = [0] * attrlength #array of zeros with length equal to the length of the first array in attrlist
+                    if len(self.forecast_flood_sums) > 0:
+                        e.locations[i].attributes["forecast_flood_sums"] = np.zeros(attrlength)
                 else:
                     #Set default flood_levels attribute to zero for towns/camps
                     e.locations[i].attributes[attribute_name] = 0
@@ -622,6 +961,81 @@ class InputGeography:
             # print(e.time, loc_name, e.locations[i].attributes, file=sys.stderr)
 
 
+    def _UpdateLocationAttributesFromTable(self, e, attribute_name: str, time: int) -> bool:
+        """
+        Summary:
+            Updates the attributes of the locations from a (locations x days) table of the
+            attribute, built when first needed. flood_level is only set for locations
+            of which the value differs from the last update, and the forecast_flood_levels
+            of each location are a read-only row of the table, set once.
+
+        Args:
+            e (Ecosystem): ecosystem object
+            attribute_name (str): name of the attribute
+            time (int): time step
+
+        Returns:
+            bool: True if the attributes were updated, False if UpdateLocationAttributes has to update all locations.
+        """
+        attrlist = self.attributes[attribute_name]
+        table = self.attribute_tables.get(attribute_name, None)
+
+        if table is None or table["attrlist"] is not attrlist or table["e"] is not e or table["size"] != len(e.locations):
+            table = None
+            self.attribute_tables[attribute_name] = None
+
+            # Locations created without attributes share a dictionary, and need to be updated one by one.
+            if len(attrlist) == 0 or len(set([id(loc.attributes) for loc in e.locations])) < len(e.locations):
+                return False
+
+            attrlength = len(next(iter(attrlist.values())))
+            if any([len(attrlist[loc.name]) != attrlength for loc in e.locations if loc.name in attrlist]):
+                return False
+
+            values = np.zeros((len(e.locations), attrlength), dtype=np.int64)
+            for i in range(0, len(e.locations)):
+                if e.locations[i].name in attrlist:
+                    values[i] = np.array(attrlist[e.locations[i].name]).astype(np.int64)
+            values.flags.writeable = False
+
+            table = {"attrlist": attrlist, "e": e, "size": len(e.locations), "values": values, "time": None}
+            self.attribute_tables[attribute_name] = table
+
+        values = table["values"]
+
+        if attribute_name == "forecast_flood_levels":
+            # The forecast does not depend on the time step.
+            if table["time"] is None:
+                zero_sums = None
+                if len(self.forecast_flood_sums) > 0:
+                    zero_sums = np.zeros(values.shape[1])
+                    zero_sums.flags.writeable = False
+                for i in range(0, len(e.locations)):
+                    loc = e.locations[i]
+                    loc.attributes[attribute_name] = values[i]
+                    if loc.name in attrlist:
+                        if loc.name in self.forecast_flood_sums:
+                            loc.attributes["forecast_flood_sums"] = self.forecast_flood_sums[loc.name]
+                    elif zero_sums is not None:
+                        loc.attributes["forecast_flood_sums"] = zero_sums
+                table["time"] = time
+            return True
+
+        if time < 0 or time >= values.shape[1]:
+            table["time"] = None
+            return False
+
+        if table["time"] is None:
+            changed = range(0, len(e.locations))
+        else:
+            changed = np.flatnonzero(values[:, time] != values[:, table["time"]])
+
+        for i in changed:
+            e.locations[i].attributes[attribute_name] = int(values[i, time])
+        table["time"] = time
+        return True
+
+
     @check_args_type
     def AddNewConflictZones(self, e, time: int, Debug: bool = False) -> None:
         """
@@ -642,7 +1056,7 @@ class InputGeography:
 
         #Incorporate Location changes from location_changes.csv
         #print(self.location_changes, file=sys.stderr)
-        for change in self.location_changes:
+        for change in self.getLocationChangesDue(time):
             #print(f"loc change? {int(change[2])}, {time}", file=sys.stderr)
             if int(change[2]) == time:
                 e.change_location_type(change[0],change[1])
@@ -670,6 +1084,8 @@ class InputGeography:
                     e.add_conflict_zone(name=loc[0], conflict_intensity=conflict_intensity)
         else:
             conflict_names = self.getConflictLocationNames()
+            if not Debug:
+                conflict_names = self.getConflictChangesDue(conflict_names, time)
             # print(confl_names)
 
 
@@ -104,6 +104,8 @@ class SimulationSettings:
         dpll = fetchss(dp,"log_levels",None)
 
         SimulationSettings.log_levels["agent"] = int(fetchss(dpll,"agent",0))
+        # csv writes agents.out.<rank>, columnar writes typed binary columns to agents.columns.<rank>/.
+        SimulationSettings.log_levels["agent_format"] = fetchss(dpll,"agent_format","csv")
         # set to 1 to obtain average times for agents to reach camps at any time
         # set to 2 to obtain duplicate entries when agents do multiple hops in one timestep.
         # step (aggregate info).
@@ -117,6 +119,8 @@ class SimulationSettings:
         # set to 1 for information on conflict zone spawning
         SimulationSettings.log_levels["conflict"] = int(fetchss(dpll,"conflict",0))
         SimulationSettings.log_levels["idp_totals"] = int(fetchss(dpll,"idp_totals",0))
+        # set to 1 to write the wall time of each phase of a time step, and step counters, to timing.out.<rank>.
+        SimulationSettings.log_levels["timing"] = int(fetchss(dpll,"timing",0))
 
         SimulationSettings.log_levels["granularity"] = fetchss(dpll,"granularity","location")
         # location, region
@@ -294,6 +298,9 @@ class SimulationSettings:
         SimulationSettings.move_rules["FixedRoutes"] = bool(fetchss(dpr,"fixed_routes",False))
         print(f"INFO: Fixed Route Generation for Locations: {SimulationSettings.move_rules['FixedRoutes']}", file=sys.stderr)
 
+        # Calculate route weights using flattened per-location route trees instead of recursion.
+        SimulationSettings.move_rules["RouteTreeEngine"] = bool(fetchss(dpr,"route_tree_engine",False))
+
         # DFlee Flood Location Move rules
         dpf = fetchss(dpr, "flood_rules", None)
 
@@ -340,6 +347,45 @@ class SimulationSettings:
 
         dpo = fetchss(dp, "optimisations", None)
         SimulationSettings.optimisations["PopulationScaleDownFactor"] = int(fetchss(dpo,"hasten",1))
+        # Cache route weights per location and time step, shared by agents with the same relevant attributes.
+        SimulationSettings.optimisations["RouteCache"] = bool(fetchss(dpo,"route_cache",False))
+        # Draw move decisions and route choices for all agents in a location at once.
+        SimulationSettings.optimisations["BatchedRouteChoice"] = bool(fetchss(dpo,"batched_route_choice",False))
+        # Store agents in NumPy columns instead of a list of Person objects.
+        SimulationSettings.optimisations["AgentStore"] = bool(fetchss(dpo,"agent_store",False))
+        # Draw the number of agents leaving each location from a binomial distribution, and only process those agents.
+        # Agents are then always kept in an AgentStore, so that residents are found without visiting every agent.
+        SimulationSettings.optimisations["BinomialThinning"] = bool(fetchss(dpo,"binomial_thinning",False))
+        # Sample demographic attributes from cached cumulative weight tables, for many agents at once.
+        SimulationSettings.optimisations["DemographicTables"] = bool(fetchss(dpo,"demographic_tables",False))
+        # Distribution of agents over ranks in pflee: "round-robin" or "location" (agents live on the rank that owns their location).
+        SimulationSettings.optimisations["AgentPartition"] = fetchss(dpo,"agent_partition","round-robin")
+        # Even out the number of active agents per rank in pflee every rebalance_interval days (0 disables),
+        # when the most loaded rank exceeds rebalance_threshold times the average.
+        SimulationSettings.optimisations["RebalanceInterval"] = int(fetchss(dpo,"rebalance_interval",0))
+        SimulationSettings.optimisations["RebalanceThreshold"] = float(fetchss(dpo,"rebalance_threshold",1.1))
+        # Synchronization of agent counts in pflee: "blocking", "delta" (only changed counts) or "non-blocking".
+        SimulationSettings.optimisations["NumAgentsSync"] = fetchss(dpo,"num_agents_sync","blocking")
+        # Keep crawled FixedRoutes route tables between time steps, and only reweight them when endpoint scores change.
+        SimulationSettings.optimisations["IncrementalRoutes"] = bool(fetchss(dpo,"incremental_routes",False))
+        # Update the scores of all locations with array operations, instead of one location at a time.
+        SimulationSettings.optimisations["VectorizedScoring"] = bool(fetchss(dpo,"vectorized_scoring",False))
+        # Precompute the weighted flood forecast per location and day when flood_level.csv is read.
+        SimulationSettings.optimisations["FloodForecastTable"] = bool(fetchss(dpo,"flood_forecast_table",False))
+        # Look up distances between locations (used by StayCloseToHome) in float32 rows that are computed once per location.
+        SimulationSettings.optimisations["DistanceMatrix"] = bool(fetchss(dpo,"distance_matrix",False))
+        # Share one read-only attribute record between all agents with the same attribute values.
+        SimulationSettings.optimisations["AttributeCodes"] = bool(fetchss(dpo,"attribute_codes",False))
+        # Directory in which parsed input CSV files are cached, keyed by the contents of the files ("" disables the cache).
+        SimulationSettings.optimisations["GeographyCache"] = fetchss(dpo,"geography_cache","")
+        # Interpolate the validation data for every day once, instead of scanning the data table on every query.
+        SimulationSettings.optimisations["DenseDataTables"] = bool(fetchss(dpo,"dense_data_tables",False))
+        # Look up the closures, location changes and conflict changes of each day, instead of checking all of them every day.
+        SimulationSettings.optimisations["EventSchedules"] = bool(fetchss(dpo,"event_schedules",False))
+        # Keep flood levels in one table for all locations, and only update the locations of which the flood level changes.
+        SimulationSettings.optimisations["IncrementalAttributes"] = bool(fetchss(dpo,"incremental_attributes",False))
+        # Compute spawn weights with array operations, refresh them once after loading, and keep the spawn location distribution between time steps.
+        SimulationSettings.optimisations["VectorizedSpawnWeights"] = bool(fetchss(dpo,"vectorized_spawn_weights",False))
 
         if SimulationSettings.UseV1Rules is True:
             SimulationSettings.move_rules["MaxMoveSpeed"] = 200
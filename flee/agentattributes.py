@@ -0,0 +1,174 @@
+import os
+import numpy as np
+
+if os.getenv("FLEE_TYPE_CHECK") is not None and os.environ["FLEE_TYPE_CHECK"].lower() == "true":
+    from beartype import beartype as check_args_type
+else:
+    def check_args_type(func):
+        return func
+
+# Categorical encoding of agent attributes, used instead of one attribute
+# dictionary per agent when the AttributeCodes optimisation is enabled.
+
+
+class AttributeRecord(dict):
+    """
+    The AttributeRecord class.
+    A read-only dictionary of agent attributes, shared by all agents that have
+    the same attribute values. Records are created by AttributeSchema, and
+    identified by the integer codes of their values.
+    """
+
+    __slots__ = ("codes", "csv_values")
+
+    def _read_only(self, *args, **kwargs):
+        raise TypeError("Agent attribute records are shared between agents and cannot be modified.")
+
+    __setitem__ = _read_only
+    __delitem__ = _read_only
+    clear = _read_only
+    pop = _read_only
+    popitem = _read_only
+    setdefault = _read_only
+    update = _read_only
+
+    def __reduce__(self):
+        # Records are sent to other ranks as plain dictionaries, and encoded again on arrival.
+        return (dict, (dict(self),))
+
+
+class AttributeSchema:
+    """
+    The AttributeSchema class.
+    Assigns a small integer code to every attribute name and to every value of
+    each attribute, and keeps one AttributeRecord per combination of codes.
+    """
+
+    def __init__(self):
+        self.names = []  # attribute names, in order of registration.
+        self.index = {}  # attribute name -> position in self.names.
+        self.values = []  # values of each attribute, indexed by code.
+        self.codes = []  # {value: code} of each attribute.
+        self.records = {}  # tuple of (attribute, code) pairs -> AttributeRecord.
+
+
+    def _attribute_index(self, name) -> int:
+        i = self.index.get(name, None)
+        if i is None:
+            i = len(self.names)
+            self.index[name] = i
+            self.names.append(name)
+            self.values.append([])
+            self.codes.append({})
+        return i
+
+
+    def _value_code(self, i: int, value) -> int:
+        code = self.codes[i].get(value, None)
+        if code is None:
+            code = len(self.values[i])
+            self.codes[i][value] = code
+            self.values[i].append(value)
+        return code
+
+
+    @check_args_type
+    def register(self, name: str, values: list) -> np.ndarray:
+        """
+        Summary:
+            Registers the values of an attribute, e.g. the rows of a demographics CSV file.
+
+        Args:
+            name (str): The name of the attribute.
+            values (list): The values of the attribute.
+
+        Returns:
+            np.ndarray: The code of each of the values.
+        """
+        i = self._attribute_index(name)
+        return np.array([self._value_code(i, value) for value in values], dtype=np.int64)
+
+
+    def encode(self, attributes):
+        """
+        Summary:
+            Returns the shared record with the same attributes as a dictionary.
+            Attributes and values that were not registered are added to the schema.
+
+        Args:
+            attributes (dict): The attributes of an agent.
+
+        Returns:
+            AttributeRecord: The shared record, or the dictionary itself if its values cannot be encoded.
+        """
+        if isinstance(attributes, AttributeRecord):
+            return attributes
+
+        try:
+            key = []
+            for name, value in attributes.items():
+                i = self._attribute_index(name)
+                key.append((i, self._value_code(i, value)))
+        except TypeError:
+            # Unhashable attribute values are kept in a dictionary of their own.
+            return attributes
+
+        key = tuple(key)
+        record = self.records.get(key, None)
+        if record is None:
+            record = self._new_record(key, attributes)
+        return record
+
+
+    def record(self, names: list, codes) -> AttributeRecord:
+        """
+        Summary:
+            Returns the shared record for attribute codes that were drawn directly,
+            without building a dictionary first.
+
+        Args:
+            names (list): The attribute names.
+            codes: The code of the value of each attribute.
+
+        Returns:
+            AttributeRecord: The shared record.
+        """
+        key = tuple([(self.index[name], int(code)) for name, code in zip(names, codes)])
+        record = self.records.get(key, None)
+        if record is None:
+            record = self._new_record(key, {self.names[i]: self.values[i][code] for i, code in key})
+        return record
+
+
+    def _new_record(self, key: tuple, attributes: dict) -> AttributeRecord:
+        record = AttributeRecord(attributes)
+        record.codes = key
+        record.csv_values = "".join([str(v) + "," for v in attributes.values()])
+        self.records[key] = record
+        return record
+
+
+    @check_args_type
+    def count_by_attribute(self, record_counts: dict, counts: dict) -> dict:
+        """
+        Summary:
+            Adds up numbers of agents per record into numbers of agents per attribute value.
+            Attributes and values appear in the same order as when agents are counted one by one.
+
+        Args:
+            record_counts (dict): number of agents per record key (AttributeRecord.codes).
+            counts (dict): counts per attribute and value to add to, which is not modified.
+
+        Returns:
+            dict: number of agents per attribute and value.
+        """
+        counts = {a: dict(category) for a, category in counts.items()}
+        for key, n in record_counts.items():
+            for a, value in self.records[key].items():
+                category = counts.setdefault(a, {})
+                category[value] = category.get(value, 0) + n
+        return counts
+
+
+# Schema shared by all agents in the simulation.
+attribute_schema = AttributeSchema()
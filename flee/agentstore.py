@@ -0,0 +1,458 @@
+import os
+import numpy as np
+from flee.SimulationSettings import SimulationSettings
+import flee.moving as moving
+from flee.agentattributes import attribute_schema
+
+if os.getenv("FLEE_TYPE_CHECK") is not None and os.environ["FLEE_TYPE_CHECK"].lower() == "true":
+    from beartype import beartype as check_args_type
+else:
+    def check_args_type(func):
+        return func
+
+# Structure-of-arrays storage of agents, used instead of a list of Person objects
+# when the AgentStore optimisation is enabled.
+
+
+class AgentStore:
+    """
+    The AgentStore class.
+    Stores the state of all agents in NumPy columns, and behaves like a list
+    of agents: iterating over it or indexing it returns lightweight views
+    that expose the usual Person interface.
+    """
+
+    # column name, dtype and default value.
+    columns = [
+        ("location", np.int32, -1),  # index in Ecosystem.locations, -1 when travelling or removed.
+        ("link", np.int32, -1),  # index in AgentStore.links, -1 when not travelling.
+        ("home_location", np.int32, -1),
+        ("travelling", bool, False),
+        ("distance_travelled_on_link", np.float64, 0.0),
+        ("distance_moved_this_timestep", np.float64, 0.0),
+        ("recent_travel_distance", np.float64, 0.0),
+        ("timesteps_since_departure", np.int32, 0),
+        ("places_travelled", np.int32, 1),
+        ("distance_travelled", np.float64, 0.0),
+        ("route", object, None),
+        ("attributes", object, None),
+        ("locations_visited", object, None),
+        ("move_chance_class", np.int64, -1),  # flood awareness (see moving.getMoveChanceClass), -1 until first needed.
+    ]
+
+    @check_args_type
+    def __init__(self, e, view_class, capacity: int = 1024):
+        """
+        Summary:
+            Initializes an empty agent store.
+
+        Args:
+            e (Ecosystem): The ecosystem the agents live in.
+            view_class: The class used to create views of individual agents.
+            capacity (int, optional): Initial number of agents that fit in the columns. Defaults to 1024.
+
+        Returns:
+            None.
+        """
+        self.e = e
+        self.view_class = view_class
+        self.size = 0
+
+        # Links are registered when the first agent travels on them.
+        self.links = []
+        self._link_index = {}
+        self._location_index = {}
+
+        for name, dtype, default in self.columns:
+            setattr(self, name, np.full(capacity, default, dtype=dtype))
+
+
+    def __len__(self) -> int:
+        return self.size
+
+
+    def __getitem__(self, k: int):
+        if k < 0:
+            k += self.size
+        if k < 0 or k >= self.size:
+            raise IndexError("agent index out of range")
+        return self.view_class(self, int(k))
+
+
+    def __iter__(self):
+        for k in range(0, self.size):
+            yield self.view_class(self, k)
+
+
+    def _grow(self, capacity: int) -> None:
+        """
+        Summary:
+            Enlarges all columns to hold at least a given number of agents.
+
+        Args:
+            capacity (int): The minimum number of agents the columns need to hold.
+
+        Returns:
+            None.
+        """
+        old_capacity = len(self.location)
+        if capacity <= old_capacity:
+            return
+
+        new_capacity = max(capacity, 2 * old_capacity)
+        for name, dtype, default in self.columns:
+            column = np.full(new_capacity, default, dtype=dtype)
+            column[:self.size] = getattr(self, name)[:self.size]
+            setattr(self, name, column)
+
+
+    @check_args_type
+    def append(self, person) -> None:
+        """
+        Summary:
+            Adds an agent to the store, copying the state of a Person object.
+            The Person object is no longer used afterwards.
+
+        Args:
+            person (Person): The agent to add.
+
+        Returns:
+            None.
+        """
+        self._grow(self.size + 1)
+        k = self.size
+        self.size += 1
+
+        self.set_location(k, person.location)
+        self.home_location[k] = self.location_index(person.home_location)
+        self.travelling[k] = person.travelling
+        self.distance_travelled_on_link[k] = person.distance_travelled_on_link
+        self.distance_moved_this_timestep[k] = person.distance_moved_this_timestep
+        self.recent_travel_distance[k] = person.recent_travel_distance
+        self.timesteps_since_departure[k] = person.timesteps_since_departure
+        self.places_travelled[k] = person.places_travelled
+        self.route[k] = person.route
+        self.attributes[k] = person.attributes
+        self.move_chance_class[k] = -1
+
+        if SimulationSettings.log_levels["agent"] > 0:
+            self.distance_travelled[k] = person.distance_travelled
+        if SimulationSettings.log_levels["agent"] > 1:
+            self.locations_visited[k] = person.locations_visited
+
+
+    @check_args_type
+    def append_batch(self, location, attributes_batch: list) -> None:
+        """
+        Summary:
+            Adds new agents to the store at a location, one per attribute
+            dictionary, without creating Person objects.
+
+        Args:
+            location (Location): The location of the new agents.
+            attributes_batch (list): A list of attribute dictionaries, one per agent.
+
+        Returns:
+            None.
+        """
+        n = len(attributes_batch)
+        if n == 0:
+            return
+
+        self._grow(self.size + n)
+        new = slice(self.size, self.size + n)
+
+        for name, dtype, default in self.columns:
+            getattr(self, name)[new] = default
+        self.location[new] = self.location_index(location)
+        self.home_location[new] = self.location[self.size]
+
+        if SimulationSettings.optimisations["AttributeCodes"] is True:
+            attributes_batch = [attribute_schema.encode(attributes) for attributes in attributes_batch]
+
+        for k in range(0, n):
+            self.route[self.size + k] = []
+            self.attributes[self.size + k] = attributes_batch[k]
+            if SimulationSettings.log_levels["agent"] > 1:
+                self.locations_visited[self.size + k] = []
+
+        first = self.size
+        self.size += n
+        for k in range(first, self.size):
+            location.IncrementNumAgents(self[k])
+
+
+    @check_args_type
+    def location_index(self, location) -> int:
+        """
+        Summary:
+            Returns the index of a location in Ecosystem.locations.
+
+        Args:
+            location (Location): The location to look up.
+
+        Returns:
+            int: The index of the location.
+        """
+        k = self._location_index.get(id(location), None)
+        if k is None:
+            self._location_index = {id(loc): i for i, loc in enumerate(self.e.locations)}
+            k = self._location_index[id(location)]
+        return k
+
+
+    @check_args_type
+    def link_index(self, link) -> int:
+        """
+        Summary:
+            Returns the index of a link in AgentStore.links, registering it if needed.
+
+        Args:
+            link (Link): The link to look up.
+
+        Returns:
+            int: The index of the link.
+        """
+        k = self._link_index.get(id(link), None)
+        if k is None:
+            k = len(self.links)
+            self._link_index[id(link)] = k
+            self.links.append(link)
+        return k
+
+
+    @check_args_type
+    def get_location(self, k: int):
+        """
+        Summary:
+            Returns the location (Location or Link object) of agent k,
+            or None if the agent has been removed from the simulation.
+
+        Args:
+            k (int): The index of the agent.
+
+        Returns:
+            The location or link the agent resides on.
+        """
+        if self.link[k] >= 0:
+            return self.links[self.link[k]]
+        if self.location[k] >= 0:
+            return self.e.locations[self.location[k]]
+        return None
+
+
+    @check_args_type
+    def set_location(self, k: int, location) -> None:
+        """
+        Summary:
+            Sets the location (Location or Link object) of agent k.
+
+        Args:
+            k (int): The index of the agent.
+            location: The location or link, or None to remove the agent from the simulation.
+
+        Returns:
+            None.
+        """
+        if location is None:
+            self.location[k] = -1
+            self.link[k] = -1
+        elif hasattr(location, "endpoint"):
+            self.location[k] = -1
+            self.link[k] = self.link_index(location)
+        else:
+            self.location[k] = self.location_index(location)
+            self.link[k] = -1
+
+
+    @check_args_type
+    def reset_locations_visited(self) -> None:
+        """
+        Summary:
+            Clears the list of locations visited in this time step for all agents.
+
+        Args:
+            None.
+
+        Returns:
+            None.
+        """
+        for k in range(0, self.size):
+            self.locations_visited[k] = []
+
+
+    @check_args_type
+    def evolve(self, e, time: int) -> None:
+        """
+        Summary:
+            Vectorized version of calling Person.evolve() for all agents.
+            Move decisions are drawn at once for all agents that reside in
+            a location, and only the agents that move are processed individually.
+            With binomial thinning, only the number of movers is drawn per location.
+
+        Args:
+            e (Ecosystem): The ecosystem object.
+            time (int): The current simulation timestep.
+
+        Returns:
+            None.
+        """
+        # Created on every rank before any early return, as it draws from the global random state.
+        rng = e._get_rng()
+
+        residents = np.nonzero(self.location[:self.size] >= 0)[0]
+        if len(residents) == 0:
+            return
+
+        # Move chances only differ between agents in the same location when the flood forecaster is used.
+        keys = self.location[residents].astype(np.int64)
+        if SimulationSettings.move_rules["FloodRulesEnabled"] is True and SimulationSettings.move_rules["FloodForecaster"] is True:
+            # Read from the attributes once per agent, and kept in a column afterwards.
+            for k in residents[self.move_chance_class[residents] < 0]:
+                self.move_chance_class[k] = int(self.attributes[k]["floodawareness"])
+            awareness = self.move_chance_class[residents]
+            keys = keys * (awareness.max() + 1) + awareness
+
+        _, first, inverse, counts = np.unique(keys, return_index=True, return_inverse=True, return_counts=True)
+        movechance = np.array([moving.calculateMoveChance(self[residents[k]], False, time) for k in first])
+        movechance = np.clip(movechance, 0.0, 1.0)
+
+        if SimulationSettings.optimisations["BinomialThinning"] is True:
+            # Draw the number of movers per group, then pick that many residents of the group.
+            grouped = residents[np.argsort(inverse, kind="stable")]
+            starts = np.cumsum(counts) - counts
+            num_movers = rng.binomial(counts, movechance)
+            selected = [
+                grouped[start + rng.choice(count, num, replace=False)]
+                for start, count, num in zip(starts, counts, num_movers) if num > 0
+            ]
+            moving_agents = np.sort(np.concatenate(selected)) if len(selected) > 0 else []
+        else:
+            moving_agents = residents[rng.random(len(residents)) < movechance[inverse]]
+
+        movers = [self[k] for k in moving_agents]
+
+        if SimulationSettings.optimisations["BatchedRouteChoice"] is True:
+            e.select_routes_batched(movers)
+
+        for a in movers:
+            a.move(e, time=time)
+
+
+    @check_args_type
+    def finish_travel(self, e, time: int) -> None:
+        """
+        Summary:
+            Vectorized version of calling Person.finish_travel() for all agents.
+            Travel speeds and distances are updated at once for all travelling
+            agents, and only the agents that reach the end of their link
+            are processed individually.
+
+        Args:
+            e (Ecosystem): The ecosystem object.
+            time (int): The current simulation timestep.
+
+        Returns:
+            None.
+        """
+        rng = e._get_rng()
+
+        travellers = np.nonzero(self.link[:self.size] >= 0)[0]
+        if len(travellers) == 0:
+            return
+
+        max_move_speed = SimulationSettings.move_rules["MaxMoveSpeed"]
+        max_walk_speed = SimulationSettings.move_rules["MaxWalkSpeed"]
+
+        link_distance = np.array([l.get_distance() for l in self.links])
+        link_speed = np.array([float(l.attributes.get("max_move_speed", max_move_speed)) for l in self.links])
+        link_walk_probability = np.array([float(l.attributes.get("walk_probability", "0.0")) for l in self.links])
+
+        links = self.link[travellers]
+        speed = link_speed[links]
+
+        if SimulationSettings.move_rules["StartOnFoot"]:
+            speed[self.places_travelled[travellers] == 1] = max_walk_speed
+
+        # Flee 3.0: support for walk_probability attribute on links.
+        speed[rng.random(len(travellers)) < link_walk_probability[links]] = max_walk_speed
+
+        self.distance_travelled_on_link[travellers] += speed
+        self.distance_moved_this_timestep[travellers] += speed
+
+        arrived = self.distance_travelled_on_link[travellers] > link_distance[links]
+        for k, todays_travel_speed in zip(travellers[arrived], speed[arrived]):
+            self[k].complete_link(e, time=time, todays_travel_speed=float(todays_travel_speed))
+
+
+    @check_args_type
+    def update_travel_history(self) -> None:
+        """
+        Summary:
+            Advances the departure timer of all active agents, and updates
+            the recent travel distance index of all agents.
+
+        Args:
+            None.
+
+        Returns:
+            None.
+        """
+        n = self.size
+        active = (self.location[:n] >= 0) | (self.link[:n] >= 0)
+        self.timesteps_since_departure[:n][active] += 1
+
+        self.recent_travel_distance[:n] = (
+            self.recent_travel_distance[:n]
+            + (self.distance_moved_this_timestep[:n] / SimulationSettings.move_rules["MaxMoveSpeed"])
+        ) / 2.0
+        self.distance_moved_this_timestep[:n] = 0
+
+
+    @check_args_type
+    def deactivate_in_camps(self, e) -> None:
+        """
+        Summary:
+            Removes agents that reside in camps from the simulation,
+            with the deactivation probability of the camp.
+
+        Args:
+            e (Ecosystem): The ecosystem object.
+
+        Returns:
+            None.
+        """
+        rng = e._get_rng()
+
+        residents = np.nonzero(self.location[:self.size] >= 0)[0]
+        if len(residents) == 0:
+            return
+
+        deactivation_probability = np.array([
+            float(loc.attributes.get("deactivation_probability", 0.0)) if loc.camp is True else 0.0
+            for loc in e.locations
+        ])
+
+        outcome = rng.random(len(residents))
+        deactivated = residents[outcome < deactivation_probability[self.location[residents]]]
+        self.location[deactivated] = -1
+
+
+    @check_args_type
+    def remove(self, removed) -> None:
+        """
+        Summary:
+            Removes agents from the store, compacting the columns.
+
+        Args:
+            removed (numpy.ndarray): Boolean mask, True for the agents to remove.
+
+        Returns:
+            None.
+        """
+        keep = np.nonzero(~removed[:self.size])[0]
+        for name, dtype, default in self.columns:
+            column = getattr(self, name)
+            column[:len(keep)] = column[keep]
+            column[len(keep):self.size] = default
+        self.size = len(keep)
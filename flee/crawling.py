@@ -3,6 +3,7 @@ import sys
 import numpy as np
 import random
 from beartype.typing import List, Optional, Tuple
+from flee import moving
 from flee.SimulationSettings import SimulationSettings
 
 if os.getenv("FLEE_TYPE_CHECK") is not None and os.environ["FLEE_TYPE_CHECK"].lower() == "true":
@@ -259,6 +260,9 @@ def generateLocationRoutes(l, time: int, debug: bool = False):
   if l.marker:
       return {}
 
+  if SimulationSettings.optimisations["IncrementalRoutes"] is True and SimulationSettings.move_rules["AwarenessLevel"] > 0:
+    return updateLocationRoutes(l, time)
+
   l.routes = {}
 
   if SimulationSettings.move_rules["AwarenessLevel"] == 0:
@@ -281,3 +285,186 @@ def generateLocationRoutes(l, time: int, debug: bool = False):
   #print(f"Generated {len(l.routes)} routes for {l.name} at time {time}.", file=sys.stderr)
   return l.routes
 
+
+
+@check_args_type
+def packLocationRoutes(locations, location_index: dict) -> Tuple[np.ndarray, np.ndarray]:
+  """
+  Summary:
+      Flattens the route tables of a list of locations into arrays, so that
+      they can be sent to other processes. For every location, the integer array
+      holds the number of routes, followed by the length and the location indices
+      of each route. The float array holds the weights of the routes.
+
+  Args:
+    locations (List[Location]): locations whose routes are packed
+    location_index (dict): index of each location name in the list of all locations
+
+  Returns:
+      Tuple[np.ndarray, np.ndarray]: the integer and float arrays
+  """
+  ints = []
+  weights = []
+  for l in locations:
+    ints.append(len(l.routes))
+    for name in l.routes:
+      weight, route, _ = l.routes[name]
+      ints.append(len(route))
+      ints += [location_index[step] for step in route]
+      weights.append(weight)
+
+  return np.array(ints, dtype="i"), np.array(weights, dtype=np.float64)
+
+
+@check_args_type
+def unpackLocationRoutes(locations, all_locations, ints: np.ndarray, weights: np.ndarray) -> None:
+  """
+  Summary:
+      Restores the route tables of a list of locations from the arrays
+      created by packLocationRoutes, in the same order.
+
+  Args:
+    locations (List[Location]): locations whose routes are restored
+    all_locations (List[Location]): all locations, to resolve location indices
+    ints (np.ndarray): integer array created by packLocationRoutes
+    weights (np.ndarray): float array created by packLocationRoutes
+
+  Returns:
+      None (routes are stored in loc.routes)
+  """
+  ints = ints.tolist()
+  weights = weights.tolist()
+  i = 0
+  w = 0
+  for l in locations:
+    l.routes = {}
+    num_routes = ints[i]
+    i += 1
+    for _ in range(num_routes):
+      route = [all_locations[k] for k in ints[i + 1 : i + 1 + ints[i]]]
+      i += 1 + len(route)
+      l.routes[route[-1].name] = [weights[w], [step.name for step in route], route[-1]]
+      w += 1
+
+
+@check_args_type
+def _collectLocationRouteCandidates(
+  link,
+  prior_distance: float,
+  origin_names: List[str],
+  step: int,
+  candidates: list,
+) -> None:
+  """
+  Summary:
+      Traverses the links in the same order as calculateLocCrawlLinkWeight,
+      and collects the candidate routes instead of adding them to the route table.
+
+  Args:
+      link (Link): The link to traverse.
+      prior_distance (float): The distance travelled so far.
+      origin_names (List[str]): The names of the locations that have been visited so far.
+      step (int): The number of steps taken so far.
+      candidates (list): list of (link, prior distance, route) tuples that is extended.
+
+  Returns:
+      None
+  """
+  if link.endpoint.marker is False:
+      candidates.append((link, prior_distance, origin_names[1:] + [link.endpoint.name]))
+
+  if SimulationSettings.move_rules["AwarenessLevel"] > step:
+      for lel in link.endpoint.links:
+          if lel.endpoint.name not in origin_names:
+              _collectLocationRouteCandidates(
+                  lel,
+                  prior_distance + link.get_distance(),
+                  origin_names + [link.endpoint.name],
+                  step + 1,
+                  candidates,
+              )
+
+
+@check_args_type
+def buildLocationRouteTopology(l) -> dict:
+  """
+  Summary:
+      Crawls the routes from a location once, and stores everything needed to
+      weigh them except the endpoint scores: the link and route of every
+      candidate, and the distance part of its weight.
+
+  Args:
+    l: Location
+
+  Returns:
+      dict: the route topology of the location
+  """
+  candidates = []
+  for link in l.links:
+    _collectLocationRouteCandidates(link, 0.0, [l.name], 1, candidates)
+
+  endpoints = []
+  endpoint_index = {}
+  entries = []
+  for link, prior_distance, route in candidates:
+    dist = float(SimulationSettings.move_rules["DistanceSoftening"] + link.get_distance() + prior_distance)
+    if link.endpoint.name not in endpoint_index:
+      endpoint_index[link.endpoint.name] = len(endpoints)
+      endpoints.append(link)
+    entries.append((endpoint_index[link.endpoint.name], dist**SimulationSettings.move_rules["DistancePower"], route))
+
+  return {
+    "key": (moving.route_tree_generation, SimulationSettings.move_rules["AwarenessLevel"]),
+    "endpoints": endpoints,  # one link per distinct endpoint, to evaluate its score.
+    "entries": entries,
+    "scores": None,
+    "routes": None,
+  }
+
+
+@check_args_type
+def updateLocationRoutes(l, time: int):
+  """
+  Summary:
+      Incremental version of generateLocationRoutes. The crawled routes are kept
+      until the links or location types change, and the route weights are only
+      recalculated when the score of one of the reachable endpoints has changed.
+      Routes that involve major routes are inserted again every time, as before.
+
+  Args:
+    l: Location
+    time (int): Current time
+
+  Returns:
+      dict: the routes of the location (also stored in l.routes)
+  """
+  topology = l.route_topology
+  if topology is None or topology["key"] != (moving.route_tree_generation, SimulationSettings.move_rules["AwarenessLevel"]):
+    topology = buildLocationRouteTopology(l)
+    l.route_topology = topology
+
+  scores = [getLocationCrawlEndPointScore(link=link, time=time) for link in topology["endpoints"]]
+
+  if scores != topology["scores"]:
+    routes = {}
+    for k, denominator, route in topology["entries"]:
+      link = topology["endpoints"][k]
+      weight = (float(SimulationSettings.move_rules["WeightSoftening"] + float(scores[k])) / denominator)
+      weight = weight**SimulationSettings.move_rules["WeightPower"]
+      if weight > routes.get(link.endpoint.name, [0,None])[0]:
+        routes[link.endpoint.name] = [weight, route, link.endpoint]
+    topology["scores"] = scores
+    topology["routes"] = routes
+
+  routes = topology["routes"]
+  major = len(l.major_routes) > 0 or any(len(routes[name][2].major_routes) > 0 for name in routes)
+  if not major:
+    # The table is shared with the topology, and reused as long as the scores do not change.
+    l.routes = routes
+    return l.routes
+
+  # Major routes are added to a copy, so that the table without them is kept.
+  l.routes = {name: list(value) for name, value in routes.items()}
+  insertAllMajorRoutesAtLocation(l, time)
+
+  return l.routes
@@ -6,6 +6,8 @@ from functools import wraps
 
 import numpy as np
 
+from flee.SimulationSettings import SimulationSettings
+
 if os.getenv("FLEE_TYPE_CHECK") is not None and os.environ["FLEE_TYPE_CHECK"].lower() == "true":
     from beartype import beartype as check_args_type
 else:
@@ -247,6 +249,16 @@ class DataTable:
         else:
             self.start_empty = 1
 
+        # Dense daily series, built when first queried (see _dense_series).
+        self.dense = bool(SimulationSettings.optimisations.get("DenseDataTables", False))
+        self.dense_key = None
+        self.dense_first_day = 0
+        self.dense_interpolated = None
+        self.dense_raw = None
+        self.dense_camp_differences = None
+        self.dense_raw_camp_differences = None
+        self.header_index = {}
+
         with open(
             os.path.join(data_directory, data_layout), newline="", encoding="utf-8"
         ) as csvfile:
@@ -279,6 +291,9 @@ class DataTable:
 
                     self.data_table.append(csv_total)
 
+        for i in range(len(self.header) - 1, -1, -1):
+            self.header_index[self.header[i]] = i
+
         # print(self.header, self.data_table)
 
     @check_args_type
@@ -301,6 +316,79 @@ class DataTable:
                 population_scaledown_factor=self.population_scaledown_factor,
             )
         )
+        self.header_index.setdefault("total (modified input)", len(self.header) - 1)
+        self.dense_key = None
+
+    def _dense_series(self) -> bool:
+        """
+        Summary:
+            Builds, when the DenseDataTables optimisation is enabled, the interpolated and
+            raw value of every column for every day covered by the data, and the daily
+            differences of the sums of the interpolated and raw values over all camps. Days before or after the covered range
+            have the values of its first or last day. The series are built again after
+            the table or the day and count columns change.
+
+        Returns:
+            bool: True if the dense series can be used, False if the table has to be scanned.
+        """
+        if not self.dense:
+            return False
+
+        key = (self.days_column, self.total_refugee_column)
+        if self.dense_key == key:
+            return self.dense_interpolated is not None
+
+        self.dense_key = key
+        self.dense_interpolated = None
+
+        tables = self.data_table
+        if len(tables) == 0 or min([len(t) for t in tables]) == 0:
+            return False
+        for t in tables:
+            if np.any(np.diff(t[:, self.days_column]) < 0):
+                # Unordered dates are interpolated by scanning, as before.
+                return False
+
+        first_day = int(min(0, np.floor(min([t[0, self.days_column] for t in tables]))))
+        last_day = int(max(0, np.ceil(max([t[-1, self.days_column] for t in tables]))))
+        days = np.arange(first_day, last_day + 1)
+
+        interpolated = np.zeros((len(tables), len(days)), dtype=np.int64)
+        raw = np.zeros((len(tables), len(days)), dtype=np.int64)
+
+        for i, t in enumerate(tables):
+            d = t[:, self.days_column]
+            v = t[:, self.total_refugee_column]
+
+            # Index of the first entry after each day, as found by get_interpolated_data.
+            k = np.searchsorted(d, days, side="right")
+            prev = np.maximum(k - 1, 0)
+            nxt = np.minimum(k, len(d) - 1)
+
+            with np.errstate(divide="ignore", invalid="ignore"):
+                fraction = (days - d[prev]) / (d[nxt] - d[prev])
+                values = v[prev] + fraction * (v[nxt] - v[prev])
+            values = np.where(days <= d[0], v[0], values)
+            values = np.where(k == len(d), v[-1], values)
+
+            interpolated[i] = values.astype(np.int64)
+            raw[i] = v[prev].astype(np.int64)
+
+        camp_totals = interpolated[1:].sum(axis=0)
+        raw_camp_totals = raw[1:].sum(axis=0)
+
+        self.dense_first_day = first_day
+        self.dense_interpolated = interpolated
+        self.dense_raw = raw
+        self.dense_camp_differences = np.diff(camp_totals, prepend=camp_totals[:1])
+        self.dense_raw_camp_differences = np.diff(raw_camp_totals, prepend=raw_camp_totals[:1])
+        return True
+
+    def _dense_index(self, day: int) -> int:
+        """
+        Returns the position of a day in the dense series.
+        """
+        return min(max(day - self.dense_first_day, 0), self.dense_interpolated.shape[1] - 1)
 
     @check_args_type
     def get_daily_difference(
@@ -373,6 +461,17 @@ class DataTable:
 
             # return int(new_refugees)
 
+        elif SumFromCamps is True and self._dense_series():
+            # The Day 0 offsets of the camps cancel out in the difference.
+            differences = self.dense_camp_differences
+            if not FullInterpolation:
+                differences = self.dense_raw_camp_differences
+
+            k = day - self.dense_first_day
+            new_refugees = 0
+            if 0 <= k < len(differences):
+                new_refugees = differences[k]
+
         else:
 
             new_refugees = 0
@@ -415,6 +514,9 @@ class DataTable:
         Returns:
             int: Description
         """
+        if self._dense_series():
+            return int(self.dense_interpolated[column, self._dense_index(day)])
+
         ref_table = self.data_table[column]
 
         old_val = ref_table[0, self.total_refugee_column]
@@ -459,6 +561,8 @@ class DataTable:
         Returns:
             int: Description
         """
+        if self._dense_series():
+            return int(self.dense_raw[column, self._dense_index(day)])
 
         ref_table = self.data_table[column]
 
@@ -484,6 +588,9 @@ class DataTable:
         Returns:
             int: Description
         """
+        if self.dense and name in self.header_index:
+            return self.header_index[name]
+
         for i in range(0, len(self.header)):
             if self.header[i] == name:
                 return i
@@ -85,6 +85,7 @@ class RefugeeTable(DataTable.DataTable):
                         sys.exit()
                     # print(days, i, ref_table[0:i,1])
                     ref_table[0:i, 1] *= first_level_2_value / last_level_1_value
+                    self.dense_key = None
                     # print(first_level_2_value, last_level_1_value, ref_table[0:i,1])
 
         return float(first_level_2_value / last_level_1_value)
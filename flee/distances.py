@@ -0,0 +1,82 @@
+import os
+import numpy as np
+
+if os.getenv("FLEE_TYPE_CHECK") is not None and os.environ["FLEE_TYPE_CHECK"].lower() == "true":
+    from beartype import beartype as check_args_type
+else:
+    def check_args_type(func):
+        return func
+
+# Great-circle distances between locations, used by Location.calculateDistance
+# when the DistanceMatrix optimisation is enabled.
+
+
+class DistanceMatrix:
+    """
+    The DistanceMatrix class.
+    Stores the coordinates of all locations, and computes the distances from a
+    location to all other locations at once, the first time one of them is needed.
+    Each location keeps its own row, so only the rows of locations that are
+    actually used as endpoints are ever stored.
+    """
+
+    # Approximate radius of earth in km, as in Location.calculateDistance.
+    R = 6371.0
+
+    def __init__(self):
+        self.size = 0
+        self.lat = np.zeros(16)
+        self.lon = np.zeros(16)
+
+
+    @check_args_type
+    def add_location(self, location) -> None:
+        """
+        Summary:
+            Adds a location to the matrix, and links the location to it.
+            Rows that were computed before are extended when they are next used.
+
+        Args:
+            location (Location): The location to add.
+
+        Returns:
+            None.
+        """
+        if self.size == len(self.lat):
+            self.lat = np.concatenate([self.lat, np.zeros(len(self.lat))])
+            self.lon = np.concatenate([self.lon, np.zeros(len(self.lon))])
+
+        self.lat[self.size] = np.radians(location.y)
+        self.lon[self.size] = np.radians(location.x)
+
+        location.distance_matrix = self
+        location.distance_index = self.size
+        location.distances = None
+        self.size += 1
+
+
+    @check_args_type
+    def row(self, index: int) -> np.ndarray:
+        """
+        Summary:
+            Calculates the distances from one location to all locations in the matrix,
+            with the same haversine formula as Location.calculateDistance.
+
+        Args:
+            index (int): The index of the location in the matrix.
+
+        Returns:
+            np.ndarray: float32 distances in kilometers, indexed by Location.distance_index.
+        """
+        lat1 = self.lat[index]
+        lon1 = self.lon[index]
+        lat2 = self.lat[: self.size]
+        lon2 = self.lon[: self.size]
+
+        dlon = lon2 - lon1
+        dlat = lat2 - lat1
+
+        a = np.sin(dlat / 2)**2 + np.cos(lat1) * np.cos(lat2) * np.sin(dlon / 2)**2
+        c = 2 * np.arctan2(np.sqrt(a), np.sqrt(1 - a))
+
+        return (self.R * c).astype(np.float32)
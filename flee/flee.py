@@ -8,11 +8,16 @@ import sys
 from typing import List, Optional, Tuple
 
 import numpy as np
-from flee.Diagnostics import write_agents, write_links
+from flee.Diagnostics import AgentColumnWriter, DiagnosticsWriter, write_agents, write_links
 from flee.SimulationSettings import SimulationSettings
 import flee.moving as moving
 import flee.spawning as spawning
 import flee.scoring as scoring
+import flee.crawling as crawling
+import flee.instrumentation as instrumentation
+from flee.agentstore import AgentStore
+from flee.agentattributes import AttributeRecord, attribute_schema
+from flee.distances import DistanceMatrix
 
 if os.getenv("FLEE_TYPE_CHECK") is not None and os.environ["FLEE_TYPE_CHECK"].lower() == "true":
     from beartype import beartype as check_args_type
@@ -73,6 +78,8 @@ class Person:
         self.distance_travelled_on_link = 0
 
         self.attributes=attributes
+        if SimulationSettings.optimisations["AttributeCodes"] is True:
+            self.attributes = attribute_schema.encode(attributes)
         self.route = []
 
         if SimulationSettings.log_levels["agent"] > 0:
@@ -117,13 +124,13 @@ class Person:
         Returns:
             True if the destination camp is full, False otherwise.
         """
-        for i in range(0, len(e.locationNames)):
-            if e.locationNames[i] == self.route[-1]:
-                if e.locations[i].camp and moving.getCapMultiplier(e.locations[i],1) < 0.5:
-                    #print(e.time, e.locationNames[i], self.route[-1], file=sys.stderr)
-                    return True
-                else: 
-                    return False
+        i = e.locationIndex.get(self.route[-1], -1)
+        if i >= 0:
+            if e.locations[i].camp and moving.getCapMultiplier(e.locations[i],1) < 0.5:
+                #print(e.time, e.locationNames[i], self.route[-1], file=sys.stderr)
+                return True
+            else: 
+                return False
         print(f"Error: camp {self.route[-1]} not found in check_dest_is_full_camp", file=sys.stderr)
         sys.exit()
     
@@ -140,16 +147,18 @@ class Person:
             or `None` if the agent's route is empty 
             or the next link is invalid.
         """
-        for l in self.location.links:
-            # If the name of the destination on the current link is same as the agents current waypoint on the route:
-            if l.endpoint.name == self.route[0]:
-                # Check if the destination camp is full, flooded. If so, remove the route and return `None`.
-                if self.check_dest_is_full_camp(e):
-                    self.route = []
-                    return None
-                # Otherwise, remove the first link from the route and return the next link.
-                self.route = self.route[1:]
-                return l
+        # Look up the link whose destination is the agents current waypoint on the route.
+        l = None
+        if len(self.location.links) > 0:
+            l = self.location.links_by_endpoint.get(self.route[0], None)
+        if l is not None:
+            # Check if the destination camp is full, flooded. If so, remove the route and return `None`.
+            if self.check_dest_is_full_camp(e):
+                self.route = []
+                return None
+            # Otherwise, remove the first link from the route and return the next link.
+            self.route = self.route[1:]
+            return l
 
         # Link has vanished, remove route.
         self.route = []
@@ -185,18 +194,36 @@ class Person:
 
             # If the outcome is less than the move chance, then the agent moves.
             if outcome < movechance:
-                # If the agent does not have an existing route, then plan a new route.
-                if len(self.route) == 0:
-                    # Determine which route to take
-                    self.route = moving.selectRoute(self, time=time)
+                self.move(e, time=time)
 
-                # Attempt to follow route. Return None if fail.  
-                chosenDest = self.take_next_step(e)
 
-                # If there is a viable route to a different location, then move to the next location.
-                if chosenDest:
-                    # update location to link endpoint
-                    self.handle_travel(chosenDest, travelling=True)
+    @check_args_type
+    def move(self, e, time: int) -> None:
+        """
+        Summary:
+            Moves the agent onto the next link of its route,
+            planning a new route first if it does not have one.
+
+        Args:
+            e: The ecosystem object.
+            time (int): The current simulation timestep.
+
+        Returns:
+            None.
+        """
+        instrumentation.count("movers")
+        # If the agent does not have an existing route, then plan a new route.
+        if len(self.route) == 0:
+            # Determine which route to take
+            self.route = moving.selectRoute(self, time=time)
+
+        # Attempt to follow route. Return None if fail.  
+        chosenDest = self.take_next_step(e)
+
+        # If there is a viable route to a different location, then move to the next location.
+        if chosenDest:
+            # update location to link endpoint
+            self.handle_travel(chosenDest, travelling=True)
 
 
     @check_args_type
@@ -230,59 +257,182 @@ class Person:
 
             # If destination has been reached.
             if self.distance_travelled_on_link > self.location.get_distance():
+                self.complete_link(e, time=time, todays_travel_speed=todays_travel_speed)
 
-                self.places_travelled += 1
-                # remove the excess km tracked by the
-                # distance_moved_this_timestep var.
-                self.distance_moved_this_timestep += (
-                    self.location.get_distance() - self.distance_travelled_on_link
-                )
 
-                # update agent logs
-                if SimulationSettings.log_levels["agent"] > 0:
-                    self.distance_travelled += self.location.get_distance()
-
-                # if link is closed, bring agent to start point instead of the
-                # destination and return.
-                if self.location.closed is True:
-                    self.handle_travel(self.location.startpoint, travelling=False)
-                else:
-                    # if the person has moved less than the MaxMoveSpeed, it
-                    # should go through another evolve() step in the new
-                    # location.
-                    evolveMore = False
-                    if self.distance_moved_this_timestep < todays_travel_speed:
-                        if SimulationSettings.log_levels["agent"] > 1:
-                            self.locations_visited.append(self.location)
-                        evolveMore = True
-
-                    # update location (which is on a link) to link endpoint
-                    self.handle_travel(self.location.endpoint, travelling=False)
-
-                    if SimulationSettings.log_levels["camp"] > 0:
-                        if self.location.camp is True:
-                            self.location.incoming_journey_lengths += [
-                                self.timesteps_since_departure
-                            ]
-
-                    # Perform another evolve step if needed. And if it results
-                    # in travel, then the current traveled distance needs
-                    # to be taken into account.
-                    # Note MaxMoveSpeed is used here, not todays_travel_speed.
-                    if evolveMore is True:
-                        ForceTownMove = False
-                        if SimulationSettings.move_rules["AvoidShortStints"]:
-                            # Flee 2.0 Changeset 1, factor 2.
-                            if (
-                                self.recent_travel_distance
-                                + (
-                                    self.distance_moved_this_timestep
-                                    / SimulationSettings.move_rules["MaxMoveSpeed"]
-                                )
-                            ) / 2.0 < 0.5:
-                                ForceTownMove = True
-                        self.evolve(e, time=time, ForceTownMove=ForceTownMove)
-                        self.finish_travel(e, time=time)
+    @check_args_type
+    def complete_link(self, e, time: int, todays_travel_speed: float) -> None:
+        """
+        Summary:
+            Moves the agent from the link it travelled on to the endpoint
+            of the link (or back to the startpoint if the link was closed),
+            and lets the agent continue its journey if it has distance left.
+
+        Args:
+            e: The ecosystem object.
+            time (int): The current simulation timestep.
+            todays_travel_speed (float): The distance the agent can travel in this timestep.
+
+        Returns:
+            None.
+        """
+        self.places_travelled += 1
+        # remove the excess km tracked by the
+        # distance_moved_this_timestep var.
+        self.distance_moved_this_timestep += (
+            self.location.get_distance() - self.distance_travelled_on_link
+        )
+
+        # update agent logs
+        if SimulationSettings.log_levels["agent"] > 0:
+            self.distance_travelled += self.location.get_distance()
+
+        # if link is closed, bring agent to start point instead of the
+        # destination and return.
+        if self.location.closed is True:
+            self.handle_travel(self.location.startpoint, travelling=False)
+        else:
+            # if the person has moved less than the MaxMoveSpeed, it
+            # should go through another evolve() step in the new
+            # location.
+            evolveMore = False
+            if self.distance_moved_this_timestep < todays_travel_speed:
+                if SimulationSettings.log_levels["agent"] > 1:
+                    self.locations_visited.append(self.location)
+                evolveMore = True
+
+            # update location (which is on a link) to link endpoint
+            self.handle_travel(self.location.endpoint, travelling=False)
+
+            if SimulationSettings.log_levels["camp"] > 0:
+                if self.location.camp is True:
+                    self.location.incoming_journey_lengths += [
+                        self.timesteps_since_departure
+                    ]
+
+            # Perform another evolve step if needed. And if it results
+            # in travel, then the current traveled distance needs
+            # to be taken into account.
+            # Note MaxMoveSpeed is used here, not todays_travel_speed.
+            if evolveMore is True:
+                ForceTownMove = False
+                if SimulationSettings.move_rules["AvoidShortStints"]:
+                    # Flee 2.0 Changeset 1, factor 2.
+                    if (
+                        self.recent_travel_distance
+                        + (
+                            self.distance_moved_this_timestep
+                            / SimulationSettings.move_rules["MaxMoveSpeed"]
+                        )
+                    ) / 2.0 < 0.5:
+                        ForceTownMove = True
+                self.evolve(e, time=time, ForceTownMove=ForceTownMove)
+                self.finish_travel(e, time=time)
+
+
+def _agent_store_column(name: str, convert):
+    """
+    Summary:
+        Creates a property that reads and writes a column of the AgentStore.
+
+    Args:
+        name (str): name of the column.
+        convert: function converting the stored value to the Person attribute type.
+
+    Returns:
+        property: the property for use in AgentView.
+    """
+    def getter(self):
+        return convert(getattr(self.store, name)[self.index])
+
+    def setter(self, value):
+        getattr(self.store, name)[self.index] = value
+
+    return property(getter, setter)
+
+
+def _agent_store_object_column(name: str):
+    """
+    Summary:
+        Creates a property that reads and writes an object column of the AgentStore.
+
+    Args:
+        name (str): name of the column.
+
+    Returns:
+        property: the property for use in AgentView.
+    """
+    def getter(self):
+        return getattr(self.store, name)[self.index]
+
+    def setter(self, value):
+        getattr(self.store, name)[self.index] = value
+
+    return property(getter, setter)
+
+
+class AgentView(Person):
+    """
+    The AgentView class.
+    Thin view of an agent stored in an AgentStore, providing the
+    same interface as a Person object.
+    """
+
+    __slots__ = ["store", "index"]
+
+    def __init__(self, store, index: int):
+        """
+        Summary: 
+            Initializes a view of an agent in an AgentStore.
+        
+        Args:
+            store (AgentStore): The store holding the agent.
+            index (int): The index of the agent in the store.
+
+        Returns:
+            None.
+        """
+        self.store = store
+        self.index = index
+
+    @property
+    def e(self):
+        return self.store.e
+
+    @property
+    def location(self):
+        return self.store.get_location(self.index)
+
+    @location.setter
+    def location(self, value):
+        self.store.set_location(self.index, value)
+
+    @property
+    def home_location(self):
+        return self.store.e.locations[self.store.home_location[self.index]]
+
+    @home_location.setter
+    def home_location(self, value):
+        self.store.home_location[self.index] = self.store.location_index(value)
+
+    travelling = _agent_store_column("travelling", bool)
+    distance_travelled_on_link = _agent_store_column("distance_travelled_on_link", float)
+    distance_moved_this_timestep = _agent_store_column("distance_moved_this_timestep", float)
+    recent_travel_distance = _agent_store_column("recent_travel_distance", float)
+    timesteps_since_departure = _agent_store_column("timesteps_since_departure", int)
+    places_travelled = _agent_store_column("places_travelled", int)
+    distance_travelled = _agent_store_column("distance_travelled", float)
+    route = _agent_store_object_column("route")
+    locations_visited = _agent_store_object_column("locations_visited")
+
+    @property
+    def attributes(self):
+        return self.store.attributes[self.index]
+
+    @attributes.setter
+    def attributes(self, value):
+        self.store.attributes[self.index] = value
+        self.store.move_chance_class[self.index] = -1
 
 
 class Location:
@@ -330,7 +480,14 @@ class Location:
         self.y = y
         self.movechance = movechance
         self.links = []  # paths connecting to other towns
+        self.links_by_endpoint = {}  # endpoint name -> first link in self.links leading to it.
         self.routes = {}  # if Location-based routing is enabled, this will contain routes to other towns (may have multiple steps).
+        self.route_cache = {}  # if the RouteCache optimisation is enabled, this will contain the route weights computed in this time step.
+        self.route_tree = None  # if the RouteTreeEngine is enabled, this will contain the flattened route tree of this location.
+        self.route_topology = None  # if the IncrementalRoutes optimisation is enabled, this will contain the crawled routes of this location, without weights.
+        self.distance_matrix = None  # if the DistanceMatrix optimisation is enabled, this will contain the DistanceMatrix of the Ecosystem.
+        self.distance_index = -1
+        self.distances = None  # distances to all other locations, computed when first needed.
         self.major_routes = []  # paths connecting to other towns
         # paths connecting to other towns that are closed.
         self.closed_links = []
@@ -408,6 +565,24 @@ class Location:
         self.print()
 
 
+    @check_args_type
+    def index_links(self) -> None:
+        """
+        Summary:
+            Rebuilds the lookup table of links by endpoint name.
+            Needs to be called whenever self.links is changed.
+
+        Args:
+            None.
+
+        Returns:
+            None.
+        """
+        self.links_by_endpoint = {}
+        for l in self.links:
+            self.links_by_endpoint.setdefault(l.endpoint.name, l)
+
+
     @check_args_type
     def calculateDistance(self, other_location) -> float:
         """
@@ -422,6 +597,11 @@ class Location:
             The distance between this location and the other location in kilometers.
 
         """
+        if self.distance_matrix is not None and other_location.distance_matrix is self.distance_matrix:
+            if self.distances is None or other_location.distance_index >= len(self.distances):
+                self.distances = self.distance_matrix.row(self.distance_index)
+            return float(self.distances[other_location.distance_index])
+
         # Approximate radius of earth in km
         R = 6371.0
 
@@ -673,6 +853,7 @@ class Link:
         self.cumNumAgents = 0 # cumulative # of agents
         if SimulationSettings.log_levels["link"] > 1:
             self.cumNumAgentsByAttribute = {}
+            self.cumNumAgentsByRecord = {} # agents with shared attribute records, counted per record.
         # refugee population on current rank (for pflee).
         self.numAgentsOnRank = 0
 
@@ -729,6 +910,10 @@ class Link:
         self.cumNumAgents += 1
 
         if SimulationSettings.log_levels["link"] > 1:
+            if isinstance(agent.attributes, AttributeRecord):
+                key = agent.attributes.codes
+                self.cumNumAgentsByRecord[key] = self.cumNumAgentsByRecord.get(key, 0) + 1
+                return
             for a in agent.attributes:
                 category = self.cumNumAgentsByAttribute.get(a, {})
                 category[agent.attributes[a]] = category.get(agent.attributes[a], 0) + 1
@@ -736,6 +921,23 @@ class Link:
             #print(category, file=sys.stderr)
 
 
+    @check_args_type
+    def getCumNumAgentsByAttribute(self) -> dict:
+        """
+        Summary:
+            Returns the cumulative number of agents on the link per attribute value.
+
+        Args:
+            None.
+
+        Returns:
+            dict: The number of agents per attribute name and value.
+        """
+        if len(self.cumNumAgentsByRecord) == 0:
+            return self.cumNumAgentsByAttribute
+        return attribute_schema.count_by_attribute(self.cumNumAgentsByRecord, self.cumNumAgentsByAttribute)
+
+
     @check_args_type
     def setAttribute(self, name: str, value) -> None:
         """
@@ -787,13 +989,40 @@ class Ecosystem:
         """
         self.locations = []
         self.locationNames = []
+        self.locationIndex = {}  # location name -> index in self.locations.
         self.agents = []
+        # Binomial thinning only saves work when residents are found without visiting every agent.
+        if SimulationSettings.optimisations["AgentStore"] is True or SimulationSettings.optimisations["BinomialThinning"] is True:
+            self.agents = AgentStore(self, AgentView)
         self.closures = []  # format [type, source, dest, start, end]
+        # Closures by the days on which they start or end (EventSchedules optimisation only).
+        self.closure_schedule = None
+        self.closure_schedule_source = (None, 0)
         self.time = 0
         self.print_location_output = True  # print location output data
 
         # FLEE3 does not have a conflict zone list, and spawn weights cover all locations.
         self.spawn_weights = np.array([])
+        # Set when locations are added without refreshing the spawn weights (VectorizedSpawnWeights only).
+        self.spawn_weights_outdated = False
+        # Cumulative distribution of the spawn weights, and the weights it was built from.
+        self.spawn_cdf = None
+        self.spawn_cdf_weights = None
+
+        # Scores of all locations, one row per location. Location.scores are views of the rows.
+        self.location_scores = np.ones((0, 4))
+
+        # Coordinates of all locations, for distances between them (DistanceMatrix optimisation only).
+        self.location_distances = DistanceMatrix()
+
+        # Random number generator for batched route choice, created when first needed.
+        self.rng = None
+
+        # Output files for agent and link logging, opened when first written.
+        self.agent_writer = DiagnosticsWriter("agents.out.0")
+        self.link_writer = DiagnosticsWriter("links.out.0")
+        self.agent_column_writer = AgentColumnWriter("agents.columns.0")
+        self.profiler = instrumentation.StepProfiler()
 
         if SimulationSettings.log_levels["camp"] > 0:
             self.num_arrivals = []  # one element per time step.
@@ -893,7 +1122,7 @@ class Ecosystem:
         """
         # print("Enact border closures: ", self.closures)
         if len(self.closures) > 0:
-            for c in self.closures:
+            for c in self.get_closures_due(time):
                 if time == c[3]:
                     if c[0] == "country":
                         if Debug:
@@ -935,6 +1164,56 @@ class Ecosystem:
                         self.set_forced_redirection(c[1], c[2], True)
 
 
+    @check_args_type
+    def get_closures_due(self, time: int) -> list:
+        """
+        Summary:
+            Returns the closures that start or end at a given time, in the order of the
+            list of closures. Without the EventSchedules optimisation, all closures are returned.
+            The schedule is built again whenever the list of closures is replaced or extended.
+
+        Args:
+            time (int): The current time.
+
+        Returns:
+            list: closures in the format [type, source, dest, start, end].
+        """
+        if SimulationSettings.optimisations["EventSchedules"] is not True:
+            return self.closures
+
+        source = self.closure_schedule_source
+        if source[0] is not self.closures or source[1] != len(self.closures):
+            self.closure_schedule = {}
+            for c in self.closures:
+                self.closure_schedule.setdefault(c[3], []).append(c)
+                if c[4] != c[3]:
+                    self.closure_schedule.setdefault(c[4], []).append(c)
+            self.closure_schedule_source = (self.closures, len(self.closures))
+
+        return self.closure_schedule.get(time, [])
+
+
+    @check_args_type
+    def clear_route_caches(self, topology: bool = False) -> None:
+        """
+        Summary: 
+            Invalidates the cached route weights of all locations.
+            Needs to be called whenever location scores or the link
+            topology change.
+
+        Args:
+            topology (bool, optional): Whether the link topology has changed, in which case route trees are invalidated too. Defaults to False.
+
+        Returns:
+            None.
+        """
+        for loc in self.locations:
+            loc.route_cache = {}
+
+        if topology:
+            moving.invalidateRouteTrees()
+
+
     @check_args_type
     def _convert_location_name_to_index(self, name: str) -> int:
         """
@@ -947,11 +1226,8 @@ class Ecosystem:
         Returns:
             int: The index of the location in the `locations` list, or -1 if the location is not found.
         """
-        x = -1
         # Convert name "startpoint" to index "x".
-        for i, loc in enumerate(self.locations):
-            if loc.name == name:
-                x = i
+        x = self.locationIndex.get(name, -1)
 
         # for i in range(0, len(self.locations)):
         #     if self.locations[i].name == name:
@@ -1006,6 +1282,9 @@ class Ecosystem:
             removed = True
 
         self.locations[x].links = new_links
+        self.locations[x].index_links()
+        if removed:
+            self.clear_route_caches(topology=True)
         if not removed:
             print(
                 "Warning: cannot remove link from {}, "
@@ -1057,6 +1336,9 @@ class Ecosystem:
                 reopened = True
 
         self.locations[x].closed_links = new_closed_links
+        self.locations[x].index_links()
+        if reopened:
+            self.clear_route_caches(topology=True)
         if not reopened:
             print(
                 "Warning: cannot reopen link from {},"
@@ -1372,6 +1654,7 @@ class Ecosystem:
             None.
         """     
         self.locations[self._convert_location_name_to_index(location_name)].close_camp(IDP)
+        self.clear_route_caches(topology=True)
         print("Time = {}. Close camp {}, IDP: {}.".format(self.time, location_name, IDP), file=sys.stderr)
 
 
@@ -1429,6 +1712,8 @@ class Ecosystem:
                 file=sys.stderr
             )
 
+        self.clear_route_caches(topology=True)
+
         print(f"Time = {self.time}. Location {location_name} changed type to {location_type}.", file=sys.stderr)
 
 
@@ -1446,6 +1731,7 @@ class Ecosystem:
             None.
         """
         self.locations[self._convert_location_name_to_index(location_name)].open_camp(IDP)
+        self.clear_route_caches(topology=True)
         print("Time = {}. Open camp {}, IDP: {}.".format(self.time, location_name, IDP), file=sys.stderr)
 
 
@@ -1616,6 +1902,9 @@ class Ecosystem:
         Returns:
             list[Location]: A list of unique locations.
         """
+        if SimulationSettings.optimisations["VectorizedSpawnWeights"] is True:
+            return [self.locations[i] for i in self.pick_spawn_location_indices(number)]
+
         spawn_weight_total = sum(self.spawn_weights)
 
         assert spawn_weight_total > 0
@@ -1627,6 +1916,36 @@ class Ecosystem:
         ).tolist()
 
 
+    @check_args_type
+    def pick_spawn_location_indices(self, number: int = 1) -> np.ndarray:
+        """
+        Summary:
+            Returns the indices of weighted random locations, drawn in the same way as
+            pick_spawn_locations. The cumulative distribution of the spawn weights is
+            kept, and only rebuilt when the spawn weights change.
+
+        Args:
+            number (int, optional): The number of locations to sample. Defaults to 1.
+
+        Returns:
+            np.ndarray: indices of the locations in Ecosystem.locations.
+        """
+        if self.spawn_weights_outdated:
+            spawning.refresh_spawn_weights(self)
+
+        if self.spawn_cdf is None or not np.array_equal(self.spawn_weights, self.spawn_cdf_weights):
+            spawn_weight_total = np.cumsum(self.spawn_weights)[-1] if len(self.spawn_weights) > 0 else 0
+
+            assert spawn_weight_total > 0
+
+            # Same cumulative distribution as np.random.choice.
+            self.spawn_cdf = (self.spawn_weights / spawn_weight_total).cumsum()
+            self.spawn_cdf /= self.spawn_cdf[-1]
+            self.spawn_cdf_weights = self.spawn_weights.copy()
+
+        return self.spawn_cdf.searchsorted(np.random.random_sample(number), side="right")
+
+
     @check_args_type
     def evolve(self) -> None:
         """
@@ -1639,56 +1958,191 @@ class Ecosystem:
         Returns:
             None.
         """
+        self.profiler.start_step()
+
         spawning.refresh_spawn_weights(self) # Required to correctly incorporate TakeFromPopulation and ConflictSpawnDecay.
+        self.profiler.lap("spawn_weights")
         
         # update location scores
-        for loc in self.locations:
-            loc.routes = {}
-            scoring.updateLocationScore(self.time, loc)
+        if SimulationSettings.optimisations["VectorizedScoring"] is True:
+            self.update_location_scores()
+        else:
+            for loc in self.locations:
+                loc.routes = {}
+                scoring.updateLocationScore(self.time, loc)
+
+        self.clear_route_caches()
+        self.profiler.lap("scores")
 
         # update agent locations
-        for a in self.agents:
+        if isinstance(self.agents, AgentStore):
             if SimulationSettings.log_levels["agent"] > 1:
-                a.locations_visited = []
-            if a.location is not None:
-                a.evolve(self, time=self.time)
+                self.agents.reset_locations_visited()
+            self.agents.evolve(self, time=self.time)
+            self.profiler.lap("evolve")
+            self.agents.finish_travel(self, time=self.time)
+        else:
+            if SimulationSettings.optimisations["BatchedRouteChoice"] is True:
+                if SimulationSettings.log_levels["agent"] > 1:
+                    for a in self.agents:
+                        a.locations_visited = []
+                self.evolve_agents_batched()
+            else:
+                for a in self.agents:
+                    if SimulationSettings.log_levels["agent"] > 1:
+                        a.locations_visited = []
+                    if a.location is not None:
+                        a.evolve(self, time=self.time)
+            self.profiler.lap("evolve")
 
-        for a in self.agents:
-            if a.location is not None:
-                a.finish_travel(self, time=self.time)
-                a.timesteps_since_departure += 1
-        
+            for a in self.agents:
+                if a.location is not None:
+                    a.finish_travel(self, time=self.time)
+                    a.timesteps_since_departure += 1
+        self.profiler.lap("finish_travel")
 
         if SimulationSettings.log_levels["agent"] > 0:
-            write_agents(agents=self.agents, time=self.time)
+            if SimulationSettings.log_levels["agent_format"] == "columnar":
+                self.agent_column_writer.write_step(agents=self.agents, time=self.time)
+            else:
+                write_agents(agents=self.agents, time=self.time, writer=self.agent_writer)
 
         if SimulationSettings.log_levels["link"] > 0:
-            write_links(locations=self.locations, time=self.time)
+            write_links(locations=self.locations, time=self.time, writer=self.link_writer)
+        self.profiler.lap("logging")
 
-        for a in self.agents:
-            a.recent_travel_distance = (
-                a.recent_travel_distance
-                + (a.distance_moved_this_timestep / SimulationSettings.move_rules["MaxMoveSpeed"])
-            ) / 2.0
-            a.distance_moved_this_timestep = 0
+        if isinstance(self.agents, AgentStore):
+            self.agents.update_travel_history()
+        else:
+            for a in self.agents:
+                a.recent_travel_distance = (
+                    a.recent_travel_distance
+                    + (a.distance_moved_this_timestep / SimulationSettings.move_rules["MaxMoveSpeed"])
+                ) / 2.0
+                a.distance_moved_this_timestep = 0
+        self.profiler.lap("travel_history")
 
         # update link properties
         if SimulationSettings.log_levels["camp"] > 0:
             self._aggregate_arrivals()
+        self.profiler.lap("arrivals")
 
         # Deactivate agents in camps with a certain probability.
         if SimulationSettings.spawn_rules["camps_are_sinks"] == True:
-            for a in self.agents:
-                if a.travelling == False:
-                    if a.location is not None:
-                        if a.location.camp == True:
-                            outcome = random.random()
-                            if outcome < a.location.attributes.get("deactivation_probability", 0.0):
-                                a.location = None
-
+            if isinstance(self.agents, AgentStore):
+                self.agents.deactivate_in_camps(self)
+            else:
+                for a in self.agents:
+                    if a.travelling == False:
+                        if a.location is not None:
+                            if a.location.camp == True:
+                                outcome = random.random()
+                                if outcome < a.location.attributes.get("deactivation_probability", 0.0):
+                                    a.location = None
+        self.profiler.lap("sinks")
+
+        self.profiler.end_step(self.time, agents=len(self.agents))
         self.time += 1
 
 
+    @check_args_type
+    def close(self) -> None:
+        """
+        Summary:
+            Closes the agent, link and timing output files.
+            Should be called once the simulation has finished.
+
+        Args:
+            None.
+
+        Returns:
+            None.
+        """
+        self.agent_writer.close()
+        self.link_writer.close()
+        self.agent_column_writer.close()
+        self.profiler.close()
+
+
+    @check_args_type
+    def _get_rng(self):
+        """
+        Summary: 
+            Returns the NumPy random number generator of the ecosystem,
+            creating it from the global NumPy random state when first needed.
+            In the parallel version, all ranks need to call this at the same point
+            in the simulation, so that their global random states stay identical.
+
+        Args:
+            None.
+
+        Returns:
+            numpy.random.Generator: The random number generator.
+        """
+        if self.rng is None:
+            self.rng = np.random.default_rng(np.random.randint(0, 2**31 - 1))
+        return self.rng
+
+
+    @check_args_type
+    def select_routes_batched(self, agents) -> None:
+        """
+        Summary: 
+            Plans routes for all agents without a route, using a single
+            draw for all agents with the same location and route cache key.
+
+        Args:
+            agents: The agents that are about to move.
+
+        Returns:
+            None.
+        """
+        rng = self._get_rng()
+
+        route_groups = {}
+        for a in agents:
+            if len(a.route) == 0:
+                route_groups.setdefault((a.location, moving.getRouteCacheKey(a, self.time)), []).append(a)
+
+        for group in route_groups.values():
+            moving.selectRoutes(group, time=self.time, rng=rng)
+
+
+    @check_args_type
+    def evolve_agents_batched(self) -> None:
+        """
+        Summary: 
+            Batched version of calling Person.evolve() for all agents.
+            Agents are grouped by location (and by the attributes that
+            affect their move chance), and the move decisions of each group
+            are drawn at once. Binomial thinning keeps agents in an AgentStore
+            instead (see AgentStore.evolve).
+
+        Args:
+            None.
+
+        Returns:
+            None.
+        """
+        groups = {}
+        for a in self.agents:
+            if a.location is not None and a.travelling is False:
+                groups.setdefault((a.location, moving.getMoveChanceClass(a)), []).append(a)
+
+        rng = self._get_rng()
+        movers = []
+        for group in groups.values():
+            movechance = min(1.0, moving.calculateMoveChance(group[0], False, self.time))
+            outcomes = rng.random(len(group)) < movechance
+            movers += [a for a, outcome in zip(group, outcomes) if outcome]
+
+        if SimulationSettings.optimisations["BatchedRouteChoice"] is True:
+            self.select_routes_batched(movers)
+
+        for a in movers:
+            a.move(self, time=self.time)
+
+
     @check_args_type
     def addLocation(
         self,
@@ -1744,11 +2198,71 @@ class Ecosystem:
         self.locations.append(loc)
         self.spawn_weights = np.append(self.spawn_weights, [0.0])
         self.locationNames.append(loc.name)
-
-        spawning.refresh_spawn_weights(self)
+        self.locationIndex[loc.name] = len(self.locations) - 1
+        self._add_location_scores(loc)
+        if SimulationSettings.optimisations["DistanceMatrix"] is True:
+            self.location_distances.add_location(loc)
+
+        if SimulationSettings.optimisations["VectorizedSpawnWeights"] is True:
+            # Refreshed once after loading (see StoreInputGeographyInEcosystem), or when first needed.
+            self.spawn_weights_outdated = True
+        else:
+            spawning.refresh_spawn_weights(self)
         return loc
 
 
+    @check_args_type
+    def _add_location_scores(self, loc) -> None:
+        """
+        Summary:
+            Moves the scores of a new location into a row of Ecosystem.location_scores,
+            and makes Location.scores a view of that row (private function).
+            The array grows by doubling, in which case all views are renewed.
+
+        Args:
+            loc (Location): The location that was just added to self.locations.
+
+        Returns:
+            None.
+        """
+        n = len(self.locations)
+        if n > len(self.location_scores):
+            grown = np.ones((max(2 * len(self.location_scores), 16), self.location_scores.shape[1]))
+            grown[: n - 1] = self.location_scores[: n - 1]
+            self.location_scores = grown
+            for i in range(0, n - 1):
+                self.locations[i].scores = grown[i]
+
+        self.location_scores[n - 1] = loc.scores
+        loc.scores = self.location_scores[n - 1]
+
+
+    @check_args_type
+    def update_location_scores(self) -> None:
+        """
+        Summary:
+            Updates the scores of all locations at once with scoring.computeLocationScores,
+            instead of calling scoring.updateLocationScore for every location.
+            Route tables (FixedRoutes) are generated after all scores have been updated.
+
+        Args:
+            None.
+
+        Returns:
+            None.
+        """
+        n = len(self.locations)
+        self.location_scores[:n, 0] = 1.0
+        self.location_scores[:n, 1] = scoring.computeLocationScores(self.time, self.locations)
+
+        for loc in self.locations:
+            loc.routes = {}
+
+        if SimulationSettings.move_rules["FixedRoutes"] is True:
+            for loc in self.locations:
+                crawling.generateLocationRoutes(loc, self.time)
+
+
     @check_args_type
     def addAgent(self, location, attributes) -> None:
         """
@@ -1776,6 +2290,61 @@ class Ecosystem:
         self.agents.append(Person(location=location, attributes=attributes))
 
 
+    @check_args_type
+    def addAgents(self, location, count: int, attributes_batch: Optional[list] = None) -> None:
+        """
+        Summary: 
+            Adds a number of agents to the simulation at the specified location.
+            Equivalent to calling addAgent for each agent, but the population
+            bookkeeping is done once for all agents.
+
+        Args:
+            location (Location): The location to add the agents to.
+            count (int): The number of agents to add.
+            attributes_batch (list, optional): A list of attribute dictionaries, one per agent. Defaults to empty attributes.
+
+        Returns:
+            None.
+        """
+        if count <= 0:
+            return
+
+        if SimulationSettings.spawn_rules["TakeFromPopulation"]:
+            taken = min(count, max(location.pop, 0))
+            location.pop -= taken
+            if taken < count:
+                print(
+                    "WARNING: Number of agents in the simulation is larger than the"
+                    "population of the conflict zone."
+                )
+                location.print()
+            location.numAgentsSpawned += count
+
+        if attributes_batch is None:
+            attributes_batch = [{} for _ in range(0, count)]
+        self._append_agents(location, attributes_batch)
+
+
+    @check_args_type
+    def _append_agents(self, location, attributes_batch: list) -> None:
+        """
+        Summary: 
+            Creates one agent per attribute dictionary at the specified location
+            (private function, use addAgents or insertAgents instead).
+
+        Args:
+            location (Location): The location to create the agents at.
+            attributes_batch (list): A list of attribute dictionaries, one per agent.
+
+        Returns:
+            None.
+        """
+        if isinstance(self.agents, AgentStore):
+            self.agents.append_batch(location, attributes_batch)
+        else:
+            self.agents += [Person(location=location, attributes=attributes) for attributes in attributes_batch]
+
+
     @check_args_type
     def insertAgent(self, location, attributes={}) -> None:
         """
@@ -1793,7 +2362,7 @@ class Ecosystem:
 
 
     @check_args_type
-    def insertAgents(self, location, number: int) -> None:
+    def insertAgents(self, location, number: int, attributes_batch: Optional[list] = None) -> None:
         """
         Summary: 
             Inserts a specified number of agents into the simulation
@@ -1802,12 +2371,14 @@ class Ecosystem:
         Args:
             location (Location): The location to insert the agents at.
             number (int): The number of agents to insert.
+            attributes_batch (list, optional): A list of attribute dictionaries, one per agent. Defaults to empty attributes.
 
         Returns:
             None.
         """
-        for _ in range(0, number):
-            self.insertAgent(location=location)
+        if attributes_batch is None:
+            attributes_batch = [{} for _ in range(0, number)]
+        self._append_agents(location, attributes_batch)
 
 
     @check_args_type
@@ -1823,6 +2394,15 @@ class Ecosystem:
         Returns:
             None.
         """
+        if isinstance(self.agents, AgentStore):
+            removed = np.zeros(len(self.agents), dtype=bool)
+            for i, a in enumerate(self.agents):
+                if a.location.name in location_names:
+                    a.location.DecrementNumAgents()
+                    removed[i] = True
+            self.agents.remove(removed)
+            return
+
         new_agents = []
         for i in range(0, len(self.agents)):
             if self.agents[i].location.name not in location_names:
@@ -1910,13 +2490,8 @@ class Ecosystem:
         Returns:
             None.
         """
-        endpoint1_index = -1
-        endpoint2_index = -1
-        for i in range(0, len(self.locationNames)):
-            if self.locationNames[i] == endpoint1:
-                endpoint1_index = i
-            if self.locationNames[i] == endpoint2:
-                endpoint2_index = i
+        endpoint1_index = self.locationIndex.get(endpoint1, -1)
+        endpoint2_index = self.locationIndex.get(endpoint2, -1)
 
         if endpoint1_index < 0:
             print("Diagnostic: Ecosystem.locationNames: ", self.locationNames, file=sys.stderr)
@@ -1949,6 +2524,12 @@ class Ecosystem:
             )
         )
 
+        for loc in [self.locations[endpoint1_index], self.locations[endpoint2_index]]:
+            loc.links_by_endpoint.setdefault(loc.links[-1].endpoint.name, loc.links[-1])
+
+        # Route trees are rebuilt lazily, so this is cheap while setting up the graph.
+        moving.invalidateRouteTrees()
+
 
     @check_args_type
     def printInfo(self) -> None:
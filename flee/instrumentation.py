@@ -0,0 +1,147 @@
+import json
+import os
+import time
+from flee.SimulationSettings import SimulationSettings
+
+if os.getenv("FLEE_TYPE_CHECK") is not None and os.environ["FLEE_TYPE_CHECK"].lower() == "true":
+    from beartype import beartype as check_args_type
+else:
+    def check_args_type(func):
+        return func
+
+# Per-phase timers and counters for Ecosystem.evolve, enabled with log_levels: timing.
+# Counters are module-level, so that the movement and MPI code can increment them
+# without access to the Ecosystem.
+
+enabled = False
+counters = {}
+
+
+def count(name: str, n: int = 1) -> None:
+    """
+    Summary:
+        Increments a counter of the current time step, if instrumentation is enabled.
+
+    Args:
+        name (str): name of the counter
+        n (int, optional): amount to add. Defaults to 1.
+
+    Returns:
+        None.
+    """
+    if enabled:
+        counters[name] = counters.get(name, 0) + n
+
+
+class StepProfiler:
+    """
+    The StepProfiler class.
+    Records the wall time of each phase of a time step (the time between
+    consecutive calls of lap()), together with the counters incremented
+    during the step, and writes one JSON line per step to timing.out.<rank>.
+    """
+
+    @check_args_type
+    def __init__(self, rank: int = 0):
+        """
+        Summary:
+            Initializes a profiler. The output file is opened when the first step is written.
+
+        Args:
+            rank (int, optional): rank of the MPI process
+
+        Returns:
+            None.
+        """
+        self.rank = rank
+        self.filename = "timing.out.%s" % rank
+        self.file = None
+        self.phases = {}
+        self.step_start = 0.0
+        self.last_lap = 0.0
+
+
+    @check_args_type
+    def start_step(self) -> None:
+        """
+        Summary:
+            Starts timing a new step, and resets the phase times and counters.
+            Instrumentation is enabled when log_levels: timing is larger than 0.
+
+        Args:
+            None.
+
+        Returns:
+            None.
+        """
+        global enabled
+        enabled = SimulationSettings.log_levels["timing"] > 0
+        if not enabled:
+            return
+        self.phases = {}
+        counters.clear()
+        self.step_start = time.perf_counter()
+        self.last_lap = self.step_start
+
+
+    def lap(self, name: str) -> None:
+        """
+        Summary:
+            Adds the wall time since the previous lap (or the start of the step) to a phase.
+
+        Args:
+            name (str): name of the phase that just ended
+
+        Returns:
+            None.
+        """
+        if not enabled:
+            return
+        now = time.perf_counter()
+        self.phases[name] = self.phases.get(name, 0.0) + now - self.last_lap
+        self.last_lap = now
+
+
+    @check_args_type
+    def end_step(self, step: int, **extra_counters) -> None:
+        """
+        Summary:
+            Writes the phase times and counters of the step as one JSON line.
+
+        Args:
+            step (int): the time step
+            extra_counters: additional counters, e.g. the number of agents on this rank.
+
+        Returns:
+            None.
+        """
+        if not enabled:
+            return
+        if self.file is None:
+            mode = "w" if step == 0 else "a"
+            self.file = open(self.filename, mode, encoding="utf-8")
+
+        record = {"time": step, "rank": self.rank, "total": time.perf_counter() - self.step_start}
+        record.update(self.phases)
+        record.update(counters)
+        record.update(extra_counters)
+        self.file.write(json.dumps(record))
+        self.file.write("\n")
+        self.file.flush()
+
+
+    @check_args_type
+    def close(self) -> None:
+        """
+        Summary:
+            Closes the output file.
+
+        Args:
+            None.
+
+        Returns:
+            None.
+        """
+        if self.file is not None:
+            self.file.close()
+            self.file = None
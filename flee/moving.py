@@ -4,6 +4,7 @@ import numpy as np
 import random
 from beartype.typing import List, Optional, Tuple
 from flee.SimulationSettings import SimulationSettings
+import flee.instrumentation as instrumentation
 
 if os.getenv("FLEE_TYPE_CHECK") is not None and os.environ["FLEE_TYPE_CHECK"].lower() == "true":
     from beartype import beartype as check_args_type
@@ -76,9 +77,6 @@ def getEndPointScore(agent, endpoint, time) -> float:
               if forecast_end_time is not None:
                 if (forecast_timescale > 1.0) and (time <= forecast_end_time): 
               
-                  #Set the base forecast value
-                  flood_forecast_base = 0.0 #no forecast, no flooding 
-
                   #Get the agents awareness level of the flood forecast
                   #Weighting of each awareness level defined in simsetting.yml
                   #Fraction of population with each level of flood awareness defined in demographics_floodawareness.csv 
@@ -87,34 +85,8 @@ def getEndPointScore(agent, endpoint, time) -> float:
                   # agents decision making process. 
                   agent_awareness_weight = float(SimulationSettings.move_rules["FloodAwarenessWeights"][int(agent.attributes["floodawareness"])])
 
-                  #Forecast loop: iterate over the location flood level weights for the forecast timescale
-                  for x in range(1, forecast_timescale + 1): #iterates over the 5 day forecast, ignoring the current day
-
-                      #the day of the forcast we're considering 
-                      forecast_day = time + x 
-
-                      #If the simulation length is less than the end of the forecast, then the forecast will be shorter
-                      if forecast_day >= forecast_end_time:
-                          #set the forecast day to the end of the simulation
-                          forecast_day = forecast_end_time #same as time + x
-                    
-                      #get the forecast flood level for location on the day we're considering in the for loop
-                      forecast_flood_level = endpoint.attributes.get("forecast_flood_levels",0)[forecast_day]
-
-                      # if it's not zero, then we need to modify the base forecast value, otherwise leave the base as it will zero.
-                      if forecast_flood_level > 0.0: 
-                        #get the endpoint locations current flood level weight based on that flood level.
-                        forecast_flood_level_weight = float(SimulationSettings.move_rules["FloodLocWeights"][forecast_flood_level]) 
-                        
-                        #get the current flood forecaster weight e.g. how important the current day is in the forecast
-                        flood_forecaster_weight = float(SimulationSettings.move_rules["FloodForecasterWeights"][forecast_day])
-                      
-                        #modify the flood_forecast_base using the flood level on the current day and the imporatance of the current day in the forecast loop
-                        flood_forecast_base += forecast_flood_level_weight * flood_forecaster_weight
-
-                      #break the loop if we've reached the end of the forecast data 
-                      if forecast_day == forecast_end_time:
-                        break
+                  #Sum of the weighted forecast flood levels over the forecast timescale
+                  flood_forecast_base = getForecastFloodSum(endpoint, time)
                     
                   #the flood_forecast_base now represents the total weight of the flooding during the forecast for the endpoint location,
                   # this needed to be divided by the total number of days in the forecast to get the average weight based on the severity and relative imporatance of the forecasted days
@@ -371,9 +343,6 @@ def calculateMoveChance(a, ForceTownMove: bool, time) -> float:
             if forecast_end_time is not None:
               if (forecast_timescale > 1.0) and (time <= forecast_end_time): 
                 
-                #Set the base forecast value
-                flood_forecast_base = 0.0 #no forecast, no flooding 
-
                 #Set the default movechance value
                 flood_forecast_movechance = 0.0 #no forecast, no flooding
 
@@ -386,34 +355,8 @@ def calculateMoveChance(a, ForceTownMove: bool, time) -> float:
                 agent_awareness_weight = float(SimulationSettings.move_rules["FloodAwarenessWeights"][int(a.attributes["floodawareness"])])
          
 
-                #Forecast loop: iterate over the location flood level weights for the forecast timescale
-                for x in range(1, forecast_timescale + 1): #iterates over the 5 day forecast, ignoring the current day
-
-                    #the day of the forcast we're considering 
-                    forecast_day = time + x 
-
-                    #If the simulation length is less than the end of the forecast, then the forecast will be shorter
-                    if forecast_day >= forecast_end_time:
-                        #set the forecast day to the end of the simulation
-                        forecast_day = forecast_end_time #same as time + x
-                  
-                    #get the forecast flood level for location on the day we're considering in the for loop
-                    forecast_flood_level = int(a.location.attributes.get("forecast_flood_levels",0)[forecast_day])
-
-                    # if it's not zero, then we need to modify the base forecast value, otherwise leave the base as it will zero.
-                    if forecast_flood_level > 0.0: 
-                      #get the endpoint locations current flood level weight based on that flood level.
-                      forecast_flood_level_weight = float(SimulationSettings.move_rules["FloodLocWeights"][forecast_flood_level]) 
-                      
-                      #get the current flood forecaster weight e.g. how important the current day is in the forecast
-                      flood_forecaster_weight = float(SimulationSettings.move_rules["FloodForecasterWeights"][forecast_day])
-                    
-                      #modify the flood_forecast_base using the flood level on the current day and the imporatance of the current day in the forecast loop
-                      flood_forecast_base += forecast_flood_level_weight * flood_forecaster_weight
-
-                    #break the loop if we've reached the end of the forecast data 
-                    if forecast_day == forecast_end_time:
-                      break
+                #Sum of the weighted forecast flood levels over the forecast timescale
+                flood_forecast_base = getForecastFloodSum(a.location, time)
 
                 #the flood_forecast_base now represents the total weight of the flooding during the forecast for the endpoint location,
                 # this needed to be divided by the total number of days in the forecast to get the average weight based on the severity and relative imporatance of the forecasted days
@@ -435,6 +378,123 @@ def calculateMoveChance(a, ForceTownMove: bool, time) -> float:
     return movechance
 
 
+def getMoveChanceClass(a):
+    """
+    Summary:
+        Returns the agent attribute that calculateMoveChance depends on,
+        so that agents in the same location and class share a move chance.
+
+    Args:
+        a: Agent
+
+    Returns:
+        int: flood awareness of the agent if the flood forecaster is enabled, otherwise None.
+    """
+    if SimulationSettings.move_rules["FloodRulesEnabled"] is True and SimulationSettings.move_rules["FloodForecaster"] is True:
+        return int(a.attributes["floodawareness"])
+    return None
+
+
+def getForecastFloodSum(location, time: int) -> float:
+    """
+    Summary:
+        Sums the forecast flood level weights of a location over the forecast timescale,
+        weighted by the importance of each forecast day.
+        Uses the precomputed row of the location when it is available.
+
+    Args:
+        location (Location): location to sum the forecast for
+        time (int): current time step
+
+    Returns:
+        float: weighted sum of the forecast flood levels
+    """
+    if SimulationSettings.optimisations["FloodForecastTable"] is True:
+        forecast_flood_sums = location.attributes.get("forecast_flood_sums", None)
+        if forecast_flood_sums is not None:
+            return float(forecast_flood_sums[time])
+
+    forecast_timescale = SimulationSettings.move_rules["FloodForecasterTimescale"]
+    forecast_end_time = SimulationSettings.move_rules["FloodForecasterEndTime"]
+
+    #Set the base forecast value
+    flood_forecast_base = 0.0 #no forecast, no flooding
+
+    #Forecast loop: iterate over the location flood level weights for the forecast timescale
+    for x in range(1, forecast_timescale + 1): #iterates over the 5 day forecast, ignoring the current day
+
+        #the day of the forcast we're considering
+        forecast_day = time + x
+
+        #If the simulation length is less than the end of the forecast, then the forecast will be shorter
+        if forecast_day >= forecast_end_time:
+            #set the forecast day to the end of the simulation
+            forecast_day = forecast_end_time #same as time + x
+
+        #get the forecast flood level for location on the day we're considering in the for loop
+        forecast_flood_level = int(location.attributes.get("forecast_flood_levels",0)[forecast_day])
+
+        # if it's not zero, then we need to modify the base forecast value, otherwise leave the base as it will zero.
+        if forecast_flood_level > 0.0:
+            #get the endpoint locations current flood level weight based on that flood level.
+            forecast_flood_level_weight = float(SimulationSettings.move_rules["FloodLocWeights"][forecast_flood_level])
+
+            #get the current flood forecaster weight e.g. how important the current day is in the forecast
+            flood_forecaster_weight = float(SimulationSettings.move_rules["FloodForecasterWeights"][forecast_day])
+
+            #modify the flood_forecast_base using the flood level on the current day and the imporatance of the current day in the forecast loop
+            flood_forecast_base += forecast_flood_level_weight * flood_forecaster_weight
+
+        #break the loop if we've reached the end of the forecast data
+        if forecast_day == forecast_end_time:
+            break
+
+    return flood_forecast_base
+
+
+def buildForecastFloodTable(forecast_flood_levels) -> Optional[np.ndarray]:
+    """
+    Summary:
+        Precomputes getForecastFloodSum for every location and day of the flood forecast.
+        The days are summed in the same order as the forecast loop, so the sums are identical.
+
+    Args:
+        forecast_flood_levels (np.ndarray): forecast flood levels, one row per location and one column per day
+
+    Returns:
+        Optional[np.ndarray]: weighted forecast sums, one row per location and one column per day,
+            or None if the settings do not describe a complete forecast.
+    """
+    forecast_timescale = SimulationSettings.move_rules["FloodForecasterTimescale"]
+    forecast_end_time = SimulationSettings.move_rules["FloodForecasterEndTime"]
+    loc_weights = SimulationSettings.move_rules["FloodLocWeights"]
+    forecaster_weights = SimulationSettings.move_rules["FloodForecasterWeights"]
+
+    if forecast_timescale is None or forecast_end_time is None or loc_weights is None or forecaster_weights is None:
+        return None
+
+    forecast_flood_levels = np.asarray(forecast_flood_levels, dtype=np.int64)
+    num_days = forecast_flood_levels.shape[1]
+    if forecast_end_time >= num_days or forecast_end_time >= len(forecaster_weights):
+        return None
+    if forecast_flood_levels.max(initial=0) >= len(loc_weights):
+        return None
+
+    # Weight of the flood level of each location on each day, zero where there is no flooding.
+    loc_weight_table = np.array([float(w) for w in loc_weights])
+    level_weights = np.where(forecast_flood_levels > 0, loc_weight_table[np.maximum(forecast_flood_levels, 0)], 0.0)
+
+    forecast_flood_sums = np.zeros(forecast_flood_levels.shape)
+    for time in range(0, min(forecast_end_time, num_days - 1) + 1):
+        for x in range(1, forecast_timescale + 1):
+            forecast_day = min(time + x, forecast_end_time)
+            forecast_flood_sums[:, time] += level_weights[:, forecast_day] * float(forecaster_weights[forecast_day])
+            if forecast_day == forecast_end_time:
+                break
+
+    return forecast_flood_sums
+
+
 def check_routes(weights, routes, label):
     if len(weights) == 0 or len(routes) == 0:
         print(f"ERROR: Pruning to empty tree at {label}, W:{len(weights)} R:{len(routes)}", file=sys.stderr)
@@ -466,11 +526,190 @@ def pruneRoutes(weights, routes):
     return weights, routes
 
 
-@check_args_type
-def selectRoute(a, time: int, debug: bool = False, return_all_routes: bool = False):
+def getRouteCacheKey(a, time: int) -> tuple:
   """
   Summary:
-      Selects a route for an agent to move to.
+      Returns the key under which the route weights of an agent are cached.
+      The key only contains the agent attributes that are read by the
+      enabled move rules in getEndPointScore, so that agents which would
+      obtain identical weights share a single cache entry.
+
+  Args:
+      a: Agent
+      time (int): Current time
+
+  Returns:
+      tuple: The cache key for the agent at its current location.
+  """
+  key = [time]
+
+  if SimulationSettings.move_rules["ChildrenAvoidHazards"]:
+      key.append(a.attributes["age"] < 19)
+      if SimulationSettings.move_rules["BoysTakeRisk"]:
+          key.append(a.attributes["gender"] == "male" and a.attributes["age"] > 14)
+
+  if SimulationSettings.move_rules["FloodRulesEnabled"] is True:
+      if SimulationSettings.move_rules["FloodForecaster"] is True:
+          key.append(int(a.attributes["floodawareness"]))
+
+  if (SimulationSettings.move_rules["MatchCampEthnicity"] or
+      SimulationSettings.move_rules["MatchTownEthnicity"] or
+      SimulationSettings.move_rules["MatchConflictEthnicity"]):
+      key.append(a.attributes["ethnicity"])
+
+  return tuple(key)
+
+
+# Incremented whenever the link graph changes, which invalidates all route trees.
+route_tree_generation = 0
+
+
+def invalidateRouteTrees() -> None:
+  """
+  Summary:
+      Marks all existing route trees as outdated, so that they are rebuilt
+      from the link graph when they are next used.
+
+  Args:
+      None.
+
+  Returns:
+      None.
+  """
+  global route_tree_generation
+  route_tree_generation += 1
+
+
+class RouteTree:
+  """
+  Summary:
+      Flattened version of the tree that calculateLinkWeight traverses
+      from a given location. Every node corresponds to one recursive call,
+      stored in the same (depth-first) order, so that the route set and
+      the order of the routes are identical to the recursive version.
+      Only the link weights need to be calculated every time step.
+  """
+
+  def __init__(self, location):
+    """
+    Summary:
+        Builds the route tree for a given location, using the current
+        link graph and awareness level.
+
+    Args:
+        location (Location): origin location of the routes.
+
+    Returns:
+        None.
+    """
+    self.generation = route_tree_generation
+    self.awareness_level = SimulationSettings.move_rules["AwarenessLevel"]
+
+    self.endpoints = [] # unique endpoint locations in the tree.
+    self._endpoint_index = {}
+
+    hop_endpoint = [] # index in self.endpoints of the endpoint of each hop.
+    link_distance = [] # length of the link of each hop.
+    prior_distance = [] # distance travelled before each hop.
+    parent_hop = [] # index of the parent hop, or -1 for links from the origin.
+    marker = [] # True if the endpoint of the hop is a marker.
+
+    def add_hop(link, prior, origin_names, step, parent):
+      node = len(hop_endpoint)
+      endpoint = link.endpoint
+      if id(endpoint) not in self._endpoint_index:
+        self._endpoint_index[id(endpoint)] = len(self.endpoints)
+        self.endpoints.append(endpoint)
+
+      hop_endpoint.append(self._endpoint_index[id(endpoint)])
+      link_distance.append(link.get_distance())
+      prior_distance.append(prior)
+      parent_hop.append(parent)
+      marker.append(endpoint.marker)
+
+      if endpoint.marker is not False:
+        step -= 1
+
+      if self.awareness_level > step:
+        for lel in endpoint.links:
+          if lel.endpoint.name not in origin_names:
+            add_hop(lel, prior + link.get_distance(), origin_names + [endpoint.name], step + 1, node)
+
+    for link in location.links:
+      add_hop(link, 0.0, [location.name], 1, -1)
+
+    self.hop_endpoint = np.array(hop_endpoint, dtype=int)
+    self.link_distance = np.array(link_distance, dtype=float)
+    self.prior_distance = np.array(prior_distance, dtype=float)
+    self.parent = np.array(parent_hop, dtype=int)
+    self.marker = np.array(marker, dtype=bool)
+
+    # Routes only end in hops that do not lead to a marker.
+    route_nodes = np.nonzero(~self.marker)[0]
+    self.route_endpoint = self.hop_endpoint[route_nodes]
+    self.route_distance = self.link_distance[route_nodes]
+    self.route_prior_distance = self.prior_distance[route_nodes]
+
+    self.routes = []
+    for node in route_nodes:
+      route = []
+      while node >= 0:
+        route.append(self.endpoints[self.hop_endpoint[node]].name)
+        node = self.parent[node]
+      self.routes.append([location.name] + route[::-1])
+
+
+  def calculateWeights(self, agent, time: int) -> Tuple[List[float],List[List[str]]]:
+    """
+    Summary:
+        Calculates the weights of all routes in the tree,
+        using the same formula as calculateLinkWeight.
+
+    Args:
+        agent: agent making the decision.
+        time (int): current time step.
+
+    Returns:
+        Tuple[List[float],List[List[str]]]: A tuple containing the weights and routes.
+    """
+    if len(self.routes) == 0:
+      return [], []
+
+    scores = np.array([float(getEndPointScore(agent=agent, endpoint=endpoint, time=time)) for endpoint in self.endpoints])
+    caps = np.array([getCapMultiplier(endpoint, numOnLink=0) for endpoint in self.endpoints])
+
+    weights = ((SimulationSettings.move_rules["WeightSoftening"] + scores[self.route_endpoint]) / (SimulationSettings.move_rules["DistanceSoftening"] + self.route_distance + self.route_prior_distance)**SimulationSettings.move_rules["DistancePower"]) * caps[self.route_endpoint]
+    weights = weights**SimulationSettings.move_rules["WeightPower"]
+
+    return weights.tolist(), list(self.routes)
+
+
+def getRouteTree(location) -> RouteTree:
+  """
+  Summary:
+      Returns the route tree of a location, (re)building it if the
+      link graph or the awareness level has changed.
+
+  Args:
+      location (Location): origin location of the routes.
+
+  Returns:
+      RouteTree: the route tree of the location.
+  """
+  tree = location.route_tree
+  if tree is None or tree.generation != route_tree_generation or tree.awareness_level != SimulationSettings.move_rules["AwarenessLevel"]:
+    tree = RouteTree(location)
+    location.route_tree = tree
+    instrumentation.count("route_tree_builds")
+    instrumentation.count("route_tree_hops", len(tree.hop_endpoint))
+  return tree
+
+
+def calculateAllRoutes(a, time: int, debug: bool = False) -> Tuple[List[float],List[List[str]]]:
+  """
+  Summary:
+      Calculates the weights of all routes from the location of an agent,
+      up to the awareness level. Routes still include the origin location.
 
   Args:
     a: Agent
@@ -478,14 +717,57 @@ def selectRoute(a, time: int, debug: bool = False, return_all_routes: bool = Fal
     debug (bool, optional): Whether to print debug information. Defaults to False.
 
   Returns:
-      int: Index of the chosen route
+      Tuple[List[float],List[List[str]]]: A tuple containing the weights and routes.
   """
+  if SimulationSettings.move_rules["RouteTreeEngine"] is True:
+      return getRouteTree(a.location).calculateWeights(a, time)
+
   weights = []
   routes = []
+  for k, e in enumerate(a.location.links):
+      wgt, rts = calculateLinkWeight(
+           a,
+           link=e,
+           prior_distance=0.0,
+           origin_names=[a.location.name],
+           step=1,
+           time=time,
+           debug=debug,
+      )
+
+      weights = weights + wgt
+      routes = routes + rts
 
-  if SimulationSettings.move_rules["AwarenessLevel"] == 0:
-      linklen = len(a.location.links)
-      return [np.random.randint(0, linklen)]
+  return weights, routes
+
+
+def getRouteWeights(a, time: int, debug: bool = False) -> Tuple[List[float],List[List[str]]]:
+  """
+  Summary:
+      Returns the pruned weights and routes an agent chooses from,
+      with the origin location removed from the routes.
+
+  Args:
+    a: Agent
+    time (int): Current time
+    debug (bool, optional): Whether to print debug information. Defaults to False.
+
+  Returns:
+      Tuple[List[float],List[List[str]]]: A tuple containing the weights and routes.
+  """
+  weights = []
+  routes = []
+
+  # Route weights are identical for all agents in the same location with the
+  # same relevant attributes, so these are computed once per time step.
+  cache_key = None
+  if SimulationSettings.optimisations["RouteCache"] is True:
+      cache_key = getRouteCacheKey(a, time)
+      cached = a.location.route_cache.get(cache_key, None)
+      if cached is not None:
+          return cached
+
+  instrumentation.count("route_weight_calculations")
 
   if SimulationSettings.move_rules["FixedRoutes"] is True:
       for l in a.location.routes.keys():
@@ -493,22 +775,8 @@ def selectRoute(a, time: int, debug: bool = False, return_all_routes: bool = Fal
           routes = routes + [a.location.routes[l][1]]
       #print("FixedRoute Weights", a.location.name, weights, routes, file=sys.stderr)
   else:
-      for k, e in enumerate(a.location.links):
-          wgt, rts = calculateLinkWeight(
-               a,
-               link=e,
-               prior_distance=0.0,
-               origin_names=[a.location.name],
-               step=1,
-               time=time,
-               debug=debug,
-          )
-
-          weights = weights + wgt
-          routes = routes + rts
-
-      if return_all_routes is True:
-          return weights, routes
+      weights, routes = calculateAllRoutes(a, time, debug=debug)
+
       if debug is True:
           print("selectRoute: ",routes, weights, file=sys.stderr)
 
@@ -518,6 +786,37 @@ def selectRoute(a, time: int, debug: bool = False, return_all_routes: bool = Fal
 
       weights, routes = pruneRoutes(weights, routes)
 
+  if cache_key is not None:
+      a.location.route_cache[cache_key] = (weights, routes)
+
+  return weights, routes
+
+
+@check_args_type
+def selectRoute(a, time: int, debug: bool = False, return_all_routes: bool = False):
+  """
+  Summary:
+      Selects a route for an agent to move to.
+
+  Args:
+    a: Agent
+    time (int): Current time
+    debug (bool, optional): Whether to print debug information. Defaults to False.
+
+  Returns:
+      int: Index of the chosen route
+  """
+  instrumentation.count("route_selections")
+
+  if SimulationSettings.move_rules["AwarenessLevel"] == 0:
+      linklen = len(a.location.links)
+      return [np.random.randint(0, linklen)]
+
+  if return_all_routes is True and SimulationSettings.move_rules["FixedRoutes"] is False:
+      return calculateAllRoutes(a, time, debug=debug)
+
+  weights, routes = getRouteWeights(a, time, debug=debug)
+
   route = chooseFromWeights(weights=weights, routes=routes)
 
   if route == None:
@@ -531,3 +830,36 @@ def selectRoute(a, time: int, debug: bool = False, return_all_routes: bool = Fal
 
   return route
 
+
+def selectRoutes(agents, time: int, rng) -> None:
+  """
+  Summary:
+      Selects routes for a group of agents that share the same location
+      and route cache key, using a single draw over the shared weights.
+      The chosen routes are stored in the route attribute of the agents.
+
+  Args:
+    agents: Agents in the same location, with the same route cache key.
+    time (int): Current time
+    rng (numpy.random.Generator): Random number generator used for the draw.
+
+  Returns:
+      None.
+  """
+  if SimulationSettings.move_rules["AwarenessLevel"] == 0:
+      for a in agents:
+          a.route = selectRoute(a, time=time)
+      return
+
+  weights, routes = getRouteWeights(agents[0], time)
+
+  if len(weights) == 0:
+      # Falls back to the regular route selection, including its warnings.
+      for a in agents:
+          a.route = selectRoute(a, time=time)
+      return
+
+  instrumentation.count("route_selections", len(agents))
+  choices = rng.choice(len(routes), size=len(agents), p=normalizeWeights(weights=weights))
+  for a, choice in zip(agents, choices):
+      a.route = routes[choice]
@@ -1,13 +1,16 @@
 from __future__ import annotations
 
 import os
+import pickle
 import sys
 from functools import wraps
 from typing import List, Optional
 
 import numpy as np
-from flee import flee,scoring,spawning,crawling
-from flee.Diagnostics import write_agents_par,write_links_par
+from flee import flee,moving,scoring,spawning,crawling,instrumentation
+from flee.Diagnostics import AgentColumnWriter,DiagnosticsWriter,write_agents_par,write_links_par
+from flee.agentstore import AgentStore
+from flee.distances import DistanceMatrix
 from flee.SimulationSettings import SimulationSettings
 from mpi4py import MPI
 
@@ -40,6 +43,7 @@ class MPIManager:
     @check_args_type
     def CalcCommWorldTotalSingle(self, i):
         total = np.array([-1])
+        instrumentation.count("mpi_bytes", total.nbytes)
         # If you want this number on rank 0, just use Reduce.
         self.comm.Allreduce(np.array([i]), total, op=MPI.SUM)
         return total[0]
@@ -50,6 +54,7 @@ class MPIManager:
         assert np_array.size > 0
 
         total = np.zeros(np_array.size, dtype="i")
+        instrumentation.count("mpi_bytes", total.nbytes)
 
         # If you want this number on rank 0, just use Reduce.
         self.comm.Allreduce([np_array, MPI.INT], [total, MPI.INT], op=MPI.SUM)
@@ -396,9 +401,16 @@ class Ecosystem(flee.Ecosystem):
         """
         self.locations = []
         self.locationNames = []
+        self.locationIndex = {}  # location name -> index in self.locations.
         self.agents = []
+        # Binomial thinning only saves work when residents are found without visiting every agent.
+        if SimulationSettings.optimisations["AgentStore"] is True or SimulationSettings.optimisations["BinomialThinning"] is True:
+            self.agents = AgentStore(self, flee.AgentView)
         self.total_agents = 0
         self.closures = []  # format [type, source, dest, start, end]
+        # Closures by the days on which they start or end (EventSchedules optimisation only).
+        self.closure_schedule = None
+        self.closure_schedule_source = (None, 0)
         self.time = 0
         self.print_location_output = False
         self.mpi = MPIManager()
@@ -411,6 +423,32 @@ class Ecosystem(flee.Ecosystem):
 
         # Bring conflict zone management into FLEE.
         self.spawn_weights = np.array([])
+        # Set when locations are added without refreshing the spawn weights (VectorizedSpawnWeights only).
+        self.spawn_weights_outdated = False
+        # Cumulative distribution of the spawn weights, and the weights it was built from.
+        self.spawn_cdf = None
+        self.spawn_cdf_weights = None
+
+        # Random number generator for batched route choice, created when first needed.
+        self.rng = None
+
+        # Output files for agent and link logging, opened when first written.
+        self.agent_writer = DiagnosticsWriter("agents.out.%s" % self.mpi.rank)
+        self.link_writer = DiagnosticsWriter("links.out.%s" % self.mpi.rank)
+        self.agent_column_writer = AgentColumnWriter("agents.columns.%s" % self.mpi.rank, rank=self.mpi.rank)
+        self.profiler = instrumentation.StepProfiler(rank=self.mpi.rank)
+
+        # Coordinates of all locations, for distances between them (DistanceMatrix optimisation only).
+        self.location_distances = DistanceMatrix()
+
+        # Owning rank of each location, used when agent_partition is "location".
+        # Computed when first needed, and again whenever locations are added.
+        self.location_owner = None
+
+        # Buffers of updateNumAgents, with and without closed links (see _get_sync_layout),
+        # and the reduction started by start_num_agents_update.
+        self.sync_layouts = {}
+        self.pending_num_agents_update = None
 
         # classic for replicated locations or loc-par for distributed
         # locations.
@@ -480,13 +518,8 @@ class Ecosystem(flee.Ecosystem):
         forced_redirection: bool = False,
         attributes: dict = {},
     ) -> None:
-        endpoint1_index = -1
-        endpoint2_index = -1
-        for i in range(0, len(self.locationNames)):
-            if self.locationNames[i] == endpoint1:
-                endpoint1_index = i
-            if self.locationNames[i] == endpoint2:
-                endpoint2_index = i
+        endpoint1_index = self.locationIndex.get(endpoint1, -1)
+        endpoint2_index = self.locationIndex.get(endpoint2, -1)
 
         if endpoint1_index < 0:
             print("Diagnostic: Ecosystem.locationNames: ", self.locationNames, file=sys.stderr)
@@ -519,6 +552,11 @@ class Ecosystem(flee.Ecosystem):
             )
         )
 
+        for loc in [self.locations[endpoint1_index], self.locations[endpoint2_index]]:
+            loc.links_by_endpoint.setdefault(loc.links[-1].endpoint.name, loc.links[-1])
+
+        moving.invalidateRouteTrees()
+
 
     @check_args_type
     def updateNumAgents(self, CountClosed: bool = False, log: bool = True) -> None:
@@ -553,53 +591,603 @@ class Ecosystem(flee.Ecosystem):
                         total += link.numAgents
             self.total_agents = total
         elif mode == "high_latency":
-            buf_len = 0
+            layout = self._get_sync_layout(CountClosed)
+            local_counts = self._pack_num_agents(layout)
 
-            buf_len += len(self.locations)
-            for loc in self.locations:
-                buf_len += len(loc.links)
-                if CountClosed:
-                    buf_len += len(loc.closed_links)
+            if SimulationSettings.optimisations["NumAgentsSync"] == "delta" and layout["totals"] is not None:
+                new_buffer = self._reduce_num_agents_delta(layout, local_counts)
+            elif SimulationSettings.optimisations["AgentPartition"] == "location":
+                new_buffer = self._gather_owned_counts(layout, local_counts)
+            else:
+                new_buffer = self.mpi.CalcCommWorldTotal(local_counts)
 
-            numAgent_buffer = np.empty(buf_len, dtype="i")
+            self._unpack_num_agents(layout, local_counts, new_buffer)
 
-            index = 0
-            for loc in self.locations:
-                numAgent_buffer[index] = loc.numAgentsOnRank
-                index += 1
-                for link in loc.links:
-                    numAgent_buffer[index] = link.numAgentsOnRank
-                    index += 1
-                if CountClosed:
-                    for link in loc.closed_links:
-                        numAgent_buffer[index] = link.numAgentsOnRank
-                        index += 1
+        if self.mpi.rank == 0 and log is True:
+            print(
+                "NumAgents updated. Total agents in simulation:", self.total_agents, file=sys.stderr
+            )
 
-            new_buffer = self.mpi.CalcCommWorldTotal(numAgent_buffer)
 
-            index = 0
-            for loc in self.locations:
-                loc.numAgents = new_buffer[index]
-                index += 1
-                for link in loc.links:
-                    link.numAgents = new_buffer[index]
-                    index += 1
-                if CountClosed:
-                    for link in loc.closed_links:
-                        link.numAgents = new_buffer[index]
-                        index += 1
+    @check_args_type
+    def start_num_agents_update(self) -> None:
+        """
+        Summary:
+            Starts updateNumAgents (without closed links) as a non-blocking reduction,
+            so that work which does not need the agent counts can overlap with the
+            communication. The counts are updated by finish_num_agents_update.
+            Only used with num_agents_sync "non-blocking" and latency mode "high_latency".
+
+        Args:
+            None.
+
+        Returns:
+            None.
+        """
+        layout = self._get_sync_layout(False)
+        local_counts = self._pack_num_agents(layout)
+        result = np.empty(len(local_counts), dtype="i")
+
+        if SimulationSettings.optimisations["AgentPartition"] == "location":
+            owned, sizes, offsets = self._get_owned_layout(layout)
+            send = np.ascontiguousarray(local_counts[owned == self.mpi.rank])
+            instrumentation.count("mpi_bytes", send.nbytes)
+            request = self.mpi.comm.Iallgatherv([send, MPI.INT], [result, sizes, offsets, MPI.INT])
+        else:
+            send = local_counts
+            instrumentation.count("mpi_bytes", result.nbytes)
+            request = self.mpi.comm.Iallreduce([send, MPI.INT], [result, MPI.INT], op=MPI.SUM)
+
+        # The send buffer must stay alive until the request completes.
+        self.pending_num_agents_update = (layout, local_counts, send, result, request)
+
+
+    @check_args_type
+    def finish_num_agents_update(self, log: bool = True) -> None:
+        """
+        Summary:
+            Waits for the reduction started by start_num_agents_update, and updates the agent counts.
+
+        Args:
+            log (bool, optional): Whether to log the updated number of agents to the standard error stream. Defaults to True.
+
+        Returns:
+            None.
+        """
+        layout, local_counts, _, result, request = self.pending_num_agents_update
+        self.pending_num_agents_update = None
+        request.Wait()
+
+        if SimulationSettings.optimisations["AgentPartition"] == "location":
+            new_buffer = np.empty(len(result), dtype="i")
+            new_buffer[layout["owner_order"]] = result
+        else:
+            new_buffer = result
 
-            self.total_agents = np.sum(new_buffer)
+        self._unpack_num_agents(layout, local_counts, new_buffer)
 
         if self.mpi.rank == 0 and log is True:
             print(
                 "NumAgents updated. Total agents in simulation:", self.total_agents, file=sys.stderr
             )
 
+
+    @check_args_type
+    def _get_sync_layout(self, CountClosed: bool = False) -> dict:
+        """
+        Summary:
+            Returns the locations and links whose agent counts are synchronized by
+            updateNumAgents, in buffer order, together with preallocated buffers and the
+            counts of the previous synchronization. The layout is rebuilt when locations
+            are added or links are added, closed or reopened (private function).
+
+        Args:
+            CountClosed (bool, optional): Whether to include closed links. Defaults to False.
+
+        Returns:
+            dict: The layout.
+        """
+        # Every change of the link topology advances the route tree generation.
+        key = (moving.route_tree_generation, len(self.locations))
+        layout = self.sync_layouts.get(CountClosed, None)
+
+        if layout is None or layout["key"] != key:
+            entries = []
+            for loc in self.locations:
+                entries.append(loc)
+                entries += loc.links
+                if CountClosed:
+                    entries += loc.closed_links
+
+            layout = {
+                "key": key,
+                "entries": entries,
+                "local": np.zeros(len(entries), dtype="i"),
+                "totals": None,
+                "owners": None,
+            }
+            self.sync_layouts[CountClosed] = layout
+
+        return layout
+
+
+    @check_args_type
+    def _pack_num_agents(self, layout: dict):
+        """
+        Summary:
+            Copies the agent counts on this rank into a buffer, in the order of the layout (private function).
+
+        Args:
+            layout (dict): The layout, see _get_sync_layout.
+
+        Returns:
+            numpy.ndarray: The agent counts on this rank.
+        """
+        entries = layout["entries"]
+        return np.fromiter((entry.numAgentsOnRank for entry in entries), dtype="i", count=len(entries))
+
+
+    @check_args_type
+    def _unpack_num_agents(self, layout: dict, local_counts, new_buffer) -> None:
+        """
+        Summary:
+            Stores the synchronized agent counts in the locations and links, and
+            remembers them for the next delta synchronization (private function).
+
+        Args:
+            layout (dict): The layout, see _get_sync_layout.
+            local_counts (numpy.ndarray): The agent counts on this rank that were synchronized.
+            new_buffer (numpy.ndarray): The agent counts across all ranks.
+
+        Returns:
+            None.
+        """
+        for entry, num_agents in zip(layout["entries"], new_buffer):
+            entry.numAgents = num_agents
+
+        layout["local"] = local_counts
+        layout["totals"] = new_buffer
+        self.total_agents = np.sum(new_buffer)
+
+
+    @check_args_type
+    def _reduce_num_agents_delta(self, layout: dict, local_counts):
+        """
+        Summary:
+            Replaces the Allreduce of updateNumAgents by an exchange of only the
+            counts that changed on each rank since the previous synchronization.
+            Every rank sends the indices and changes of its modified entries, and
+            all ranks add the changes of all ranks to the previous totals (private function).
+
+        Args:
+            layout (dict): The layout, see _get_sync_layout.
+            local_counts (numpy.ndarray): The agent counts on this rank.
+
+        Returns:
+            numpy.ndarray: The agent counts across all ranks.
+        """
+        delta = local_counts - layout["local"]
+        changed = np.flatnonzero(delta).astype("i")
+        send = np.concatenate([changed, delta[changed].astype("i")])
+
+        sizes = np.empty(self.mpi.size, dtype="i")
+        self.mpi.comm.Allgather([np.array([len(send)], dtype="i"), MPI.INT], [sizes, MPI.INT])
+        offsets = np.zeros(self.mpi.size, dtype="i")
+        offsets[1:] = np.cumsum(sizes)[:-1]
+
+        received = np.empty(int(np.sum(sizes)), dtype="i")
+        instrumentation.count("mpi_bytes", send.nbytes + sizes.nbytes)
+        self.mpi.comm.Allgatherv([send, MPI.INT], [received, sizes, offsets, MPI.INT])
+
+        new_buffer = layout["totals"].copy()
+        for r in range(self.mpi.size):
+            num_changed = sizes[r] // 2
+            indices = received[offsets[r] : offsets[r] + num_changed]
+            new_buffer[indices] += received[offsets[r] + num_changed : offsets[r] + sizes[r]]
+        return new_buffer
+
+
+    @check_args_type
+    def _get_owned_layout(self, layout: dict):
+        """
+        Summary:
+            Returns the owning rank of every entry of a layout under agent_partition
+            "location", with the sizes and offsets of the entries of each rank in
+            an Allgatherv (private function).
+
+        Args:
+            layout (dict): The layout, see _get_sync_layout.
+
+        Returns:
+            tuple: The owners of the entries, and the sizes and offsets per rank.
+        """
+        owner = self.get_location_owners()
+        if layout["owners"] is not owner:
+            entry_owner = np.fromiter(
+                (owner[entry.endpoint.id] if isinstance(entry, flee.Link) else owner[entry.id] for entry in layout["entries"]),
+                dtype="i",
+                count=len(layout["entries"]),
+            )
+            sizes = np.bincount(entry_owner, minlength=self.mpi.size).astype("i")
+            offsets = np.zeros(self.mpi.size, dtype="i")
+            offsets[1:] = np.cumsum(sizes)[:-1]
+
+            layout["owners"] = owner
+            layout["entry_owner"] = entry_owner
+            layout["owner_sizes"] = sizes
+            layout["owner_offsets"] = offsets
+            # The entries of each rank arrive in buffer order, so a stable sort by owner maps them back.
+            layout["owner_order"] = np.argsort(entry_owner, kind="stable")
+
+        return layout["entry_owner"], layout["owner_sizes"], layout["owner_offsets"]
+
+
+    @check_args_type
+    def _gather_owned_counts(self, layout: dict, local_counts):
+        """
+        Summary:
+            Replaces the Allreduce of updateNumAgents when agents are partitioned by location.
+            Each rank only holds agents in the locations it owns and on the links that lead
+            to them, so every count is taken from its owning rank with a single Allgatherv
+            (private function).
+
+        Args:
+            layout (dict): The layout, see _get_sync_layout.
+            local_counts (numpy.ndarray): The agent counts on this rank.
+
+        Returns:
+            numpy.ndarray: The agent counts across all ranks, in the same order.
+        """
+        entry_owner, sizes, offsets = self._get_owned_layout(layout)
+
+        send = np.ascontiguousarray(local_counts[entry_owner == self.mpi.rank])
+        gathered = np.empty(len(local_counts), dtype="i")
+        instrumentation.count("mpi_bytes", send.nbytes)
+        self.mpi.comm.Allgatherv([send, MPI.INT], [gathered, sizes, offsets, MPI.INT])
+
+        new_buffer = np.empty(len(local_counts), dtype="i")
+        new_buffer[layout["owner_order"]] = gathered
+        return new_buffer
+
+
+    @check_args_type
+    def partition_locations(self, weights=None) -> None:
+        """
+        Summary:
+            Assigns every location to a rank, for agent_partition "location".
+            Locations are ordered by a breadth-first traversal of the location graph,
+            and the ordering is split into one contiguous block per rank, so that
+            neighbouring locations (and the agents moving between them) tend to
+            share a rank.
+
+        Args:
+            weights (numpy.ndarray, optional): Load of each location, indexed by location id.
+                Blocks then have an equal total weight instead of an equal number of locations.
+
+        Returns:
+            None.
+        """
+        num_locations = len(self.locations)
+        visited = np.zeros(num_locations, dtype=bool)
+        order = []
+
+        for start in range(num_locations):
+            if visited[start]:
+                continue
+            visited[start] = True
+            order.append(start)
+            # order doubles as the queue of the traversal.
+            k = len(order) - 1
+            while k < len(order):
+                loc = self.locations[order[k]]
+                for link in loc.links + loc.closed_links:
+                    j = link.endpoint.id
+                    if not visited[j]:
+                        visited[j] = True
+                        order.append(j)
+                k += 1
+
+        owner = np.zeros(num_locations, dtype=int)
+        order = np.array(order, dtype=int)
+        if weights is not None and np.sum(weights) > 0:
+            # Each location goes to the block that contains the middle of its share of the weight.
+            cumulative = np.cumsum(weights[order]) - 0.5 * weights[order]
+            owner[order] = np.minimum((cumulative * self.mpi.size) // np.sum(weights), self.mpi.size - 1)
+        else:
+            owner[order] = (np.arange(num_locations) * self.mpi.size) // max(num_locations, 1)
+        self.location_owner = owner
+
+
+    @check_args_type
+    def get_location_owners(self):
+        """
+        Summary:
+            Returns the owning rank of every location, partitioning the locations if needed.
+
+        Args:
+            None.
+
+        Returns:
+            numpy.ndarray: The owning rank of each location, indexed by location id.
+        """
+        if self.location_owner is None or len(self.location_owner) != len(self.locations):
+            self.partition_locations()
+        return self.location_owner
+
+
+    @check_args_type
+    def get_agent_owner(self, a) -> int:
+        """
+        Summary:
+            Returns the rank that owns an agent under agent_partition "location":
+            the owner of its location, or of the destination of the link it travels on.
+
+        Args:
+            a (Person): The agent.
+
+        Returns:
+            int: The owning rank.
+        """
+        loc = a.location
+        if isinstance(loc, flee.Link):
+            loc = loc.endpoint
+        return int(self.get_location_owners()[loc.id])
+
+
+    @check_args_type
+    def _location_reference(self, loc) -> tuple:
+        """
+        Summary:
+            Returns a reference to a location or link that is valid on every rank:
+            locations are referenced by id, and links by the id of their start point
+            and their position in its list of links (private function).
+
+        Args:
+            loc (Location or Link): The location or link.
+
+        Returns:
+            tuple: The reference.
+        """
+        if isinstance(loc, flee.Link):
+            start = loc.startpoint
+            if loc in start.links:
+                return ("link", start.id, start.links.index(loc))
+            return ("closed_link", start.id, start.closed_links.index(loc))
+        return ("location", loc.id, 0)
+
+
+    @check_args_type
+    def _resolve_location_reference(self, reference: tuple):
+        """
+        Summary:
+            Returns the location or link of a reference created by _location_reference (private function).
+
+        Args:
+            reference (tuple): The reference.
+
+        Returns:
+            Location or Link: The referenced location or link.
+        """
+        kind, loc_id, link_index = reference
+        if kind == "link":
+            return self.locations[loc_id].links[link_index]
+        if kind == "closed_link":
+            return self.locations[loc_id].closed_links[link_index]
+        return self.locations[loc_id]
+
+
+    @check_args_type
+    def _pack_agent(self, a) -> dict:
+        """
+        Summary:
+            Converts the state of an agent to a record that can be sent to another rank
+            (private function).
+
+        Args:
+            a (Person): The agent.
+
+        Returns:
+            dict: The agent record.
+        """
+        record = {
+            "where": self._location_reference(a.location),
+            "home_location": a.home_location.id,
+            "travelling": a.travelling,
+            "distance_travelled_on_link": a.distance_travelled_on_link,
+            "distance_moved_this_timestep": a.distance_moved_this_timestep,
+            "recent_travel_distance": a.recent_travel_distance,
+            "timesteps_since_departure": a.timesteps_since_departure,
+            "places_travelled": a.places_travelled,
+            "route": a.route,
+            "attributes": a.attributes,
+        }
+        if SimulationSettings.log_levels["agent"] > 0:
+            record["distance_travelled"] = a.distance_travelled
+        if SimulationSettings.log_levels["agent"] > 1:
+            record["locations_visited"] = [self._location_reference(l) for l in a.locations_visited]
+        return record
+
+
+    @check_args_type
+    def _unpack_agent(self, record: dict) -> None:
+        """
+        Summary:
+            Adds an agent received from another rank (private function, see migrate_agents).
+
+        Args:
+            record (dict): The agent record, as created by _pack_agent.
+
+        Returns:
+            None.
+        """
+        location = self._resolve_location_reference(record["where"])
+        home = self.locations[record["home_location"]]
+        a = Person(self, location=home, attributes=record["attributes"])
+        # The Person is counted at home on creation; move the count to its actual location.
+        home.numAgentsOnRank -= 1
+        location.numAgentsOnRank += 1
+        a.location = location
+
+        a.travelling = record["travelling"]
+        a.distance_travelled_on_link = record["distance_travelled_on_link"]
+        a.distance_moved_this_timestep = record["distance_moved_this_timestep"]
+        a.recent_travel_distance = record["recent_travel_distance"]
+        a.timesteps_since_departure = record["timesteps_since_departure"]
+        a.places_travelled = record["places_travelled"]
+        a.route = record["route"]
+        if SimulationSettings.log_levels["agent"] > 0:
+            a.distance_travelled = record["distance_travelled"]
+        if SimulationSettings.log_levels["agent"] > 1:
+            a.locations_visited = [self._resolve_location_reference(r) for r in record["locations_visited"]]
+
+        self.agents.append(a)
+
+
+    @check_args_type
+    def migrate_agents(self) -> None:
+        """
+        Summary:
+            Sends every agent that is no longer in a location owned by this rank
+            to the rank that owns it, and adds the agents received from other ranks.
+            Only used with agent_partition "location"; must be called on all ranks.
+
+        Args:
+            None.
+
+        Returns:
+            None.
+        """
+        outgoing = [[] for _ in range(self.mpi.size)]
+        leaving = np.zeros(len(self.agents), dtype=bool)
+
+        for i, a in enumerate(self.agents):
+            if a.location is None:
+                continue
+            owner = self.get_agent_owner(a)
+            if owner != self.mpi.rank:
+                outgoing[owner].append(self._pack_agent(a))
+                a.location.numAgentsOnRank -= 1
+                leaving[i] = True
+
+        instrumentation.count("migrated_agents", int(np.sum(leaving)))
+        self._exchange_agents(outgoing, leaving)
+
+
+    @check_args_type
+    def _exchange_agents(self, outgoing: list, leaving) -> None:
+        """
+        Summary:
+            Sends agent records to other ranks with a single Alltoallv of their serialized
+            state, removes the sent agents, and adds the received ones. The sent agents
+            must already have been removed from the numAgentsOnRank counts (private function).
+
+        Args:
+            outgoing (list): For each rank, the list of records (see _pack_agent) to send to it.
+            leaving (numpy.ndarray): Boolean mask, True for the agents that were sent.
+
+        Returns:
+            None.
+        """
+        send_chunks = [pickle.dumps(records, protocol=pickle.HIGHEST_PROTOCOL) for records in outgoing]
+        send_counts = np.array([len(chunk) for chunk in send_chunks], dtype="i")
+        recv_counts = np.empty(self.mpi.size, dtype="i")
+        self.mpi.comm.Alltoall([send_counts, MPI.INT], [recv_counts, MPI.INT])
+
+        send_offsets = np.zeros(self.mpi.size, dtype="i")
+        send_offsets[1:] = np.cumsum(send_counts)[:-1]
+        recv_offsets = np.zeros(self.mpi.size, dtype="i")
+        recv_offsets[1:] = np.cumsum(recv_counts)[:-1]
+
+        send_buffer = np.frombuffer(b"".join(send_chunks), dtype=np.uint8)
+        recv_buffer = np.empty(int(np.sum(recv_counts)), dtype=np.uint8)
+        instrumentation.count("mpi_bytes", send_buffer.nbytes)
+        self.mpi.comm.Alltoallv(
+            [send_buffer, send_counts, send_offsets, MPI.BYTE],
+            [recv_buffer, recv_counts, recv_offsets, MPI.BYTE],
+        )
+
+        if isinstance(self.agents, AgentStore):
+            self.agents.remove(leaving)
+        else:
+            self.agents = [a for a, left in zip(self.agents, leaving) if not left]
+
+        for r in range(self.mpi.size):
+            chunk = recv_buffer[recv_offsets[r] : recv_offsets[r] + recv_counts[r]]
+            for record in pickle.loads(chunk.tobytes()):
+                self._unpack_agent(record)
+
+
+    @check_args_type
+    def rebalance_agents(self) -> None:
+        """
+        Summary:
+            Evens out the number of active agents per rank, if the most loaded rank
+            holds more than rebalance_threshold times the average. With agent_partition
+            "round-robin", surplus agents are sent to the ranks with the fewest agents.
+            With agent_partition "location", the locations are partitioned again,
+            weighted by the number of agents in (or travelling to) each location,
+            and the agents are migrated to their new owners.
+            Must be called on all ranks.
+
+        Args:
+            None.
+
+        Returns:
+            None.
+        """
+        active = [i for i, a in enumerate(self.agents) if a.location is not None]
+        counts = np.array(self.mpi.comm.allgather(len(active)), dtype=int)
+        total = int(np.sum(counts))
+        if total == 0 or np.max(counts) <= SimulationSettings.optimisations["RebalanceThreshold"] * total / self.mpi.size:
+            return
+
+        if SimulationSettings.optimisations["AgentPartition"] == "location":
+            weights = np.zeros(len(self.locations))
+            for loc in self.locations:
+                weights[loc.id] += loc.numAgents
+                for link in loc.links + loc.closed_links:
+                    weights[link.endpoint.id] += link.numAgents
+            self.partition_locations(weights=weights)
+            self.migrate_agents()
+        else:
+            targets = np.full(self.mpi.size, total // self.mpi.size, dtype=int)
+            targets[: total % self.mpi.size] += 1
+            surplus = counts - targets
+
+            # Every rank computes the same transfers: surplus ranks fill deficit ranks in rank order.
+            outgoing = [[] for _ in range(self.mpi.size)]
+            leaving = np.zeros(len(self.agents), dtype=bool)
+            receivers = [r for r in range(self.mpi.size) if surplus[r] < 0]
+            for sender in range(self.mpi.size):
+                while surplus[sender] > 0:
+                    receiver = receivers[0]
+                    num = min(surplus[sender], -surplus[receiver])
+                    if sender == self.mpi.rank:
+                        # Send the most recently added active agents.
+                        for i in active[len(active) - num :]:
+                            a = self.agents[i]
+                            outgoing[receiver].append(self._pack_agent(a))
+                            a.location.numAgentsOnRank -= 1
+                            leaving[i] = True
+                        active = active[: len(active) - num]
+                    surplus[sender] -= num
+                    surplus[receiver] += num
+                    if surplus[receiver] == 0:
+                        receivers.pop(0)
+
+            instrumentation.count("migrated_agents", int(np.sum(leaving)))
+            self._exchange_agents(outgoing, leaving)
+
+        if self.mpi.rank == 0:
+            print(
+                "Agents rebalanced. Active agents per rank before rebalancing:", counts, file=sys.stderr
+            )
+
+
     """
     Add & insert agent functions.
-    TODO: make addAgent function smarter, to prevent large load imbalances
-    over time due to removals by clearLocationFromAgents?
+    Load imbalances over time due to removals by clearLocationFromAgents
+    are corrected by rebalance_agents (optimisations: rebalance_interval).
     """
 
     @check_args_type
@@ -627,9 +1215,82 @@ class Ecosystem(flee.Ecosystem):
                 )
                 location.print()
                 assert location.pop > 1
-        self.total_agents += 1
-        if self.total_agents % self.mpi.size == self.mpi.rank:
-            self.agents.append(Person(self, location=location, attributes=attributes))
+        self._append_agents(location, 1, [attributes])
+
+
+    @check_args_type
+    def addAgents(self, location, count: int, attributes_batch: Optional[list] = None) -> None:
+        """
+        Summary: 
+            Adds a number of agents to the ecosystem at the specified location.
+            Equivalent to calling addAgent for each agent, but the population
+            bookkeeping is done once, and only the agents of this rank are created.
+
+        Args:
+            location (Location): The location to add the agents to.
+            count (int): The number of agents to add.
+            attributes_batch (list, optional): A list of attribute dictionaries, one per agent. Defaults to empty attributes.
+
+        Returns:
+            None.
+        """
+        if count <= 0:
+            return
+
+        if SimulationSettings.spawn_rules["TakeFromPopulation"]:
+            if location.pop > count: 
+                location.pop -= count
+                location.numAgentsSpawnedOnRank += count
+                location.numAgentsSpawned += count
+            else:
+                print(
+                    "ERROR: Number of agents in the simulation is larger than the combined "
+                    "population of the conflict zones. Please amend locations.csv." 
+                )
+                location.print()
+                assert location.pop > count
+
+        self._append_agents(location, count, attributes_batch)
+
+
+    @check_args_type
+    def _append_agents(self, location, count: int, attributes_batch: Optional[list] = None) -> None:
+        """
+        Summary: 
+            Advances the global agent count by a number of agents, and creates
+            the agents that belong to this rank: those in the round-robin distribution,
+            or all of them if this rank owns the location under agent_partition "location"
+            (private function, use addAgents or insertAgents instead).
+
+        Args:
+            location (Location): The location to create the agents at.
+            count (int): The number of agents added across all ranks.
+            attributes_batch (list, optional): A list of attribute dictionaries, one per agent. Defaults to empty attributes.
+
+        Returns:
+            None.
+        """
+        # Agent j of the batch gets number total_agents + 1 + j, and belongs to rank (number % size).
+        first = (self.mpi.rank - self.total_agents - 1) % self.mpi.size
+        self.total_agents += count
+
+        if SimulationSettings.optimisations["AgentPartition"] == "location":
+            if self.get_location_owners()[location.id] != self.mpi.rank:
+                return
+            first = 0
+            step = 1
+        else:
+            step = self.mpi.size
+
+        if attributes_batch is None:
+            local_attributes = [{} for _ in range(first, count, step)]
+        else:
+            local_attributes = attributes_batch[first:count:step]
+
+        if isinstance(self.agents, AgentStore):
+            self.agents.append_batch(location, local_attributes)
+        else:
+            self.agents += [Person(self, location=location, attributes=attributes) for attributes in local_attributes]
 
 
     @check_args_type
@@ -645,13 +1306,11 @@ class Ecosystem(flee.Ecosystem):
         Returns:
             None.
         """
-        self.total_agents += 1
-        if self.total_agents % self.mpi.size == self.mpi.rank:
-            self.agents.append(Person(self, location=location, attributes=attributes))
+        self._append_agents(location, 1, [attributes])
 
 
     @check_args_type
-    def insertAgents(self, location, number: int) -> None:
+    def insertAgents(self, location, number: int, attributes_batch: Optional[list] = None) -> None:
         """
         Summary: 
             Inserts a number of agents into the ecosystem at the specified
@@ -661,12 +1320,13 @@ class Ecosystem(flee.Ecosystem):
         Args:
             location (Location): The location to insert the agents into.
             number (int): The number of agents to insert.
+            attributes_batch (list, optional): A list of attribute dictionaries, one per agent. Defaults to empty attributes.
 
         Returns:
             None.
         """
-        for _ in range(0, number):
-            self.insertAgent(location=location)
+        if number > 0:
+            self._append_agents(location, number, attributes_batch)
 
 
     @check_args_type
@@ -685,17 +1345,25 @@ class Ecosystem(flee.Ecosystem):
             None. 
         """
 
-        new_agents = []
-        for agent in self.agents:
-            if agent.location.name not in location_names:
-                new_agents += [agent]
-            else:
-                # print("Agent removed: ", agent.location.name)
-                # agent is removed from ecosystem and number of agents in
-                # location drops by one.
-                agent.location.numAgentsOnRank -= 1
-
-        self.agents = new_agents
+        if isinstance(self.agents, AgentStore):
+            removed = np.zeros(len(self.agents), dtype=bool)
+            for i, agent in enumerate(self.agents):
+                if agent.location.name in location_names:
+                    agent.location.numAgentsOnRank -= 1
+                    removed[i] = True
+            self.agents.remove(removed)
+        else:
+            new_agents = []
+            for agent in self.agents:
+                if agent.location.name not in location_names:
+                    new_agents += [agent]
+                else:
+                    # print("Agent removed: ", agent.location.name)
+                    # agent is removed from ecosystem and number of agents in
+                    # location drops by one.
+                    agent.location.numAgentsOnRank -= 1
+
+            self.agents = new_agents
         print("clearLocationsFromAgents()", file=sys.stderr)
         # when numAgentsOnRank has changed, we need to updateNumAgents (1x
         # MPI_Allreduce)
@@ -771,12 +1439,94 @@ class Ecosystem(flee.Ecosystem):
         if Debug and self.mpi.rank == 0:
             print("start of synchronize_locations MPI call.", file=sys.stderr)
             # print(self.mpi.rank, local_scores, scores, sizes, offsets)
+        instrumentation.count("mpi_bytes", local_scores.nbytes)
         self.mpi.comm.Allgatherv(local_scores, [Ecosystem.scores, sizes, offsets, MPI.DOUBLE])
 
         if Debug and self.mpi.rank == 0:
             print("end of synchronize_locations", file=sys.stderr)
 
 
+    @check_args_type
+    def update_location_scores(self, start: int = 0, end: Optional[int] = None) -> None:
+        """
+        Summary:
+            Updates the scores of a range of locations at once with scoring.computeLocationScores,
+            and stores them in the flat Ecosystem.scores array.
+            Route tables (FixedRoutes) are generated after all scores have been updated.
+
+        Args:
+            start (int, optional): The index of the first location to update. Defaults to 0.
+            end (int, optional): The index after the last location to update. Defaults to all locations.
+
+        Returns:
+            None.
+        """
+        if end is None:
+            end = len(self.locations)
+        locations = self.locations[start:end]
+
+        first_score = np.arange(start, end) * self.scores_per_location
+        Ecosystem.scores[first_score] = 1.0
+        Ecosystem.scores[first_score + 1] = scoring.computeLocationScores(self.time, locations)
+
+        for loc in locations:
+            loc.time = self.time
+            loc.routes = {}
+
+        if SimulationSettings.move_rules["FixedRoutes"] is True:
+            for loc in locations:
+                crawling.generateLocationRoutes(loc, self.time)
+
+
+    @check_args_type
+    def synchronize_location_routes(self) -> None:
+        """
+        Summary:
+            Gathers the route tables (used with FixedRoutes) that each process generated
+            for its own locations in loc-par mode, and propagates them across the processes.
+            The tables are flattened into an integer and a float array per process
+            (see crawling.packLocationRoutes), and exchanged with two Allgatherv calls.
+
+        Args:
+            None.
+
+        Returns:
+            None.
+        """
+        # Same division of locations over ranks as the score updates in evolve.
+        num_locations = np.full(self.mpi.size, len(self.locations) // self.mpi.size, dtype=int)
+        num_locations[: len(self.locations) % self.mpi.size] += 1
+        first_location = np.zeros(self.mpi.size, dtype=int)
+        first_location[1:] = np.cumsum(num_locations)[:-1]
+
+        start = first_location[self.mpi.rank]
+        ints, weights = crawling.packLocationRoutes(
+            self.locations[start : start + num_locations[self.mpi.rank]], self.locationIndex
+        )
+
+        sizes = np.array(self.mpi.comm.allgather((len(ints), len(weights))), dtype="i")
+        all_ints = np.empty(int(np.sum(sizes[:, 0])), dtype="i")
+        all_weights = np.empty(int(np.sum(sizes[:, 1])), dtype=np.float64)
+        int_offsets = np.zeros(self.mpi.size, dtype="i")
+        int_offsets[1:] = np.cumsum(sizes[:, 0])[:-1]
+        weight_offsets = np.zeros(self.mpi.size, dtype="i")
+        weight_offsets[1:] = np.cumsum(sizes[:, 1])[:-1]
+
+        instrumentation.count("mpi_bytes", ints.nbytes + weights.nbytes)
+        self.mpi.comm.Allgatherv([ints, MPI.INT], [all_ints, sizes[:, 0].copy(), int_offsets, MPI.INT])
+        self.mpi.comm.Allgatherv([weights, MPI.DOUBLE], [all_weights, sizes[:, 1].copy(), weight_offsets, MPI.DOUBLE])
+
+        for r in range(self.mpi.size):
+            if r == self.mpi.rank:
+                continue
+            crawling.unpackLocationRoutes(
+                self.locations[first_location[r] : first_location[r] + num_locations[r]],
+                self.locations,
+                all_ints[int_offsets[r] : int_offsets[r] + sizes[r, 0]],
+                all_weights[weight_offsets[r] : weight_offsets[r] + sizes[r, 1]],
+            )
+
+
     @check_args_type
     def evolve(self) -> None:
         """
@@ -790,6 +1540,8 @@ class Ecosystem(flee.Ecosystem):
             None.
 
         """
+        self.profiler.start_step()
+
         if self.time == 0:
             # print("rank, num_agents:", self.mpi.rank, len(self.agents))
 
@@ -803,10 +1555,13 @@ class Ecosystem(flee.Ecosystem):
         if self.parallel_mode == "classic":
             # update level 1 location scores (2 and 3 are obsolete).
             # Scores remain perfectly updated in classic mode.
-            for loc in self.locations:
-                loc.time = self.time
-                loc.routes = {}
-                scoring.updateLocationScore(self.time, loc)
+            if SimulationSettings.optimisations["VectorizedScoring"] is True:
+                self.update_location_scores()
+            else:
+                for loc in self.locations:
+                    loc.time = self.time
+                    loc.routes = {}
+                    scoring.updateLocationScore(self.time, loc)
 
         elif self.parallel_mode == "loc-par":
             # update scores in reverse order for efficiency.
@@ -821,22 +1576,28 @@ class Ecosystem(flee.Ecosystem):
             if self.mpi.rank < lpr_remainder:
                 num_locs_on_this_rank += 1
 
-            for i in range(offset, offset + num_locs_on_this_rank):
-                self.locations[i].updateAllScores(time=self.time)
+            if SimulationSettings.optimisations["VectorizedScoring"] is True:
+                self.update_location_scores(start=offset, end=offset + num_locs_on_this_rank)
+            else:
+                for i in range(offset, offset + num_locs_on_this_rank):
+                    self.locations[i].updateAllScores(time=self.time)
+            self.profiler.lap("scores")
 
             self.synchronize_locations(
                 start_loc_local=offset, end_loc_local=offset + num_locs_on_this_rank
             )
+            self.profiler.lap("synchronize_locations")
 
-            # Ensure Location Routes are updated on all cores for now.
+            # Location routes were generated with the scores of the local locations,
+            # and are exchanged so that all cores have the routes of all locations.
             if SimulationSettings.move_rules["FixedRoutes"] is True:
-                for i in range(len(self.locations)):
-                    loc = self.locations[i]
-                    if len(loc.routes) == 0:
-                        #print("INFO: Generating location routes.", file=sys.stderr)
-                        crawling.generateLocationRoutes(loc, self.time)
+                self.synchronize_location_routes()
+                self.profiler.lap("synchronize_routes")
 
 
+        self.clear_route_caches()
+        self.profiler.lap("scores")
+
         # SYNCHRONIZE SPAWN COUNTS IN LOCATIONS (needed for all versions).
         spawn_counts = np.zeros(len(self.locations), dtype="i")
         for i, le in enumerate(self.locations):
@@ -849,47 +1610,100 @@ class Ecosystem(flee.Ecosystem):
         # update location spawn total.
         for i, le in enumerate(self.locations):
             le.numAgentsSpawned = spawn_totals[i]
+        self.profiler.lap("spawn_counts")
 
         # update agent locations
-        for a in self.agents:
-            a.evolve(self, time=self.time)
+        if isinstance(self.agents, AgentStore):
+            self.agents.evolve(self, time=self.time)
+        elif SimulationSettings.optimisations["BatchedRouteChoice"] is True:
+            self.evolve_agents_batched()
+        else:
+            for a in self.agents:
+                a.evolve(self, time=self.time)
+        self.profiler.lap("evolve")
+
+        if SimulationSettings.optimisations["AgentPartition"] == "location":
+            self.migrate_agents()
+            self.profiler.lap("migrate_agents")
 
         # print("NumAgents after evolve:", file=sys.stderr)
         self.updateNumAgents(CountClosed=True, log=False)
+        self.profiler.lap("update_num_agents")
 
-        for a in self.agents:
-            a.finish_travel(self, time=self.time)
-            a.timesteps_since_departure += 1
+        if isinstance(self.agents, AgentStore):
+            self.agents.finish_travel(self, time=self.time)
+        else:
+            for a in self.agents:
+                a.finish_travel(self, time=self.time)
+                a.timesteps_since_departure += 1
+        self.profiler.lap("finish_travel")
+
+        if SimulationSettings.optimisations["AgentPartition"] == "location":
+            self.migrate_agents()
+            self.profiler.lap("migrate_agents")
+
+        # The agent counts are final at this point, and are not used again until the
+        # end of the time step, so they can be reduced while the other work continues.
+        non_blocking = (
+            SimulationSettings.optimisations["NumAgentsSync"] == "non-blocking" and self.latency_mode == "high_latency"
+        )
+        if non_blocking:
+            self.start_num_agents_update()
 
         if SimulationSettings.log_levels["agent"] > 0:
-            write_agents_par(rank=self.mpi.rank, agents=self.agents, time=self.time)
+            if SimulationSettings.log_levels["agent_format"] == "columnar":
+                self.agent_column_writer.write_step(agents=self.agents, time=self.time)
+            else:
+                write_agents_par(rank=self.mpi.rank, agents=self.agents, time=self.time, writer=self.agent_writer)
 
         if SimulationSettings.log_levels["link"] > 0:
-            write_links_par(rank=self.mpi.rank, locations=self.locations, time=self.time)
+            write_links_par(rank=self.mpi.rank, locations=self.locations, time=self.time, writer=self.link_writer)
+        self.profiler.lap("logging")
 
-        for a in self.agents:
-            a.recent_travel_distance = (
-                a.recent_travel_distance
-                + (a.distance_moved_this_timestep / SimulationSettings.move_rules["MaxMoveSpeed"])
-            ) / 2.0
-            a.distance_moved_this_timestep = 0
+        if isinstance(self.agents, AgentStore):
+            self.agents.update_travel_history()
+        else:
+            for a in self.agents:
+                a.recent_travel_distance = (
+                    a.recent_travel_distance
+                    + (a.distance_moved_this_timestep / SimulationSettings.move_rules["MaxMoveSpeed"])
+                ) / 2.0
+                a.distance_moved_this_timestep = 0
+        self.profiler.lap("travel_history")
 
         # print("NumAgents after finish_travel:", file=sys.stderr)
-        self.updateNumAgents(log=False)
+        if not non_blocking:
+            self.updateNumAgents(log=False)
+            self.profiler.lap("update_num_agents")
 
         # update link properties
         if SimulationSettings.log_levels["camp"] > 0:
             self._aggregate_arrivals()
+        self.profiler.lap("arrivals")
 
         # Deactivate agents in camps with a certain probability.
         if SimulationSettings.spawn_rules["camps_are_sinks"] == True:
-            for a in self.agents:
-                if a.travelling == False:
-                    if a.location.camp == True:
-                        outcome = random.random()
-                        if outcome < a.location.attributes.get("deactivation_probability", 0.0):
-                            a.location = None
-
+            if isinstance(self.agents, AgentStore):
+                self.agents.deactivate_in_camps(self)
+            else:
+                for a in self.agents:
+                    if a.travelling == False:
+                        if a.location.camp == True:
+                            outcome = random.random()
+                            if outcome < a.location.attributes.get("deactivation_probability", 0.0):
+                                a.location = None
+        self.profiler.lap("sinks")
+
+        if non_blocking:
+            self.finish_num_agents_update(log=False)
+            self.profiler.lap("update_num_agents")
+
+        interval = SimulationSettings.optimisations["RebalanceInterval"]
+        if interval > 0 and (self.time + 1) % interval == 0:
+            self.rebalance_agents()
+            self.profiler.lap("rebalance")
+
+        self.profiler.end_step(self.time, agents=len(self.agents))
         self.time += 1
 
 
@@ -968,8 +1782,15 @@ class Ecosystem(flee.Ecosystem):
         self.locations.append(loc)
         self.spawn_weights = np.append(self.spawn_weights, [0.0])
         self.locationNames.append(loc.name)
-
-        spawning.refresh_spawn_weights(self)
+        self.locationIndex[loc.name] = len(self.locations) - 1
+        if SimulationSettings.optimisations["DistanceMatrix"] is True:
+            self.location_distances.add_location(loc)
+
+        if SimulationSettings.optimisations["VectorizedSpawnWeights"] is True:
+            # Refreshed once after loading (see StoreInputGeographyInEcosystem), or when first needed.
+            self.spawn_weights_outdated = True
+        else:
+            spawning.refresh_spawn_weights(self)
 
 
         return loc
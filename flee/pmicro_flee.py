@@ -5,7 +5,7 @@ import sys
 from functools import wraps
 from typing import Optional, Tuple
 
-from flee import pflee
+from flee import moving, pflee
 from flee.SimulationSettings import SimulationSettings  # noqa, pylint: disable=W0611
 
 if os.getenv("FLEE_TYPE_CHECK") is not None and os.environ["FLEE_TYPE_CHECK"].lower() == "true":
@@ -145,13 +145,8 @@ class Ecosystem(pflee.Ecosystem):
         Returns:
             None.
         """
-        endpoint1_index = -1
-        endpoint2_index = -1
-        for i, location_name in enumerate(self.locationNames):
-            if location_name == endpoint1:
-                endpoint1_index = i
-            if location_name == endpoint2:
-                endpoint2_index = i
+        endpoint1_index = self.locationIndex.get(endpoint1, -1)
+        endpoint2_index = self.locationIndex.get(endpoint2, -1)
 
         if endpoint1_index < 0:
             print("Diagnostic: Ecosystem.locationNames: ", self.locationNames)
@@ -187,6 +182,11 @@ class Ecosystem(pflee.Ecosystem):
             )
         )
 
+        for loc in [self.locations[endpoint1_index], self.locations[endpoint2_index]]:
+            loc.links_by_endpoint.setdefault(loc.links[-1].endpoint.name, loc.links[-1])
+
+        moving.invalidateRouteTrees()
+
 
 # -------------------------------------------------------------------------
 #           modified version of class Link for weather coupling
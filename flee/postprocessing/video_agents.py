@@ -8,10 +8,14 @@ from multiprocessing import Pool, cpu_count
 import matplotlib.pyplot as plt
 from mpl_toolkits.basemap import Basemap
 from moviepy.editor import ImageSequenceClip
+from flee.Diagnostics import read_agents_columnar
 
 def process_file(file):
     try:
-        df = pd.read_csv(file, index_col=False)
+        if os.path.isdir(file):  # columnar output (agent_format: columnar).
+            df = read_agents_columnar(file)
+        else:
+            df = pd.read_csv(file, index_col=False)
         df.index.name = 'Index'
         df = df[['#time', 'original_location', 'gps_x', 'gps_y', 'current_location']].dropna()
         # df = df.iloc[::2, :]  # Downsample rows by factor of 2
@@ -124,6 +128,8 @@ def process_files(output_dir):
         locations_df = pd.read_csv(locations_file)
         
         file_list = sorted(glob.glob('agents.out.*'), key=lambda x: int(x.split('.')[-1]))
+        if not file_list:
+            file_list = sorted(glob.glob('agents.columns.*'), key=lambda x: int(x.split('.')[-1]))
         if not file_list:
             print(
                 f"No agents.out.* files found in directory '{output_dir}'.\n"
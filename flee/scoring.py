@@ -128,3 +128,84 @@ def updateLocationScore(time: int, loc) -> None:
         #print("INFO: Generating location routes.", file=sys.stderr)
         crawling.generateLocationRoutes(loc, time)
 
+
+
+@check_args_type
+def computeLocationScores(time: int, locations) -> np.ndarray:
+    """
+    Summary:
+        Vectorized version of updateLocationScore, for many locations at once.
+        The location properties are collected into arrays, and the score
+        multipliers are applied to all locations with array operations,
+        in the same order as in updateLocationScore.
+
+    Args:
+        time (int): The current timestep
+        locations (List[Location]): The locations to calculate the scores for
+
+    Returns:
+        np.ndarray: The score (index 1 of the location scores) of each location.
+    """
+    n = len(locations)
+    move_rules = SimulationSettings.move_rules
+
+    foreign = np.fromiter((loc.foreign is True for loc in locations), dtype=bool, count=n)
+    camp = np.fromiter((bool(loc.camp or loc.idpcamp is True) for loc in locations), dtype=bool, count=n)
+    conflict = np.fromiter((loc.conflict for loc in locations), dtype=np.float64, count=n)
+
+    score = np.ones(n)
+
+    #score multiplier for foreign
+    score[foreign] *= move_rules["ForeignWeight"]
+
+    #score multiplier for camps
+    score[camp] *= move_rules["CampWeight"]
+
+    #score multiplier for conflict, with the conflict decay multiplier of each conflict zone.
+    in_conflict = np.flatnonzero(conflict > 0.0)
+    if len(in_conflict) > 0:
+        decay_table = SimulationSettings.spawn_rules["conflict_spawn_decay"]
+        if decay_table is None or len(decay_table) < 1 or SimulationSettings.log_levels["conflict"] > 0:
+            # Falls back to the scalar function, which also handles the warnings and logging.
+            decay = np.array([SimulationSettings.get_location_conflict_decay(time, locations[i]) for i in in_conflict])
+        else:
+            interval = SimulationSettings.spawn_rules["conflict_spawn_decay_interval"]
+            time_since_conflict = time - np.array([locations[i].time_of_conflict for i in in_conflict], dtype=np.float64)
+            decay_index = np.minimum(np.trunc(time_since_conflict / interval).astype(int), len(decay_table) - 1)
+            decay = np.array([float(d) for d in decay_table])[decay_index]
+        score[in_conflict] *= np.power(float(move_rules["ConflictWeight"]), decay * conflict[in_conflict])
+
+    #score multiplier for flooding, only for flood zones.
+    flooded = [i for i in range(n) if locations[i].flood_zone and locations[i].attributes.get("flood_level") is not None]
+    if len(flooded) > 0:
+        flood_levels = [locations[i].attributes.get("flood_level") for i in flooded]
+        score[flooded] *= np.array([float(move_rules["FloodLocWeights"][fl]) for fl in flood_levels])
+
+        if move_rules["FloodForecaster"] is True:
+            forecast_timescale = move_rules["FloodForecasterTimescale"]
+            forecast_end_time = move_rules["FloodForecasterEndTime"]
+
+            if forecast_timescale is None:
+                print("WARNING: flood_forecaster_timescale is not set in simsetting.yml", file=sys.stderr)
+            elif forecast_end_time is None:
+                print("WARNING: flood_forecaster_endtime is not set in simsetting.yml", file=sys.stderr)
+            elif (forecast_timescale > 1.0) and (time <= forecast_end_time):
+                forecast_levels = [locations[i].attributes.get("forecast_flood_level",0) for i in flooded]
+                forecast_weights = np.array(
+                    [float(move_rules["FloodLocWeights"][fl]) if fl > 0.0 else 0.0 for fl in forecast_levels]
+                )
+                forecasted = np.array([fl > 0.0 for fl in forecast_levels])
+
+                # Same accumulation over the forecast days as updateLocationScore.
+                flood_forecast_score = np.zeros(len(flooded))
+                for x in range(1, forecast_timescale + 1):
+                    forecast_day = min(time + x, forecast_end_time)
+                    flood_forecaster_weight = float(move_rules["FloodForecasterWeights"][forecast_day])
+                    flood_forecast_score[forecasted] += forecast_weights[forecasted] * flood_forecaster_weight
+                    if forecast_day == forecast_end_time:
+                        break
+
+                flood_forecast_score *= flood_forecast_score / forecast_timescale
+                score[flooded] *= flood_forecast_score
+
+    return score
@@ -1,4 +1,5 @@
 from flee.SimulationSettings import SimulationSettings
+from flee.agentattributes import attribute_schema
 import numpy as np
 import sys
 import os
@@ -19,6 +20,12 @@ __refugee_debt = 0
 
 __demographics = {}
 
+# Cumulative weights of the demographic attributes, per attribute and column.
+__demographic_tables = {}
+
+# Attribute code of each row of the demographic attributes.
+__demographic_codes = {}
+
 
 def getAttributeRatio(location, attr_name):
     """
@@ -50,6 +57,14 @@ def refresh_spawn_weights(e):
     Returns:
         None.
     """
+    e.spawn_weights_outdated = False
+
+    # The decay of each location is logged one by one when conflict logging is enabled,
+    # and decay factors given as a dictionary are looked up one by one.
+    if SimulationSettings.optimisations["VectorizedSpawnWeights"] is True and SimulationSettings.log_levels["conflict"] < 1:
+        if not isinstance(SimulationSettings.spawn_rules["conflict_spawn_decay"], dict):
+            refresh_spawn_weights_vectorized(e)
+            return
 
     conflict_pop_weight = 1.0
     attribute_weights = {} #TODO: Implement (food security stretch goal)
@@ -80,6 +95,44 @@ def refresh_spawn_weights(e):
     e.spawn_weight_total = sum(e.spawn_weights)
 
 
+def refresh_spawn_weights_vectorized(e):
+    """
+    Summary:
+        Refreshes the spawn weights for all locations with array operations.
+        Computes the same weights as refresh_spawn_weights.
+
+    Args:
+        e (Ecosystem): Ecosystem object
+
+    Returns:
+        None.
+    """
+    n = len(e.locations)
+    weights = np.zeros(n)
+
+    if not SimulationSettings.spawn_rules["conflict_driven_spawning"] and n > 0:
+        conflict = np.fromiter((loc.conflict for loc in e.locations), dtype=np.float64, count=n)
+        in_conflict = np.flatnonzero(conflict > 0.0)
+
+        if len(in_conflict) > 0:
+            pop = np.array([e.locations[i].pop for i in in_conflict], dtype=np.float64)
+            multiplier = conflict[in_conflict]
+
+            decay = SimulationSettings.spawn_rules["conflict_spawn_decay"]
+            if decay:
+                # Same index as SimulationSettings.get_conflict_decay.
+                time_of_conflict = np.array([e.locations[i].time_of_conflict for i in in_conflict])
+                interval = SimulationSettings.spawn_rules["conflict_spawn_decay_interval"]
+                index = np.minimum(np.trunc((e.time - time_of_conflict) / interval).astype(np.int64), len(decay) - 1)
+                multiplier = multiplier * np.array(decay, dtype=np.float64)[index]
+
+            weights[in_conflict] = pop * 1.0 * multiplier
+
+    e.spawn_weights = weights
+    # Summed in order, as sum(e.spawn_weights).
+    e.spawn_weight_total = np.cumsum(weights)[-1] if n > 0 else 0
+
+
 def read_demographic_csv(e, csvname):
   """
   Summary:
@@ -109,6 +162,8 @@ def read_demographic_csv(e, csvname):
     print("INFO: ", attribute, " attributes loaded, with columns:", df.columns, file=sys.stderr)
   
   __demographics[attribute] = df
+  __demographic_tables.pop(attribute, None)
+  __demographic_codes[attribute] = attribute_schema.register(attribute, df[attribute].tolist())
 
 
 def read_demographics(e):
@@ -154,6 +209,8 @@ def draw_sample(e, loc, attribute):
   #print(__demographics[attribute], file=sys.stderr)
   #print(__demographics[attribute].iloc[0]['Default'], file=sys.stderr)
   if attribute in __demographics:
+    if SimulationSettings.optimisations["DemographicTables"] is True:
+      return draw_sample_table(loc, attribute, 1)[0]
     if loc.name in __demographics[attribute].columns:
       a = __demographics[attribute].sample(n=1,weights=loc.name)
     else:
@@ -164,6 +221,71 @@ def draw_sample(e, loc, attribute):
   return a.iloc[0][attribute]
 
 
+def get_demographic_table(attribute, column):
+  """
+  Summary:
+      Returns the values of an attribute and their cumulative weights
+      for a column of the attribute CSV file. Tables are built once and cached.
+
+  Args:
+      attribute (str): Attribute name
+      column (str): Name of the weight column (location name or 'Default')
+
+  Returns:
+      Tuple[numpy.ndarray, numpy.ndarray]: Attribute values and normalized cumulative weights.
+  """
+  tables = __demographic_tables.setdefault(attribute, {})
+  if column not in tables:
+    df = __demographics[attribute]
+    cumulative_weights = np.cumsum(df[column].to_numpy(dtype=float))
+    tables[column] = (df[attribute].to_numpy(), cumulative_weights / cumulative_weights[-1])
+  return tables[column]
+
+
+def draw_sample_table(loc, attribute, n):
+  """
+  Summary:
+      Draw n samples from the attribute distribution for a location,
+      using the cached cumulative weights.
+
+  Args:
+      loc (Location): Location object
+      attribute (str): Attribute name
+      n (int): Number of samples
+
+  Returns:
+      numpy.ndarray: Samples from the attribute distribution.
+  """
+  column = 'Default'
+  if loc.name in __demographics[attribute].columns:
+    column = loc.name
+
+  values, cumulative_weights = get_demographic_table(attribute, column)
+  return values[np.searchsorted(cumulative_weights, np.random.random(n), side="right")]
+
+
+def draw_sample_rows(loc, attribute, n):
+  """
+  Summary:
+      Draw n rows of the attribute CSV file for a location,
+      using the cached cumulative weights.
+
+  Args:
+      loc (Location): Location object
+      attribute (str): Attribute name
+      n (int): Number of samples
+
+  Returns:
+      numpy.ndarray: Indices of the drawn rows.
+  """
+  column = 'Default'
+  if loc.name in __demographics[attribute].columns:
+    column = loc.name
+
+  _, cumulative_weights = get_demographic_table(attribute, column)
+  return np.searchsorted(cumulative_weights, np.random.random(n), side="right")
+
+
 def draw_samples(e,loc):
     """
     Summary:
@@ -182,6 +304,88 @@ def draw_samples(e,loc):
     return samples
 
 
+def draw_samples_batch(e, loc, n):
+    """
+    Summary:
+        Draw samples from all optional attributes for n agents in a location.
+        With the DemographicTables optimisation, each attribute is sampled
+        for all agents at once.
+
+    Args:
+        e (Ecosystem): Ecosystem object
+        loc (Location): Location object
+        n (int): Number of agents
+
+    Returns:
+        List[Dict]: List of n dictionaries of attribute names and values.
+    """
+    if SimulationSettings.optimisations["DemographicTables"] is not True:
+        return [draw_samples(e, loc) for i in range(0, n)]
+
+    if SimulationSettings.optimisations["AttributeCodes"] is True:
+        return draw_records_batch(loc, n)
+
+    samples = [{} for i in range(0, n)]
+    for a in __demographics.keys():
+        for k, value in enumerate(draw_sample_table(loc, a, n)):
+            samples[k][a] = value
+    return samples
+
+
+def draw_records_batch(loc, n):
+    """
+    Summary:
+        Draw the attribute codes of n agents in a location, and return
+        the shared attribute record of each agent. Only one record is looked up
+        for each distinct combination of attribute values.
+
+    Args:
+        loc (Location): Location object
+        n (int): Number of agents
+
+    Returns:
+        List[AttributeRecord]: List of n attribute records.
+    """
+    names = list(__demographics.keys())
+    if len(names) == 0:
+        return [attribute_schema.encode({}) for i in range(0, n)]
+
+    codes = np.empty((n, len(names)), dtype=np.int64)
+    for j, a in enumerate(names):
+        codes[:, j] = __demographic_codes[a][draw_sample_rows(loc, a, n)]
+
+    unique_codes, inverse = np.unique(codes, axis=0, return_inverse=True)
+    records = [attribute_schema.record(names, row) for row in unique_codes]
+    return [records[k] for k in inverse.reshape(-1)]
+
+
+def draw_samples_for_locations(e, locs):
+    """
+    Summary:
+        Draw samples from all optional attributes for one agent in each
+        of the given locations. Agents in the same location are sampled together.
+
+    Args:
+        e (Ecosystem): Ecosystem object
+        locs (List[Location]): List of locations, one per agent
+
+    Returns:
+        List[Dict]: List of dictionaries of attribute names and values, in the order of locs.
+    """
+    if SimulationSettings.optimisations["DemographicTables"] is not True:
+        return [draw_samples(e, loc) for loc in locs]
+
+    positions = {}
+    for k, loc in enumerate(locs):
+        positions.setdefault(loc, []).append(k)
+
+    samples = [None] * len(locs)
+    for loc in positions:
+        for k, attributes in zip(positions[loc], draw_samples_batch(e, loc, len(positions[loc]))):
+            samples[k] = attributes
+    return samples
+
+
 def add_initial_refugees(e, d, loc):
   """
   Summary:
@@ -209,9 +413,8 @@ def add_initial_refugees(e, d, loc):
       num_refugees += int(d.get_field(loc.name, 0, FullInterpolation=True))
 
   num_refugees += int(loc.attributes.get("initial_idps",0))
-  for i in range(0, num_refugees):
-      attributes = draw_samples(e, loc)
-      e.insertAgent(location=loc, attributes=attributes) # Parallelization is incorporated *inside* the addAgent function.
+  attributes_batch = draw_samples_batch(e, loc, num_refugees)
+  e.insertAgents(location=loc, number=num_refugees, attributes_batch=attributes_batch) # Parallelization is incorporated *inside* the insertAgents function.
 
 
 @check_args_type
@@ -257,9 +460,9 @@ def spawn_daily_displaced(e, t, d):
                 num_spawned = np.random.poisson(SimulationSettings.spawn_rules["displaced_per_conflict_day"] * e.locations[i].conflict)
 
         ## Doing the actual spawning here.
-        for j in range(0, num_spawned):
-            attributes = draw_samples(e, e.locations[i])
-            e.addAgent(location=e.locations[i], attributes=attributes) # Parallelization is incorporated *inside* the addAgent function.
+        num_spawned = int(num_spawned)
+        attributes_batch = draw_samples_batch(e, e.locations[i], num_spawned)
+        e.addAgents(location=e.locations[i], count=num_spawned, attributes_batch=attributes_batch) # Parallelization is incorporated *inside* the addAgents function.
 
         new_refs += num_spawned
 
@@ -284,9 +487,9 @@ def spawn_daily_displaced(e, t, d):
                 num_spawned = np.random.poisson(int(SimulationSettings.spawn_rules["displaced_per_flood_day"][flood_level]))
 
         ## Doing the actual spawning here.
-        for j in range(0, num_spawned):
-            attributes = draw_samples(e, e.locations[i])
-            e.addAgent(location=e.locations[i], attributes=attributes) # Parallelization is incorporated *inside* the addAgent function.
+        num_spawned = int(num_spawned)
+        attributes_batch = draw_samples_batch(e, e.locations[i], num_spawned)
+        e.addAgents(location=e.locations[i], count=num_spawned, attributes_batch=attributes_batch) # Parallelization is incorporated *inside* the addAgents function.
 
         new_refs += num_spawned
 
@@ -318,9 +521,9 @@ def spawn_daily_displaced(e, t, d):
 
       #Insert refugee agents
       locs = e.pick_spawn_locations(new_refs)
+      attribute_list = draw_samples_for_locations(e, locs)
       for i in range(0, new_refs):
-        attributes = draw_samples(e, locs[i])
-        e.addAgent(location=locs[i], attributes=attributes) # Parallelization is incorporated *inside* the addAgent function.
+        e.addAgent(location=locs[i], attributes=attribute_list[i]) # Parallelization is incorporated *inside* the addAgent function.
 
     return new_refs, __refugees_raw, __refugee_debt
 
@@ -118,3 +118,5 @@ if __name__ == "__main__":
       output += ",{}".format(e.numIDPs())
 
     print(output)
+
+  e.close()
@@ -124,3 +124,4 @@ if __name__ == "__main__":
     if e.getRankN(t):
         print(output)
 
+  e.close()
@@ -0,0 +1,92 @@
+import numpy as np
+from flee import pflee
+
+"""
+Agents of the parallel version partitioned by the rank that owns their location.
+"""
+
+
+def test_agent_partition():
+    pflee.SimulationSettings.ReadFromYML("empty.yml")
+
+    pflee.SimulationSettings.move_rules["MaxMoveSpeed"] = 150.0
+    pflee.SimulationSettings.move_rules["MaxWalkSpeed"] = 150.0
+    pflee.SimulationSettings.optimisations["AgentPartition"] = "location"
+
+    e = pflee.Ecosystem()
+
+    l1 = e.addLocation(name="A", movechance=1.0)
+    l2 = e.addLocation(name="B", movechance=1.0)
+    l3 = e.addLocation(name="C", movechance=0.0)
+    l4 = e.addLocation(name="D", movechance=0.0)
+
+    e.linkUp(endpoint1="A", endpoint2="B", distance=100.0)
+    e.linkUp(endpoint1="B", endpoint2="C", distance=200.0)
+    e.linkUp(endpoint1="A", endpoint2="D", distance=300.0)
+
+    # Neighbouring locations share a block of the breadth-first ordering.
+    size = e.mpi.size
+    e.mpi.size = 2
+    e.partition_locations()
+    assert list(e.location_owner) == [0, 0, 1, 1]
+    e.mpi.size = size
+    e.partition_locations()
+
+    e.addAgents(location=l1, count=100)
+    e.insertAgent(location=l2, attributes={"age": 20})
+
+    for t in range(0, 5):
+        e.evolve()
+        on_links = sum([l.numAgents for loc in e.locations for l in loc.links])
+        assert l1.numAgents + l2.numAgents + l3.numAgents + l4.numAgents + on_links == 101
+
+    # Agents survive a round trip through the migration records.
+    a = [a for a in e.agents if a.attributes.get("age") == 20][0]
+    record = e._pack_agent(a)
+    a.location.numAgentsOnRank -= 1
+    e.agents.remove(a)
+    e._unpack_agent(record)
+    b = e.agents[-1]
+    assert b.location is a.location
+    assert b.home_location is l2
+    assert b.timesteps_since_departure == a.timesteps_since_departure
+    assert sum([loc.numAgentsOnRank for loc in e.locations]) + sum(
+        [l.numAgentsOnRank for loc in e.locations for l in loc.links]
+    ) == 101
+
+    pflee.SimulationSettings.optimisations["AgentPartition"] = "round-robin"
+
+
+def test_rebalance_agents():
+    pflee.SimulationSettings.ReadFromYML("empty.yml")
+    pflee.SimulationSettings.optimisations["RebalanceInterval"] = 2
+
+    e = pflee.Ecosystem()
+
+    l1 = e.addLocation(name="A", movechance=1.0)
+    _ = e.addLocation(name="B", movechance=1.0)
+    _ = e.addLocation(name="C", movechance=1.0)
+    _ = e.addLocation(name="D", movechance=0.0)
+
+    e.linkUp(endpoint1="A", endpoint2="B", distance=10.0)
+    e.linkUp(endpoint1="B", endpoint2="C", distance=10.0)
+    e.linkUp(endpoint1="C", endpoint2="D", distance=10.0)
+
+    # With weights, blocks hold about the same load instead of the same number of locations.
+    size = e.mpi.size
+    e.mpi.size = 2
+    e.partition_locations(weights=np.array([1.0, 1.0, 1.0, 9.0]))
+    assert list(e.location_owner) == [0, 0, 0, 1]
+    e.mpi.size = size
+
+    e.addAgents(location=l1, count=50)
+    for t in range(0, 4):
+        e.evolve()
+    assert len(e.agents) == e.numAgents() == 50
+
+    pflee.SimulationSettings.optimisations["RebalanceInterval"] = 0
+
+
+if __name__ == "__main__":
+    test_agent_partition()
+    test_rebalance_agents()
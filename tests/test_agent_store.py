@@ -0,0 +1,99 @@
+from flee import flee
+from flee.agentstore import AgentStore
+
+"""
+Agents stored in NumPy columns instead of a list of Person objects.
+"""
+
+
+def test_agent_store():
+    flee.SimulationSettings.ReadFromYML("empty.yml")
+
+    flee.SimulationSettings.move_rules["MaxMoveSpeed"] = 150.0
+    flee.SimulationSettings.move_rules["MaxWalkSpeed"] = 150.0
+    flee.SimulationSettings.optimisations["AgentStore"] = True
+
+    end_time = 10
+    e = flee.Ecosystem()
+    assert isinstance(e.agents, AgentStore)
+
+    l1 = e.addLocation(name="A", movechance=1.0)
+    l2 = e.addLocation(name="B", movechance=1.0)
+    l3 = e.addLocation(name="C", movechance=0.0)
+
+    e.linkUp(endpoint1="A", endpoint2="B", distance=100.0)
+    e.linkUp(endpoint1="B", endpoint2="C", distance=200.0)
+
+    for _ in range(0, 2000):
+        e.addAgent(location=l1, attributes={"gender": "female"})
+
+    assert len(e.agents) == 2000
+    assert e.agents[0].location is l1
+    assert e.agents[-1].attributes["gender"] == "female"
+
+    for t in range(0, end_time):
+        e.evolve()
+
+        on_links = sum([l.numAgents for loc in e.locations for l in loc.links])
+        assert l1.numAgents + l2.numAgents + l3.numAgents + on_links == 2000
+
+        # Views report the same state as the columns of the store.
+        assert sum([a.travelling for a in e.agents]) == on_links
+
+    assert l3.numAgents > 0
+    assert e.agents[0].home_location is l1
+    assert e.agents[0].timesteps_since_departure == end_time
+
+    num_in_c = l3.numAgents
+    e.clearLocationsFromAgents(["C"])
+    assert len(e.agents) == 2000 - num_in_c
+    assert all([a.location is not l3 for a in e.agents])
+    assert l3.numAgents == 0
+
+    flee.SimulationSettings.optimisations["AgentStore"] = False
+
+
+def test_agent_store_flood_awareness():
+    flee.SimulationSettings.ReadFromYML("empty.yml")
+
+    flee.SimulationSettings.move_rules["FloodRulesEnabled"] = True
+    flee.SimulationSettings.move_rules["FloodLocWeights"] = [0.0, 1.0, 1.0, 1.0, 1.0]
+    flee.SimulationSettings.move_rules["FloodForecaster"] = True
+    flee.SimulationSettings.move_rules["FloodForecasterTimescale"] = 2
+    flee.SimulationSettings.move_rules["FloodForecasterEndTime"] = 6
+    flee.SimulationSettings.move_rules["FloodForecasterWeights"] = [1.0, 1.0, 1.0, 1.0, 1.0, 1.0, 1.0]
+    flee.SimulationSettings.move_rules["FloodAwarenessWeights"] = [0.0, 0.5, 1.0]
+    flee.SimulationSettings.optimisations["AgentStore"] = True
+
+    e = flee.Ecosystem()
+
+    l1 = e.addLocation(name="A", movechance=1.0, attributes={"forecast_flood_levels": [1, 1, 1, 1, 1, 1, 1]})
+    e.addLocation(name="B", movechance=0.0, attributes={"forecast_flood_levels": [0, 0, 0, 0, 0, 0, 0]})
+
+    e.linkUp(endpoint1="A", endpoint2="B", distance=100.0)
+
+    for awareness in [0, 2]:
+        for _ in range(0, 100):
+            e.addAgent(location=l1, attributes={"floodawareness": awareness})
+
+    assert list(e.agents.move_chance_class[:200]) == [-1] * 200
+
+    e.evolve()
+
+    # Agents without flood awareness ignore the forecast and stay.
+    assert all([a.location is l1 for a in e.agents if a.attributes["floodawareness"] == 0])
+    assert all([a.location is not l1 for a in e.agents if a.attributes["floodawareness"] == 2])
+
+    # Flood awareness is read once per agent, and read again when the attributes are replaced.
+    assert list(e.agents.move_chance_class[:200]) == [0] * 100 + [2] * 100
+    e.agents[0].attributes = {"floodawareness": 2}
+    assert e.agents.move_chance_class[0] == -1
+
+    flee.SimulationSettings.optimisations["AgentStore"] = False
+    flee.SimulationSettings.move_rules["FloodRulesEnabled"] = False
+    flee.SimulationSettings.move_rules["FloodForecaster"] = False
+
+
+if __name__ == "__main__":
+    test_agent_store()
+    test_agent_store_flood_awareness()
@@ -71,3 +71,81 @@ def test_location_crawling_4loc():
     assert l1.routes["E"][1][0] == "D"
     assert l1.routes["E"][2].name == "E"
     
+
+
+def test_pack_location_routes():
+    flee.SimulationSettings.ReadFromYML("empty.yml")
+    flee.SimulationSettings.move_rules["AwarenessLevel"] = 2
+
+    e = flee.Ecosystem()
+
+    l1 = e.addLocation(name="A", movechance=1.0)
+    l2 = e.addLocation(name="B", movechance=1.0)
+    _ = e.addLocation(name="C", movechance=0.0)
+    _ = e.addLocation(name="D", movechance=0.0)
+
+    e.linkUp(endpoint1="A", endpoint2="B", distance=100.0)
+    e.linkUp(endpoint1="A", endpoint2="C", distance=200.0)
+    e.linkUp(endpoint1="B", endpoint2="D", distance=100.0)
+
+    for l in e.locations:
+        crawling.generateLocationRoutes(l, 0)
+    expected = [dict(l.routes) for l in e.locations]
+
+    # Route tables survive a round trip through the flattened arrays, in the same order.
+    ints, weights = crawling.packLocationRoutes([l1, l2], e.locationIndex)
+    l1.routes = {}
+    l2.routes = {}
+    crawling.unpackLocationRoutes([l1, l2], e.locations, ints, weights)
+
+    for l, routes in zip(e.locations, expected):
+        assert list(l.routes.keys()) == list(routes.keys())
+        for key in routes:
+            assert l.routes[key][0] == routes[key][0]
+            assert l.routes[key][1] == routes[key][1]
+            assert l.routes[key][2] is routes[key][2]
+
+
+def test_incremental_location_routes():
+    flee.SimulationSettings.ReadFromYML("empty.yml")
+    flee.SimulationSettings.move_rules["AwarenessLevel"] = 2
+
+    e = flee.Ecosystem()
+
+    _ = e.addLocation(name="A", movechance=1.0)
+    l2 = e.addLocation(name="B", movechance=1.0)
+    l3 = e.addLocation(name="C", movechance=0.0)
+    _ = e.addLocation(name="D", movechance=0.0)
+    _ = e.addLocation(name="E", movechance=0.0)
+    l6 = e.addLocation(name="F", movechance=0.0)
+
+    e.linkUp(endpoint1="A", endpoint2="B", distance=100.0)
+    e.linkUp(endpoint1="A", endpoint2="C", distance=200.0)
+    e.linkUp(endpoint1="B", endpoint2="D", distance=100.0)
+    e.linkUp(endpoint1="C", endpoint2="D", distance=100.0)
+    e.linkUp(endpoint1="D", endpoint2="E", distance=100.0)
+    e.linkUp(endpoint1="E", endpoint2="F", distance=100.0)
+    l2.major_routes = [["D", "E"]]
+
+    def all_routes():
+        return [
+            {name: (r[0], list(r[1]), r[2].name) for name, r in crawling.generateLocationRoutes(l, t).items()}
+            for l in e.locations
+        ]
+
+    for t in range(0, 4):
+        if t == 2:
+            l3.setScore(1, 4.0)
+        if t == 3:
+            e.remove_link("A", "C")
+
+        flee.SimulationSettings.optimisations["IncrementalRoutes"] = False
+        expected = all_routes()
+        flee.SimulationSettings.optimisations["IncrementalRoutes"] = True
+        assert all_routes() == expected
+        # Unchanged scores reuse the route table of F, which reaches no major routes.
+        routes = l6.route_topology["routes"]
+        assert all_routes() == expected
+        assert l6.routes is routes
+
+    flee.SimulationSettings.optimisations["IncrementalRoutes"] = False
@@ -74,6 +74,71 @@ def test_location_changes():
 
 
 
+def test_geography_cache(tmp_path):
+
+    flee.SimulationSettings.ReadFromYML("empty.yml")
+    flee.SimulationSettings.optimisations["GeographyCache"] = str(tmp_path / "cache")
+    flee.SimulationSettings.ConflictInputFile = os.path.join("test_data", "test_input_csv", "flare-out.csv")
+
+    tables = []
+    for _ in range(0, 2):
+        # The first pass parses the CSV files and writes the cache, the second pass reads the cache.
+        e = flee.Ecosystem()
+        ig = InputGeography.InputGeography()
+        ig.ReadLocationsFromCSV(csv_name=os.path.join("test_data", "test_input_csv/locations.csv"))
+        ig.ReadLinksFromCSV(csv_name=os.path.join("test_data", "test_input_csv/routes.csv"))
+        ig.ReadClosuresFromCSV(csv_name=os.path.join("test_data", "test_input_csv/closures.csv"))
+        e, lm = ig.StoreInputGeographyInEcosystem(e=e)
+        ig.ReadLocationChangesFromCSV(os.path.join("test_data", "test_input_csv/location_changes.csv"))
+
+        tables.append([ig.locations, ig.links, ig.link_columns, ig.major_routes, ig.closures, ig.location_changes, ig.conflicts])
+        assert lm["B"].major_routes == [["C2", "D", "E", "F"], ["C2", "C"]]
+
+    assert tables[0] == tables[1]
+    assert len(os.listdir(tmp_path / "cache")) == 6
+
+    flee.SimulationSettings.optimisations["GeographyCache"] = ""
+    flee.SimulationSettings.ConflictInputFile = ""
+
+
+def test_event_schedules():
+
+    flee.SimulationSettings.ReadFromYML("empty.yml")
+    flee.SimulationSettings.ConflictInputFile = os.path.join("test_data", "test_input_csv", "flare-out.csv")
+
+    states = []
+    for schedules in [False, True]:
+        flee.SimulationSettings.optimisations["EventSchedules"] = schedules
+        e = flee.Ecosystem()
+        ig = InputGeography.InputGeography()
+        ig.ReadLocationsFromCSV(csv_name=os.path.join("test_data", "test_input_csv/locations.csv"))
+        ig.ReadLinksFromCSV(csv_name=os.path.join("test_data", "test_input_csv/routes.csv"))
+        ig.ReadClosuresFromCSV(csv_name=os.path.join("test_data", "test_input_csv/closures.csv"))
+        e, lm = ig.StoreInputGeographyInEcosystem(e=e)
+        ig.ReadLocationChangesFromCSV(os.path.join("test_data", "test_input_csv/location_changes.csv"))
+        ig.location_changes.append(["B", "camp", "60"])
+
+        state = []
+        for t in range(0, 100):
+            if t == 20:
+                # Closures added during the simulation are scheduled too.
+                e.closures.append(["location", "C", "", 30, 40])
+            ig.AddNewConflictZones(e=e, time=t)
+            e.enact_border_closures(time=t)
+            for loc in e.locations:
+                state.append([t, loc.name, loc.conflict, loc.town, loc.camp, loc.idpcamp, len(loc.links), len(loc.closed_links)])
+        states.append(state)
+
+        if schedules:
+            assert ig.conflict_schedule[7] == ["A"]
+            assert e.closure_schedule[30] == [e.closures[-1]]
+
+    assert states[0] == states[1]
+
+    flee.SimulationSettings.optimisations["EventSchedules"] = False
+    flee.SimulationSettings.ConflictInputFile = ""
+
+
 def test_csv(end_time=30, last_physical_day=30):
 
     flee.SimulationSettings.ReadFromYML("empty.yml")
@@ -1,4 +1,5 @@
 from flee.datamanager import handle_refugee_data
+from flee.SimulationSettings import SimulationSettings
 
 """
 Generation 1 code. Incorporates only distance, travel always takes one day.
@@ -46,5 +47,39 @@ def test_datatable():
     print("SUCCESS")
 
 
+def test_dense_data_tables():
+    print("Testing dense daily series.")
+
+    values = []
+    for dense in [False, True]:
+        SimulationSettings.optimisations["DenseDataTables"] = dense
+        d = handle_refugee_data.RefugeeTable(
+            csvformat="generic",
+            data_directory="test_data",
+            start_date="2010-06-01",
+            data_layout="data_layout.csv",
+            start_empty=True,
+        )
+        for correct in [False, True]:
+            if correct:
+                # The series are built again after the data table is corrected.
+                d.correctLevel1Registrations(name="Total", date="2014-01-01")
+            for day in range(-10, 1600, 3):
+                values.append(d.get_daily_difference(day=max(day, 0)))
+                values.append(d.get_daily_difference(day=max(day, 0), FullInterpolation=False))
+                values.append(d.get_new_refugees(day=max(day, 0), FullInterpolation=False))
+                for name in d.header:
+                    values.append(d.get_field(name=name, day=day))
+                    values.append(d.get_field(name=name, day=day, FullInterpolation=False))
+
+        if dense:
+            assert d.dense_interpolated is not None
+
+    SimulationSettings.optimisations["DenseDataTables"] = False
+
+    assert values[: len(values) // 2] == values[len(values) // 2 :]
+
+
 if __name__ == "__main__":
     test_datatable()
+    test_dense_data_tables()
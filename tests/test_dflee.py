@@ -1,4 +1,5 @@
 import os
+import random
 from flee import flee, moving
 from flee import InputGeography
 import sys
@@ -410,10 +411,122 @@ def test_agent_flood_awareness():
 
 
 
+def test_flood_forecast_table():
+    """
+    Summary:
+        Test the precomputed flood forecast.
+        Reads the flood levels with and without the forecast table, and checks that the forecast sums are identical.
+
+    Returns:
+        None
+
+    Args:
+        None
+    """
+    flee.SimulationSettings.ReadFromYML("empty.yml")
+    flee.SimulationSettings.move_rules["FloodRulesEnabled"] = True
+    flee.SimulationSettings.move_rules["FloodLocWeights"] = [1.0, 0.7, 0.4, 0.1]
+    flee.SimulationSettings.move_rules["FloodForecaster"] = True
+    flee.SimulationSettings.move_rules["FloodForecasterTimescale"] = 3
+    flee.SimulationSettings.move_rules["FloodForecasterEndTime"] = 8
+    flee.SimulationSettings.move_rules["FloodForecasterWeights"] = [1.0, 0.9, 0.8, 0.7, 0.6, 0.5, 0.4, 0.3, 0.3, 0.1, 0.3]
+
+    e = flee.Ecosystem()
+    ig = InputGeography.InputGeography()
+    ig.ReadLocationsFromCSV(csv_name=os.path.join("test_data/test_data_dflee", "test_input_csv/locations.csv"))
+    ig.ReadLinksFromCSV(csv_name=os.path.join("test_data/test_data_dflee", "test_input_csv/routes.csv"))
+    ig.ReadClosuresFromCSV(csv_name=os.path.join("test_data/test_data_dflee", "test_input_csv/closures.csv"))
+    ig.ReadAttributeInputCSV("flood_level", "int", os.path.join("test_data/test_data_dflee","test_input_csv/flood_level.csv"))
+
+    flee.SimulationSettings.optimisations["FloodForecastTable"] = True
+    ig.ReadAttributeInputCSV("forecast_flood_levels", "int", os.path.join("test_data/test_data_dflee","test_input_csv/flood_level.csv"))
+    assert len(ig.forecast_flood_sums) == 2
+
+    e, lm = ig.StoreInputGeographyInEcosystem(e=e)
+    ig.AddNewConflictZones(e, 0)
+    assert "forecast_flood_sums" in lm["A"].attributes
+
+    for t in range(0, 9):
+        for loc in e.locations:
+            flee.SimulationSettings.optimisations["FloodForecastTable"] = True
+            table_sum = moving.getForecastFloodSum(loc, t)
+            flee.SimulationSettings.optimisations["FloodForecastTable"] = False
+            assert table_sum == moving.getForecastFloodSum(loc, t)
+
+    # Days 2, 3 and 4 of location B have flood levels 1, 3 and 1.
+    assert abs(moving.getForecastFloodSum(lm["B"], 1) - (0.7 * 0.8 + 0.1 * 0.7 + 0.7 * 0.6)) < 1e-12
+
+
+def test_incremental_attributes():
+    """
+    Summary:
+        Test the flood level table.
+        Runs the same simulation with and without the table, and checks that the flood attributes and agent moves are identical.
+
+    Returns:
+        None
+
+    Args:
+        None
+    """
+    states = []
+    for incremental in [False, True]:
+        flee.SimulationSettings.ReadFromYML("empty.yml")
+        flee.SimulationSettings.move_rules["FloodRulesEnabled"] = True
+        flee.SimulationSettings.move_rules["FloodLocWeights"] = [1.0, 0.7, 0.4, 0.1]
+        flee.SimulationSettings.move_rules["FloodMovechances"] = [0.3, 0.5, 0.7, 0.9]
+        flee.SimulationSettings.move_rules["FloodForecaster"] = True
+        flee.SimulationSettings.move_rules["FloodForecasterTimescale"] = 3
+        flee.SimulationSettings.move_rules["FloodForecasterEndTime"] = 8
+        flee.SimulationSettings.move_rules["FloodForecasterWeights"] = [1.0, 0.9, 0.8, 0.7, 0.6, 0.5, 0.4, 0.3, 0.3, 0.1, 0.3]
+        flee.SimulationSettings.move_rules["FloodAwarenessWeights"] = [0.0, 0.5, 1.0]
+        flee.SimulationSettings.optimisations["FloodForecastTable"] = True
+        flee.SimulationSettings.optimisations["IncrementalAttributes"] = incremental
+
+        e = flee.Ecosystem()
+        ig = InputGeography.InputGeography()
+        ig.ReadLocationsFromCSV(csv_name=os.path.join("test_data/test_data_dflee", "test_input_csv/locations.csv"))
+        ig.ReadLinksFromCSV(csv_name=os.path.join("test_data/test_data_dflee", "test_input_csv/routes.csv"))
+        ig.ReadClosuresFromCSV(csv_name=os.path.join("test_data/test_data_dflee", "test_input_csv/closures.csv"))
+        ig.ReadAttributeInputCSV("flood_level", "int", os.path.join("test_data/test_data_dflee","test_input_csv/flood_level.csv"))
+        ig.ReadAttributeInputCSV("forecast_flood_levels", "int", os.path.join("test_data/test_data_dflee","test_input_csv/flood_level.csv"))
+        e, lm = ig.StoreInputGeographyInEcosystem(e=e)
+
+        for _ in range(0, 50):
+            e.addAgent(location=lm["A"], attributes={"floodawareness": 1.0})
+            e.addAgent(location=lm["B"], attributes={"floodawareness": 0.5})
+
+        random.seed(7)
+        state = []
+        for t in range(0, 11):
+            ig.AddNewConflictZones(e, t)
+            e.evolve()
+            for loc in e.locations:
+                state.append([
+                    t,
+                    loc.name,
+                    loc.attributes["flood_level"],
+                    list(loc.attributes["forecast_flood_levels"]),
+                    list(loc.attributes.get("forecast_flood_sums", [])),
+                    loc.numAgents,
+                ])
+        states.append(state)
+
+    assert states[0] == states[1]
+
+    # The forecast of each location is a read-only row of one table.
+    assert lm["A"].attributes["forecast_flood_levels"].base is ig.attribute_tables["forecast_flood_levels"]["values"]
+    assert not lm["C"].attributes["forecast_flood_levels"].flags.writeable
+
+    flee.SimulationSettings.optimisations["FloodForecastTable"] = False
+    flee.SimulationSettings.optimisations["IncrementalAttributes"] = False
+
 
 if __name__ == "__main__":
     test_read_flood_csv()
     test_flood_level_location_attribute()
     test_flood_forecaster()
     test_agent_flood_awareness()
+    test_flood_forecast_table()
+    test_incremental_attributes()
     pass
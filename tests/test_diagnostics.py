@@ -0,0 +1,151 @@
+import json
+import numpy as np
+import pandas as pd
+from flee import flee, Diagnostics
+
+"""
+Agent and link logs are written through writers that keep the files open.
+"""
+
+
+def test_diagnostics_writer(tmp_path, monkeypatch):
+    flee.SimulationSettings.ReadFromYML("empty.yml")
+    flee.SimulationSettings.log_levels["agent"] = 1
+    flee.SimulationSettings.log_levels["link"] = 1
+
+    monkeypatch.chdir(tmp_path)
+
+    e = flee.Ecosystem()
+
+    l1 = e.addLocation(name="A", movechance=1.0)
+    _ = e.addLocation(name="B", movechance=0.0)
+
+    e.linkUp(endpoint1="A", endpoint2="B", distance=10.0)
+
+    e.addAgents(location=l1, count=20, attributes_batch=[{"age": 30}] * 20)
+
+    for t in range(0, 3):
+        e.evolve()
+        # Rows are flushed at the end of every time step.
+        with open("agents.out.0") as f:
+            assert len(f.readlines()) == 1 + 20 * (t + 1)
+
+    e.close()
+
+    with open("agents.out.0") as f:
+        lines = f.readlines()
+    assert lines[0].startswith("#time,rank-agentid")
+    assert lines[0].strip().endswith("age,")
+    assert lines[1].startswith("0,0-0,A,")
+    assert lines[-1].strip().endswith(",30,")
+
+    with open("links.out.0") as f:
+        lines = f.readlines()
+    assert len(lines) == 1 + 2 * 3
+
+    flee.SimulationSettings.log_levels["agent"] = 0
+    flee.SimulationSettings.log_levels["link"] = 0
+
+
+def test_agent_columns(tmp_path, monkeypatch):
+    flee.SimulationSettings.ReadFromYML("empty.yml")
+    flee.SimulationSettings.log_levels["agent"] = 1
+    flee.SimulationSettings.log_levels["agent_format"] = "columnar"
+
+    monkeypatch.chdir(tmp_path)
+
+    e = flee.Ecosystem()
+
+    l1 = e.addLocation(name="A", x=1.0, y=2.0, movechance=1.0)
+    _ = e.addLocation(name="B", x=3.0, y=4.0, movechance=0.0)
+
+    e.linkUp(endpoint1="A", endpoint2="B", distance=100.0)
+
+    e.addAgents(location=l1, count=10, attributes_batch=[{"age": 30, "gender": "male"}] * 10)
+    e.addAgents(location=l1, count=5, attributes_batch=[{"age": 5}] * 5)
+
+    for t in range(0, 3):
+        e.evolve()
+        # CSV output of the same agents, for comparison.
+        Diagnostics.write_agents(agents=e.agents, time=t)
+    e.agent_column_writer.close()
+
+    schema, data = Diagnostics.read_agent_columns("agents.columns.0")
+    assert [rows for _, rows in schema["timesteps"]] == [15, 15, 15]
+    assert data["gps_x"].dtype == np.float64
+    assert data["attribute_gender"][-1] == -1
+
+    df = Diagnostics.read_agents_columnar("agents.columns.0")
+    df_csv = pd.read_csv("agents.out.0", index_col=False)
+    for column in ["#time", "rank-agentid", "original_location", "current_location", "gps_x", "gps_y", "places_travelled"]:
+        assert list(df[column]) == list(df_csv[column])
+    assert list(df["age"].astype(int)) == list(df_csv["age"])
+
+    flee.SimulationSettings.log_levels["agent"] = 0
+    flee.SimulationSettings.log_levels["agent_format"] = "csv"
+
+
+def test_agent_columns_region(tmp_path, monkeypatch):
+    flee.SimulationSettings.ReadFromYML("empty.yml")
+    flee.SimulationSettings.move_rules["MaxMoveSpeed"] = 50.0
+    flee.SimulationSettings.log_levels["agent"] = 1
+    flee.SimulationSettings.log_levels["agent_format"] = "columnar"
+    flee.SimulationSettings.log_levels["granularity"] = "region"
+
+    monkeypatch.chdir(tmp_path)
+
+    e = flee.Ecosystem()
+
+    l1 = e.addLocation(name="A", region="R1", movechance=1.0)
+    _ = e.addLocation(name="B", region="R2", movechance=0.0)
+
+    e.linkUp(endpoint1="A", endpoint2="B", distance=100.0)
+
+    e.addAgents(location=l1, count=10)
+
+    e.evolve()
+    # All agents are halfway along the link, and are assigned the region of its endpoint.
+    Diagnostics.write_agents(agents=e.agents, time=0)
+    e.agent_column_writer.close()
+
+    df = Diagnostics.read_agents_columnar("agents.columns.0")
+    df_csv = pd.read_csv("agents.out.0", index_col=False)
+    assert list(df["current_location"]) == ["R2"] * 10
+    for column in ["original_location", "current_location"]:
+        assert list(df[column]) == list(df_csv[column])
+
+    flee.SimulationSettings.log_levels["agent"] = 0
+    flee.SimulationSettings.log_levels["agent_format"] = "csv"
+    flee.SimulationSettings.log_levels["granularity"] = "location"
+
+
+def test_step_timing(tmp_path, monkeypatch):
+    flee.SimulationSettings.ReadFromYML("empty.yml")
+    flee.SimulationSettings.log_levels["timing"] = 1
+
+    monkeypatch.chdir(tmp_path)
+
+    e = flee.Ecosystem()
+
+    l1 = e.addLocation(name="A", movechance=1.0)
+    _ = e.addLocation(name="B", movechance=0.0)
+
+    e.linkUp(endpoint1="A", endpoint2="B", distance=10.0)
+
+    e.addAgents(location=l1, count=20)
+
+    for t in range(0, 2):
+        e.evolve()
+    e.profiler.close()
+
+    with open("timing.out.0") as f:
+        records = [json.loads(line) for line in f]
+
+    assert [r["time"] for r in records] == [0, 1]
+    assert records[0]["agents"] == 20
+    assert records[0]["movers"] == 20
+    assert records[0]["route_selections"] == 20
+    assert records[0]["evolve"] >= 0.0
+    assert "movers" not in records[1]
+
+    flee.SimulationSettings.log_levels["timing"] = 0
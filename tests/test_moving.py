@@ -1,4 +1,7 @@
+import pytest
+
 from flee import flee
+from flee.agentstore import AgentStore
 from flee.datamanager import handle_refugee_data
 
 
@@ -158,6 +161,170 @@ def test_prune_routes2():
     assert routes[0] == "D"
 
 
+def test_route_cache():
+    flee.SimulationSettings.ReadFromYML("empty.yml")
+    flee.SimulationSettings.move_rules["AwarenessLevel"] = 2
+    flee.SimulationSettings.optimisations["RouteCache"] = True
+
+    e = flee.Ecosystem()
+
+    l1 = e.addLocation(name="A", movechance=1.0)
+    _ = e.addLocation(name="B", movechance=1.0)
+    _ = e.addLocation(name="C", movechance=1.0)
+    _ = e.addLocation(name="D", movechance=1.0)
+
+    e.linkUp(endpoint1="A", endpoint2="B", distance=100.0)
+    e.linkUp(endpoint1="A", endpoint2="C", distance=200.0)
+    e.linkUp(endpoint1="B", endpoint2="D", distance=100.0)
+
+    for _ in range(0, 10):
+        e.addAgent(location=l1, attributes={})
+
+    for a in e.agents:
+        flee.moving.selectRoute(a, time=0)
+
+    # All agents share a single cache entry.
+    assert len(l1.route_cache) == 1
+    weights, routes = list(l1.route_cache.values())[0]
+    assert sorted(routes) == [["B"], ["B", "D"], ["C"]]
+
+    flee.SimulationSettings.optimisations["RouteCache"] = False
+    ref_weights, ref_routes = flee.moving.selectRoute(e.agents[0], time=0, return_all_routes=True)
+    assert weights == ref_weights
+    flee.SimulationSettings.optimisations["RouteCache"] = True
+
+    # Closing a link invalidates the cache.
+    e.close_link(startpoint="A", endpoint="C", twoway=False)
+    assert len(l1.route_cache) == 0
+    for a in e.agents:
+        assert flee.moving.selectRoute(a, time=0)[0] == "B"
+
+    flee.SimulationSettings.optimisations["RouteCache"] = False
+
+def test_route_tree_engine():
+    flee.SimulationSettings.ReadFromYML("empty.yml")
+    flee.SimulationSettings.move_rules["AwarenessLevel"] = 3
+
+    e = flee.Ecosystem()
+
+    l1 = e.addLocation(name="A", movechance=1.0)
+    _ = e.addLocation(name="B", movechance=1.0)
+    _ = e.addLocation(name="M", location_type="marker")
+    _ = e.addLocation(name="C", location_type="camp", capacity=100)
+    _ = e.addLocation(name="D", location_type="conflict_zone")
+    _ = e.addLocation(name="E", movechance=1.0)
+
+    e.linkUp(endpoint1="A", endpoint2="B", distance=100.0)
+    e.linkUp(endpoint1="A", endpoint2="M", distance=50.0)
+    e.linkUp(endpoint1="M", endpoint2="C", distance=70.0)
+    e.linkUp(endpoint1="B", endpoint2="C", distance=120.0)
+    e.linkUp(endpoint1="B", endpoint2="D", distance=30.0)
+    e.linkUp(endpoint1="C", endpoint2="E", distance=200.0)
+    e.linkUp(endpoint1="D", endpoint2="E", distance=80.0)
+
+    e.addAgent(location=l1, attributes={})
+    a = e.agents[0]
+
+    ref_weights, ref_routes = flee.moving.selectRoute(a, time=0, return_all_routes=True)
+
+    flee.SimulationSettings.move_rules["RouteTreeEngine"] = True
+    weights, routes = flee.moving.selectRoute(a, time=0, return_all_routes=True)
+
+    assert routes == ref_routes
+    assert weights == pytest.approx(ref_weights)
+    assert ["A", "M", "C", "E"] in routes
+    assert ["A", "M"] not in routes
+
+    # Changes to the link graph invalidate the route tree.
+    e.close_link(startpoint="A", endpoint="B", twoway=False)
+    weights, routes = flee.moving.selectRoute(a, time=0, return_all_routes=True)
+    flee.SimulationSettings.move_rules["RouteTreeEngine"] = False
+    ref_weights, ref_routes = flee.moving.selectRoute(a, time=0, return_all_routes=True)
+
+    assert routes == ref_routes
+    assert weights == pytest.approx(ref_weights)
+
+def test_batched_route_choice():
+    flee.SimulationSettings.ReadFromYML("empty.yml")
+    flee.SimulationSettings.move_rules["MaxMoveSpeed"] = 5000.0
+    flee.SimulationSettings.optimisations["BatchedRouteChoice"] = True
+
+    e = flee.Ecosystem()
+
+    l1 = e.addLocation(name="A", movechance=1.0)
+    l2 = e.addLocation(name="B", movechance=0.0)
+    l3 = e.addLocation(name="C", movechance=0.0)
+
+    e.linkUp(endpoint1="A", endpoint2="B", distance=100.0)
+    e.linkUp(endpoint1="A", endpoint2="C", distance=300.0)
+
+    for _ in range(0, 1000):
+        e.addAgent(location=l1, attributes={})
+
+    e.evolve()
+
+    assert l1.numAgents == 0
+    assert l2.numAgents + l3.numAgents == 1000
+    # Route B has three times the weight of route C.
+    assert l2.numAgents > 2 * l3.numAgents
+    assert l3.numAgents > 0
+
+    flee.SimulationSettings.optimisations["BatchedRouteChoice"] = False
+
+
+def test_binomial_thinning():
+    flee.SimulationSettings.ReadFromYML("empty.yml")
+    flee.SimulationSettings.move_rules["MaxMoveSpeed"] = 5000.0
+    flee.SimulationSettings.optimisations["BinomialThinning"] = True
+
+    for agent_store in [False, True]:
+        flee.SimulationSettings.optimisations["AgentStore"] = agent_store
+        e = flee.Ecosystem()
+        assert isinstance(e.agents, AgentStore)
+
+        l1 = e.addLocation(name="A", movechance=0.1)
+        l2 = e.addLocation(name="B", movechance=0.0)
+
+        e.linkUp(endpoint1="A", endpoint2="B", distance=100.0)
+
+        for _ in range(0, 10000):
+            e.addAgent(location=l1, attributes={})
+
+        e.evolve()
+
+        assert l1.numAgents + l2.numAgents == 10000
+        # On average 1000 agents leave A, with a standard deviation of 30.
+        assert 800 < l2.numAgents < 1200
+
+    flee.SimulationSettings.optimisations["AgentStore"] = False
+    flee.SimulationSettings.optimisations["BinomialThinning"] = False
+
+
+def test_distance_matrix():
+    flee.SimulationSettings.ReadFromYML("empty.yml")
+    flee.SimulationSettings.optimisations["DistanceMatrix"] = True
+
+    e = flee.Ecosystem()
+
+    l1 = e.addLocation(name="A", x=0.0, y=0.0)
+    l2 = e.addLocation(name="B", x=1.0, y=1.0)
+    assert l1.calculateDistance(l2) > 150.0
+    assert l1.distances.dtype == "float32"
+
+    # Locations added later extend the rows that were already computed.
+    l3 = e.addLocation(name="C", x=100.0, y=50.0)
+    assert abs(l1.calculateDistance(l3) - l3.calculateDistance(l1)) < 0.01
+
+    flee.SimulationSettings.optimisations["DistanceMatrix"] = False
+    e2 = flee.Ecosystem()
+    m1 = e2.addLocation(name="A", x=0.0, y=0.0)
+    m2 = e2.addLocation(name="B", x=1.0, y=1.0)
+    m3 = e2.addLocation(name="C", x=100.0, y=50.0)
+    assert m1.distances is None
+
+    for a, b in [(l1, m1), (l2, m2), (l3, m3)]:
+        for c, d in [(l1, m1), (l2, m2), (l3, m3)]:
+            assert abs(a.calculateDistance(c) - b.calculateDistance(d)) <= 1e-6 * b.calculateDistance(d) + 1e-6
 
 
 if __name__ == "__main__":
@@ -165,5 +332,10 @@ if __name__ == "__main__":
     test_scoring_foreign_weight()
     test_prune_routes()
     test_prune_routes2()
+    test_route_cache()
+    test_route_tree_engine()
+    test_batched_route_choice()
+    test_binomial_thinning()
+    test_distance_matrix()
     pass
     
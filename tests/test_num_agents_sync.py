@@ -0,0 +1,50 @@
+import random
+import numpy as np
+from flee import pflee
+
+"""
+Agent counts of the parallel version synchronized with delta and non-blocking reductions.
+"""
+
+
+def run_network(sync):
+    pflee.SimulationSettings.ReadFromYML("empty.yml")
+    pflee.SimulationSettings.optimisations["NumAgentsSync"] = sync
+
+    random.seed(1)
+    np.random.seed(1)
+
+    e = pflee.Ecosystem()
+
+    l1 = e.addLocation(name="A", movechance=1.0)
+    _ = e.addLocation(name="B", movechance=1.0)
+    _ = e.addLocation(name="C", movechance=0.0)
+
+    e.linkUp(endpoint1="A", endpoint2="B", distance=100.0)
+    e.linkUp(endpoint1="B", endpoint2="C", distance=200.0)
+
+    e.addAgents(location=l1, count=100)
+
+    counts = []
+    for t in range(0, 6):
+        if t == 3:
+            # Closing a link changes the layout of the counts.
+            e.remove_link("A", "B", twoway=False)
+        e.evolve()
+        counts.append(
+            [int(loc.numAgents) for loc in e.locations]
+            + [int(l.numAgents) for loc in e.locations for l in loc.links]
+        )
+
+    pflee.SimulationSettings.optimisations["NumAgentsSync"] = "blocking"
+    return counts
+
+
+def test_num_agents_sync():
+    expected = run_network("blocking")
+    assert run_network("delta") == expected
+    assert run_network("non-blocking") == expected
+
+
+if __name__ == "__main__":
+    test_num_agents_sync()
@@ -30,5 +30,30 @@ def test_removelink():
     print("Test successful!")
 
 
+def test_link_lookup():
+    flee.SimulationSettings.ReadFromYML("empty.yml")
+
+    e = flee.Ecosystem()
+
+    l1 = e.addLocation(name="A", movechance=0.3)
+    _ = e.addLocation(name="B", movechance=0.0)
+    l3 = e.addLocation(name="C", movechance=0.0)
+
+    e.linkUp(endpoint1="A", endpoint2="B", distance=834.0)
+    e.linkUp(endpoint1="A", endpoint2="C", distance=1368.0)
+
+    assert e.locationIndex["C"] == 2
+    assert l1.links_by_endpoint["C"] is l1.links[1]
+    assert l3.links_by_endpoint["A"] is l3.links[0]
+
+    assert e.close_link(startpoint="A", endpoint="C", twoway=False)
+    assert "C" not in l1.links_by_endpoint
+    assert "B" in l1.links_by_endpoint
+
+    assert e.reopen_link(startpoint="A", endpoint="C", twoway=False)
+    assert l1.links_by_endpoint["C"] is l1.links[-1]
+
+
 if __name__ == "__main__":
     test_removelink()
+    test_link_lookup()
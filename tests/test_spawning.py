@@ -1,3 +1,5 @@
+import numpy as np
+import pytest
 from flee import flee, spawning
 from flee.datamanager import handle_refugee_data
 
@@ -23,3 +25,131 @@ def test_get_attribute_ratio():
 
     assert spawning.getAttributeRatio(l1, "british") == 0.02
 
+
+
+def test_demographic_tables(tmp_path, monkeypatch):
+    flee.SimulationSettings.ReadFromYML("empty.yml")
+    flee.SimulationSettings.optimisations["DemographicTables"] = True
+
+    e = flee.Ecosystem()
+
+    l1 = e.addLocation(name="A", movechance=1.0)
+    l2 = e.addLocation(name="B", movechance=1.0)
+
+    monkeypatch.chdir(tmp_path)
+    (tmp_path / "input_csv").mkdir()
+    with open("input_csv/demographics_testgroup.csv", "w") as f:
+        f.write("testgroup,Default,A\n1,0.5,0.0\n2,0.5,0.25\n3,0.0,0.75\n")
+
+    try:
+        spawning.read_demographic_csv(e, "input_csv/demographics_testgroup.csv")
+
+        samples_a = [s["testgroup"] for s in spawning.draw_samples_batch(e, l1, 4000)]
+        samples_b = [s["testgroup"] for s in spawning.draw_samples_for_locations(e, [l2] * 4000)]
+
+        assert set(samples_a) == {2, 3}
+        assert 2500 < samples_a.count(3) < 3500
+        assert set(samples_b) == {1, 2}
+        assert spawning.draw_sample(e, l1, "testgroup") in [2, 3]
+    finally:
+        del spawning.__demographics["testgroup"]
+        flee.SimulationSettings.optimisations["DemographicTables"] = False
+
+
+def test_attribute_codes(tmp_path, monkeypatch):
+    flee.SimulationSettings.ReadFromYML("empty.yml")
+    flee.SimulationSettings.optimisations["DemographicTables"] = True
+    flee.SimulationSettings.log_levels["link"] = 2
+
+    e = flee.Ecosystem()
+
+    l1 = e.addLocation(name="A", movechance=1.0)
+    l2 = e.addLocation(name="B", movechance=1.0)
+    e.linkUp(endpoint1="A", endpoint2="B", distance=100.0)
+
+    monkeypatch.chdir(tmp_path)
+    (tmp_path / "input_csv").mkdir()
+    with open("input_csv/demographics_testgroup.csv", "w") as f:
+        f.write("testgroup,Default,A\n1,0.5,0.0\n2,0.5,0.25\n3,0.0,0.75\n")
+
+    try:
+        spawning.read_demographic_csv(e, "input_csv/demographics_testgroup.csv")
+
+        flee.SimulationSettings.optimisations["AttributeCodes"] = True
+        samples = spawning.draw_samples_batch(e, l1, 100) + [{"testgroup": 2, "age": 20}]
+        e.addAgents(location=l1, count=len(samples), attributes_batch=samples)
+
+        # Agents with the same attribute values share one read-only record.
+        assert len(set([id(a.attributes) for a in e.agents])) == 3
+        assert e.agents[-1].attributes == {"testgroup": 2, "age": 20}
+        with pytest.raises(TypeError):
+            e.agents[-1].attributes["age"] = 21
+
+        # Links count agents per record, and add the counts up per attribute value.
+        for a in e.agents:
+            l1.links[0].IncrementNumAgents(a)
+        counts = l1.links[0].getCumNumAgentsByAttribute()
+        assert list(counts.keys()) == ["testgroup", "age"]
+        assert counts["age"] == {20: 1}
+        assert sum(counts["testgroup"].values()) == 101
+    finally:
+        del spawning.__demographics["testgroup"]
+        flee.SimulationSettings.optimisations["DemographicTables"] = False
+        flee.SimulationSettings.optimisations["AttributeCodes"] = False
+        flee.SimulationSettings.log_levels["link"] = 0
+
+
+def test_add_agents():
+    flee.SimulationSettings.ReadFromYML("empty.yml")
+    flee.SimulationSettings.spawn_rules["TakeFromPopulation"] = True
+
+    for agent_store in [False, True]:
+        flee.SimulationSettings.optimisations["AgentStore"] = agent_store
+        e = flee.Ecosystem()
+
+        l1 = e.addLocation(name="A", movechance=1.0, pop=1000)
+        l2 = e.addLocation(name="B", movechance=1.0)
+
+        e.addAgents(location=l1, count=300, attributes_batch=[{"gender": "female"}] * 300)
+        e.insertAgents(location=l2, number=200)
+
+        assert len(e.agents) == 500
+        assert l1.numAgents == 300
+        assert l1.pop == 700
+        assert l1.numAgentsSpawned == 300
+        assert l2.numAgents == 200
+        assert e.agents[0].attributes["gender"] == "female"
+        assert e.agents[-1].location is l2
+        assert e.agents[-1].home_location is l2
+
+    flee.SimulationSettings.optimisations["AgentStore"] = False
+    flee.SimulationSettings.spawn_rules["TakeFromPopulation"] = False
+
+
+def test_vectorized_spawn_weights():
+    flee.SimulationSettings.ReadFromYML("empty.yml")
+    flee.SimulationSettings.spawn_rules["conflict_spawn_decay"] = [1.0, 0.5, 0.25]
+    flee.SimulationSettings.spawn_rules["conflict_spawn_decay_interval"] = 2
+
+    picks = []
+    for vectorized in [False, True]:
+        flee.SimulationSettings.optimisations["VectorizedSpawnWeights"] = vectorized
+        e = flee.Ecosystem()
+        for i in range(0, 10):
+            e.addLocation(name="L%d" % i, location_type="conflict_zone" if i % 3 == 0 else "town", pop=100 * (i + 1))
+        # Weights are refreshed when first needed after adding locations.
+        assert e.spawn_weights_outdated == vectorized
+
+        np.random.seed(5)
+        for t in range(0, 8):
+            e.time = t
+            if t == 3:
+                e.add_conflict_zone("L4", conflict_intensity=0.5)
+            picks.append([loc.name for loc in e.pick_spawn_locations(20)])
+            spawning.refresh_spawn_weights(e)
+            picks.append(list(e.spawn_weights))
+
+    assert picks[: len(picks) // 2] == picks[len(picks) // 2 :]
+    assert e.spawn_cdf[-1] == 1.0
+
+    flee.SimulationSettings.optimisations["VectorizedSpawnWeights"] = False
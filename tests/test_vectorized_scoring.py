@@ -0,0 +1,57 @@
+from flee import flee, scoring
+
+"""
+Location scores computed for all locations at once.
+"""
+
+
+def test_vectorized_scoring():
+    flee.SimulationSettings.ReadFromYML("empty.yml")
+    flee.SimulationSettings.move_rules["ForeignWeight"] = 2.0
+    flee.SimulationSettings.move_rules["CampWeight"] = 3.0
+    flee.SimulationSettings.spawn_rules["conflict_spawn_decay"] = [1.0, 0.5, 0.25]
+    flee.SimulationSettings.spawn_rules["conflict_spawn_decay_interval"] = 2
+    flee.SimulationSettings.move_rules["FloodRulesEnabled"] = True
+    flee.SimulationSettings.move_rules["FloodLocWeights"] = [1.0, 0.5, 0.2, 0.1]
+    flee.SimulationSettings.move_rules["FloodForecaster"] = True
+    flee.SimulationSettings.move_rules["FloodForecasterTimescale"] = 3
+    flee.SimulationSettings.move_rules["FloodForecasterEndTime"] = 6
+    flee.SimulationSettings.move_rules["FloodForecasterWeights"] = [1.0, 0.9, 0.8, 0.7, 0.6, 0.5, 0.4, 0.3]
+
+    e = flee.Ecosystem()
+
+    # More locations than the initial size of the score array, so that it grows.
+    for i in range(0, 20):
+        e.addLocation(name="L%d" % i, movechance=0.3, foreign=(i % 4 == 1))
+    e.addLocation(name="Camp", movechance=0.001)
+    e.addLocation(name="Flood", location_type="flood_zone", movechance=0.3, attributes={"flood_level": 2})
+    e.addLocation(
+        name="Forecast", location_type="flood_zone", movechance=0.3, attributes={"flood_level": 1, "forecast_flood_level": 3}
+    )
+
+    e.time = 1
+    e.add_conflict_zone("L2", conflict_intensity=0.5)
+    e.add_conflict_zone("L3")
+
+    for t in range(1, 8):
+        e.time = t
+        flee.SimulationSettings.optimisations["VectorizedScoring"] = False
+        for loc in e.locations:
+            scoring.updateLocationScore(t, loc)
+        expected = [list(loc.scores) for loc in e.locations]
+
+        e.location_scores[:, :2] = 0.0
+        flee.SimulationSettings.optimisations["VectorizedScoring"] = True
+        e.update_location_scores()
+        assert [list(loc.scores) for loc in e.locations] == expected
+
+    # Location scores are views of the rows of the score array.
+    assert e.locations[0].scores.base is e.location_scores
+    e.locations[3].setScore(1, 7.0)
+    assert e.location_scores[3, 1] == 7.0
+
+    flee.SimulationSettings.optimisations["VectorizedScoring"] = False
+
+
+if __name__ == "__main__":
+    test_vectorized_scoring()
@@ -0,0 +1,39 @@
+import os
+import subprocess
+
+import pytest
+
+root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+@pytest.fixture
+def mpirun():
+    """
+    Runs a test script on several ranks, and returns its output.
+    The script is expected to raise an error on any rank when a check fails.
+    """
+    def _mpirun(script, cores):
+        env = dict(os.environ)
+        env["PYTHONPATH"] = root + os.pathsep + env.get("PYTHONPATH", "")
+        # Allow more ranks than cores, and running as root in containers (Open MPI only).
+        env.setdefault("OMPI_MCA_rmaps_base_oversubscribe", "1")
+        env.setdefault("OMPI_ALLOW_RUN_AS_ROOT", "1")
+        env.setdefault("OMPI_ALLOW_RUN_AS_ROOT_CONFIRM", "1")
+
+        cmd = ["mpirun", "-n", str(cores), "python3", script]
+        proc = subprocess.run(
+            cmd,
+            cwd=os.path.dirname(os.path.abspath(__file__)),
+            env=env,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.STDOUT,
+        )
+        stdout = proc.stdout.decode("utf-8")
+        if proc.returncode != 0:
+            raise RuntimeError(
+                "\njob execution encountered an error (return code {}) "
+                "while executing \ncmd = {}\nstdout = {}".format(proc.returncode, " ".join(cmd), stdout)
+            )
+        return stdout
+
+    return _mpirun
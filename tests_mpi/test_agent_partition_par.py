@@ -0,0 +1,74 @@
+import random
+
+import numpy as np
+
+"""
+Partitioning agents by the rank that owns their location gives the same global agent counts
+as the round-robin partitioning, also when agents migrate between ranks.
+"""
+
+
+def run_simulation(agent_partition):
+    from flee import pflee
+
+    pflee.SimulationSettings.ReadFromYML("empty.yml")
+    pflee.SimulationSettings.move_rules["MaxMoveSpeed"] = 150.0
+    pflee.SimulationSettings.move_rules["MaxWalkSpeed"] = 150.0
+    pflee.SimulationSettings.optimisations["AgentPartition"] = agent_partition
+
+    random.seed(1)
+    np.random.seed(1)
+
+    e = pflee.Ecosystem()
+
+    names = ["A", "B", "C", "D", "E", "F"]
+    locations = [e.addLocation(name=name, movechance=1.0) for name in names[:-1]]
+    locations.append(e.addLocation(name="F", movechance=0.0))
+
+    # A one-way chain, so that the route of every agent is fixed and the counts do not depend on random draws.
+    distances = [100.0, 120.0, 80.0, 200.0, 100.0]
+    for k in range(0, len(names) - 1):
+        e.linkUp(endpoint1=names[k], endpoint2=names[k + 1], distance=distances[k])
+        e.close_link(startpoint=names[k + 1], endpoint=names[k], twoway=False)
+
+    e.addAgents(location=locations[0], count=40)
+    e.addAgents(location=locations[2], count=20)
+    e.insertAgents(location=locations[3], number=10)
+
+    counts = []
+    for t in range(0, 4):
+        e.evolve()
+        counts.append(
+            [loc.numAgents for loc in e.locations] + [l.numAgents for loc in e.locations for l in loc.links] + [e.numAgents()]
+        )
+
+    owned = e.mpi.comm.allreduce(len([a for a in e.agents if a.location is not None]))
+    assert owned == 70, "Agents were lost or duplicated: {}".format(owned)
+
+    pflee.SimulationSettings.optimisations["AgentPartition"] = "round-robin"
+    return counts
+
+
+def run_ranks():
+    from mpi4py import MPI
+
+    round_robin = run_simulation("round-robin")
+    location = run_simulation("location")
+    assert location == round_robin, "Counts differ between partitions:\n{}\n{}".format(round_robin, location)
+    # All agents end up in the camp at the end of the chain.
+    assert round_robin[-1][5] == 70
+
+    if MPI.COMM_WORLD.Get_rank() == 0:
+        print("OK")
+
+
+def test_agent_partition_2(mpirun):
+    assert "OK" in mpirun(__file__, 2)
+
+
+def test_agent_partition_3(mpirun):
+    assert "OK" in mpirun(__file__, 3)
+
+
+if __name__ == "__main__":
+    run_ranks()
@@ -0,0 +1,48 @@
+import random
+
+import numpy as np
+
+"""
+The global random state stays the same on all ranks when agents are kept in an AgentStore,
+also on ranks that have no agents.
+"""
+
+
+def run_ranks():
+    from flee import pflee
+
+    pflee.SimulationSettings.ReadFromYML("empty.yml")
+    pflee.SimulationSettings.optimisations["AgentStore"] = True
+
+    random.seed(1)
+    np.random.seed(1)
+
+    e = pflee.Ecosystem()
+
+    l1 = e.addLocation(name="A", movechance=1.0)
+    _ = e.addLocation(name="B", movechance=1.0)
+    _ = e.addLocation(name="C", movechance=1.0)
+    _ = e.addLocation(name="D", location_type="camp", attributes={"deactivation_probability": 0.5})
+
+    e.linkUp(endpoint1="A", endpoint2="B", distance=100.0)
+    e.linkUp(endpoint1="B", endpoint2="C", distance=100.0)
+    e.linkUp(endpoint1="C", endpoint2="D", distance=100.0)
+
+    # A single agent, which lives on one rank only.
+    e.addAgents(location=l1, count=1)
+
+    for t in range(0, 5):
+        e.evolve()
+        values = e.mpi.comm.allgather(np.random.random())
+        assert len(set(values)) == 1, "Global random state differs between ranks at t={}: {}".format(t, values)
+
+    if e.mpi.rank == 0:
+        print("OK")
+
+
+def test_agent_store_rng(mpirun):
+    assert "OK" in mpirun(__file__, 2)
+
+
+if __name__ == "__main__":
+    run_ranks()
@@ -0,0 +1,81 @@
+import random
+
+import numpy as np
+
+"""
+Agent counts synchronized with blocking, delta and non-blocking reductions are the same on every rank,
+also after closing a link changes the layout of the counts.
+"""
+
+
+def run_network(sync, agent_partition):
+    from flee import pflee
+
+    pflee.SimulationSettings.ReadFromYML("empty.yml")
+    pflee.SimulationSettings.move_rules["MaxMoveSpeed"] = 150.0
+    pflee.SimulationSettings.move_rules["MaxWalkSpeed"] = 150.0
+    pflee.SimulationSettings.optimisations["NumAgentsSync"] = sync
+    pflee.SimulationSettings.optimisations["AgentPartition"] = agent_partition
+
+    random.seed(1)
+    np.random.seed(1)
+
+    e = pflee.Ecosystem()
+
+    l1 = e.addLocation(name="A", movechance=1.0)
+    l2 = e.addLocation(name="B", movechance=0.5)
+    _ = e.addLocation(name="C", movechance=0.5)
+    _ = e.addLocation(name="D", movechance=0.0)
+    _ = e.addLocation(name="E", movechance=0.0)
+
+    e.linkUp(endpoint1="A", endpoint2="B", distance=100.0)
+    e.linkUp(endpoint1="A", endpoint2="C", distance=250.0)
+    e.linkUp(endpoint1="B", endpoint2="D", distance=200.0)
+    e.linkUp(endpoint1="C", endpoint2="E", distance=150.0)
+    e.linkUp(endpoint1="B", endpoint2="C", distance=300.0)
+
+    e.addAgents(location=l1, count=100)
+    e.addAgents(location=l2, count=30)
+
+    counts = []
+    for t in range(0, 6):
+        if t == 3:
+            # Closing a link changes the layout of the counts.
+            e.close_link("A", "B", twoway=False)
+        e.evolve()
+        counts.append(
+            [int(loc.numAgents) for loc in e.locations]
+            + [int(l.numAgents) for loc in e.locations for l in loc.links]
+        )
+
+    gathered = e.mpi.comm.allgather(counts)
+    assert all([c == counts for c in gathered]), "Counts differ between ranks with {} sync".format(sync)
+
+    pflee.SimulationSettings.optimisations["NumAgentsSync"] = "blocking"
+    pflee.SimulationSettings.optimisations["AgentPartition"] = "round-robin"
+    return counts
+
+
+def run_ranks():
+    from mpi4py import MPI
+
+    for agent_partition in ["round-robin", "location"]:
+        expected = run_network("blocking", agent_partition)
+        for sync in ["delta", "non-blocking"]:
+            counts = run_network(sync, agent_partition)
+            assert counts == expected, "{} sync with {} partition:\n{}\n{}".format(sync, agent_partition, expected, counts)
+
+    if MPI.COMM_WORLD.Get_rank() == 0:
+        print("OK")
+
+
+def test_num_agents_sync_2(mpirun):
+    assert "OK" in mpirun(__file__, 2)
+
+
+def test_num_agents_sync_3(mpirun):
+    assert "OK" in mpirun(__file__, 3)
+
+
+if __name__ == "__main__":
+    run_ranks()
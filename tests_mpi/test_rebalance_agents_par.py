@@ -0,0 +1,86 @@
+import random
+
+import numpy as np
+
+"""
+Rebalancing evens out the number of active agents per rank, without changing
+the number of agents in any location or on any link.
+"""
+
+
+def get_counts(e):
+    e.updateNumAgents(log=False)
+    return [loc.numAgents for loc in e.locations] + [l.numAgents for loc in e.locations for l in loc.links]
+
+
+def run_simulation(agent_store):
+    from flee import pflee
+
+    pflee.SimulationSettings.ReadFromYML("empty.yml")
+    pflee.SimulationSettings.move_rules["MaxMoveSpeed"] = 150.0
+    pflee.SimulationSettings.move_rules["MaxWalkSpeed"] = 150.0
+    pflee.SimulationSettings.optimisations["AgentStore"] = agent_store
+
+    random.seed(1)
+    np.random.seed(1)
+
+    e = pflee.Ecosystem()
+
+    l1 = e.addLocation(name="A", movechance=1.0)
+    _ = e.addLocation(name="B", movechance=0.0)
+    l3 = e.addLocation(name="C", movechance=0.0)
+
+    e.linkUp(endpoint1="A", endpoint2="B", distance=500.0)
+    e.linkUp(endpoint1="B", endpoint2="C", distance=100.0)
+
+    e.addAgents(location=l1, count=60)
+    e.addAgents(location=l3, count=90, attributes_batch=[{"age": 20}] * 90)
+
+    # The agents from A are now travelling along the link to B.
+    e.evolve()
+
+    # Make rank 0 hold far fewer agents than the others.
+    if e.mpi.rank == 0:
+        for a in e.agents:
+            if a.location is l3:
+                a.location.numAgentsOnRank -= 1
+                a.location = None
+
+    counts_before = get_counts(e)
+    total = e.mpi.comm.allreduce(len([a for a in e.agents if a.location is not None]))
+
+    e.rebalance_agents()
+
+    active = e.mpi.comm.allgather(len([a for a in e.agents if a.location is not None]))
+    threshold = pflee.SimulationSettings.optimisations["RebalanceThreshold"]
+    assert sum(active) == total, "Agents were lost or duplicated: {} != {}".format(active, total)
+    assert max(active) <= threshold * total / e.mpi.size, "Ranks are still imbalanced: {}".format(active)
+    assert get_counts(e) == counts_before, "Counts changed: {} != {}".format(get_counts(e), counts_before)
+
+    # Received agents keep their state.
+    assert all([a.attributes.get("age") == 20 for a in e.agents if a.location is l3])
+    assert all([a.travelling for a in e.agents if a.location is not None and a.location.name != "C"])
+
+    pflee.SimulationSettings.optimisations["AgentStore"] = False
+
+
+def run_ranks():
+    from mpi4py import MPI
+
+    run_simulation(agent_store=False)
+    run_simulation(agent_store=True)
+
+    if MPI.COMM_WORLD.Get_rank() == 0:
+        print("OK")
+
+
+def test_rebalance_agents_2(mpirun):
+    assert "OK" in mpirun(__file__, 2)
+
+
+def test_rebalance_agents_3(mpirun):
+    assert "OK" in mpirun(__file__, 3)
+
+
+if __name__ == "__main__":
+    run_ranks()